@@ -3,7 +3,7 @@ Routes for box operations using MongoDB.
 """
 
 import json
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from beanie import PydanticObjectId
 from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form, Query
@@ -206,6 +206,77 @@ async def get_pages(query: str = Query("", description="Filtro de búsqueda")):
         ) from e
 
 
+@router.get("/search", response_model=Dict[str, Any])
+async def search_boxes(
+    query: str = Query("", description="Filtro de búsqueda"),
+    page: int = Query(1, description="Número de página"),
+):
+    """
+    Retrieve a page of filtered boxes with its total and facet counts in one query.
+
+    Args:
+        query (str): The search filter.
+        page (int): The page number for pagination.
+
+    Returns:
+        Dict[str, Any]: The boxes of the page as items, the total count, the
+        number of pages and the counts of each facet field.
+
+    Raises:
+        HTTPException: If the page number is invalid or an error occurs.
+    """
+    if page < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El número de página debe ser mayor a 0",
+        )
+
+    try:
+        return await BoxService.search_boxes(query, page, ITEMS_PER_PAGE)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al buscar las cajas: {str(e)}",
+        ) from e
+
+
+@router.get("/getFilteredBoxesByCursor", response_model=Dict[str, Any])
+async def get_filtered_boxes_by_cursor(
+    query: str = Query("", description="Filtro de búsqueda"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página"),
+):
+    """
+    Retrieve a page of filtered boxes after or before a cursor.
+
+    Pages are read from the position of the cursor instead of skipping the
+    previous pages, so deep pages cost the same as the first one.
+
+    Args:
+        query (str): The search filter.
+        cursor (Optional[str]): The next or previous cursor of a page, None for
+            the first page.
+
+    Returns:
+        Dict[str, Any]: The boxes of the page as items, and the next and previous
+        cursors, None at the ends of the results.
+
+    Raises:
+        HTTPException: If the cursor is invalid or an error occurs.
+    """
+    try:
+        return await BoxService.get_boxes_by_cursor(query, ITEMS_PER_PAGE, cursor)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        ) from e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al cargar las cajas filtradas: {str(e)}",
+        ) from e
+
+
 @router.get("/getSymbols", response_model=List[str])
 async def get_symbols():
     """
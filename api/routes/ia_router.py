@@ -0,0 +1,81 @@
+"""
+Routes for monitoring the AI planning calls.
+"""
+
+from typing import Any, Dict
+
+from fastapi import APIRouter, HTTPException, status
+
+from services.model_backend import model_backend
+from services.output_repair import repair_metrics
+from services.response_cache import response_cache
+
+router = APIRouter()
+
+
+@router.get("/getCacheStats", response_model=Dict[str, Any])
+async def get_cache_stats():
+    """
+    Retrieve the hit and miss counters of the AI response cache.
+
+    Returns:
+        Dict[str, Any]: The hits of each tier, the misses, the hit rate and the
+        number of responses kept in memory.
+
+    Raises:
+        HTTPException: If an error occurs while reading the counters.
+    """
+    try:
+        return response_cache.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve cache stats: {str(e)}",
+        ) from e
+
+
+@router.get("/getRepairStats", response_model=Dict[str, Any])
+async def get_repair_stats():
+    """
+    Retrieve the validation and repair counters of the AI responses.
+
+    Returns:
+        Dict[str, Any]: The responses that were valid, repaired or failed, the
+        repair prompts and new calls made, the repair rate and the share of
+        prompt tokens spent on repairs.
+
+    Raises:
+        HTTPException: If an error occurs while reading the counters.
+    """
+    try:
+        return repair_metrics.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve repair stats: {str(e)}",
+        ) from e
+
+
+@router.get("/getTokenStats", response_model=Dict[str, Any])
+async def get_token_stats():
+    """
+    Retrieve the input tokens sent to the AI model and read from its prompt cache.
+
+    Returns:
+        Dict[str, Any]: The requests, the input, cache read, cache write and output
+        tokens, the input tokens sent in total and the share of them cached, and
+        the size of the planning prompts with and without the compact encoding.
+
+    Raises:
+        HTTPException: If an error occurs while reading the counters.
+    """
+    try:
+        return {
+            **model_backend.usage_stats(),
+            "prompt_sizes": repair_metrics.prompt_stats(),
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve token stats: {str(e)}",
+        ) from e
@@ -0,0 +1,81 @@
+"""
+Routes for querying the status of queued production plan updates.
+"""
+
+from typing import Dict, List
+
+from beanie import PydanticObjectId
+from fastapi import APIRouter, HTTPException, status
+
+from models.planning_job import PlanningJob
+from services.planning_job_service import PlanningJobService
+
+router = APIRouter()
+
+
+@router.get("/getById/{job_id}", response_model=PlanningJob)
+async def get_job_by_id(job_id: PydanticObjectId):
+    """
+    Retrieve a planning job by its ID.
+
+    Args:
+        job_id (PydanticObjectId): The ID of the job.
+
+    Returns:
+        PlanningJob: The planning job with its status, attempts and result.
+
+    Raises:
+        HTTPException: If the job is not found or an error occurs.
+    """
+    try:
+        return await PlanningJobService.get_job_by_id(job_id)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve planning job: {str(e)}",
+        ) from e
+
+
+@router.get("/getByArapackLot/{arapack_lot}", response_model=List[PlanningJob])
+async def get_jobs_by_arapack_lot(arapack_lot: str):
+    """
+    Retrieve the planning jobs of a purchase, newest first.
+
+    Args:
+        arapack_lot (str): The arapack lot of the purchase.
+
+    Returns:
+        List[PlanningJob]: The planning jobs of the purchase.
+
+    Raises:
+        HTTPException: If an error occurs while retrieving the jobs.
+    """
+    try:
+        return await PlanningJobService.get_jobs_by_arapack_lot(arapack_lot)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve planning jobs: {str(e)}",
+        ) from e
+
+
+@router.get("/getQueueStats", response_model=Dict[str, int])
+async def get_queue_stats():
+    """
+    Retrieve the number of planning jobs of each status and the queue depth.
+
+    Returns:
+        Dict[str, int]: The jobs by status and the pending and running jobs.
+
+    Raises:
+        HTTPException: If an error occurs while counting the jobs.
+    """
+    try:
+        return await PlanningJobService.get_queue_stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve queue stats: {str(e)}",
+        ) from e
@@ -1,19 +1,33 @@
-from fastapi import APIRouter, HTTPException, status
+from datetime import date
+from typing import List, Optional
 
+from fastapi import APIRouter, HTTPException, Path, Query, status
+
+from models.planning_job import PlanningJob
 from models.program_planning import ProgramPlanning
 from services.program_planning_service import ProgramPlanningService
+from utils.iso_week import iso_week, week_fields, weeks_in_year
 
 router = APIRouter()
 
+# Maximum number of weeks read at once
+MAX_RANGE_WEEKS = 26
+
 
 @router.get("/getByWeek/{week}", response_model=ProgramPlanning)
-async def get_production_runs_by_week(week: int):
+async def get_production_runs_by_week(
+    week: int = Path(..., ge=1, le=53),
+    year: Optional[int] = Query(
+        None, description="Año ISO, el más cercano si se omite"
+    ),
+):
     try:
-        production_runs = await ProgramPlanningService.get_by_week(week)
+        requested = (year, week) if year else week
+        production_runs = await ProgramPlanningService.get_by_week(requested)
         if not production_runs:
             return ProgramPlanning(
                 production_runs=[],
-                week_of_year=week,
+                **week_fields(requested),
             )
         return production_runs
     except Exception as e:
@@ -21,3 +35,59 @@ async def get_production_runs_by_week(week: int):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al carga programa: {str(e)}",
         ) from e
+
+
+@router.get("/getRange", response_model=List[ProgramPlanning])
+async def get_production_runs_by_range(
+    year: Optional[int] = Query(None, description="Año ISO de la primera semana"),
+    week: Optional[int] = Query(None, ge=1, le=53, description="Primera semana ISO"),
+    weeks: int = Query(4, ge=1, le=MAX_RANGE_WEEKS, description="Número de semanas"),
+):
+    start = iso_week(date.today())
+    start = (year or start[0], week or start[1])
+    if start[1] > weeks_in_year(start[0]):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El año {start[0]} no tiene semana {start[1]}",
+        )
+    try:
+        return await ProgramPlanningService.get_range(start, weeks)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al cargar programas: {str(e)}",
+        ) from e
+
+
+@router.post("/retime/{week}", response_model=Optional[PlanningJob])
+async def retime_production_runs(
+    week: int = Path(..., ge=1, le=53),
+    year: Optional[int] = Query(
+        None, description="Año ISO, el más cercano si se omite"
+    ),
+):
+    try:
+        return await ProgramPlanningService.retime_week((year, week) if year else week)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al encolar el recálculo de horarios: {str(e)}",
+        ) from e
+
+
+@router.post("/sequence/{week}", response_model=Optional[PlanningJob])
+async def sequence_production_runs(
+    week: int = Path(..., ge=1, le=53),
+    year: Optional[int] = Query(
+        None, description="Año ISO, el más cercano si se omite"
+    ),
+):
+    try:
+        return await ProgramPlanningService.sequence_week(
+            (year, week) if year else week
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al encolar el orden de corridas: {str(e)}",
+        ) from e
@@ -1,11 +1,18 @@
 """Define the purchase_router module"""
 
-from typing import List
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
-from fastapi import HTTPException, APIRouter, status, Query, BackgroundTasks
+from fastapi import HTTPException, APIRouter, status, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+from config.planning import (
+    PLANNING_EXACT_BUDGET_SECONDS,
+    PLANNING_HORIZON_WEEKS,
+    PLANNING_LOCK_SECONDS,
+)
+from models.planning_job import PlanningJob
 from models.purchase import Purchase, DeliveryDate
 from services.purchase_service import PurchaseService
 
@@ -148,18 +155,88 @@ async def get_pages(query: str = Query("", description="Filtro de búsqueda")):
         ) from e
 
 
+@router.get("/search", response_model=Dict[str, Any])
+async def search_purchases(
+    query: str = Query("", description="Filtro de búsqueda"),
+    page: int = Query(1, description="Número de página"),
+):
+    """
+    Retrieve a page of filtered purchases with its total and facet counts in one query.
+
+    Args:
+        query (str): The search filter.
+        page (int): The page number for pagination.
+
+    Returns:
+        Dict[str, Any]: The purchases of the page as items, the total count, the
+        number of pages and the counts of each facet field.
+
+    Raises:
+        HTTPException: If the page number is invalid or an error occurs.
+    """
+    if page < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El número de página debe ser mayor a 0",
+        )
+
+    try:
+        return await PurchaseService.search_purchases(query, page, ITEMS_PER_PAGE)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al buscar las ordenes: {str(e)}",
+        ) from e
+
+
+@router.get("/getFilteredPurchasesByCursor", response_model=Dict[str, Any])
+async def get_filtered_purchases_by_cursor(
+    query: str = Query("", description="Filtro de búsqueda"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página"),
+):
+    """
+    Retrieve a page of filtered purchases after or before a cursor.
+
+    Pages are read from the position of the cursor instead of skipping the
+    previous pages, so deep pages cost the same as the first one.
+
+    Args:
+        query (str): The search filter.
+        cursor (Optional[str]): The next or previous cursor of a page, None for
+            the first page.
+
+    Returns:
+        Dict[str, Any]: The purchases of the page as items, and the next and previous
+        cursors, None at the ends of the results.
+
+    Raises:
+        HTTPException: If the cursor is invalid or an error occurs.
+    """
+    try:
+        return await PurchaseService.get_purchases_by_cursor(
+            query, ITEMS_PER_PAGE, cursor
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        ) from e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al cargar las ordenes filtradas: {str(e)}",
+        ) from e
+
+
 @router.post(
     "/create_with_ai", response_model=Purchase, status_code=status.HTTP_201_CREATED
 )
-async def create_purchase_with_ai(
-    purchase: Purchase, background_tasks: BackgroundTasks
-):
+async def create_purchase_with_ai(purchase: Purchase):
     """
-    Create a new purchase and trigger AI processing in the background.
+    Create a new purchase and queue the update of the production plan.
 
     Args:
         purchase (Purchase): The purchase data to be created.
-        background_tasks (BackgroundTasks): FastAPI background tasks for asynchronous processing.
 
     Returns:
         Purchase: The created purchase.
@@ -168,7 +245,7 @@ async def create_purchase_with_ai(
         HTTPException: If an error occurs while creating the purchase.
     """
     try:
-        return await PurchaseService.create_purchase_with_ai(purchase, background_tasks)
+        return await PurchaseService.create_purchase_with_ai(purchase)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -177,16 +254,13 @@ async def create_purchase_with_ai(
 
 
 @router.patch("/update_delivery_date/{arapack_lot}", response_model=Purchase)
-async def update_delivery_date(
-    arapack_lot: str, update_data: UpdateDeliveryInfo, background_tasks: BackgroundTasks
-):
+async def update_delivery_date(arapack_lot: str, update_data: UpdateDeliveryInfo):
     """
-    Update the delivery date of a purchase and trigger AI processing in the background.
+    Update the delivery date of a purchase and queue the update of the production plan.
 
     Args:
         arapack_lot (str): The arapack lot of the purchase to update.
         update_data (UpdateDeliveryInfo): The new delivery date and quantity data.
-        background_tasks (BackgroundTasks): FastAPI background tasks for asynchronous processing.
 
     Returns:
         Purchase: The updated purchase.
@@ -199,7 +273,6 @@ async def update_delivery_date(
             arapack_lot,
             update_data.new_delivery_date,
             update_data.new_quantity,
-            background_tasks,
         )
     except Exception as e:
         raise HTTPException(
@@ -304,18 +377,74 @@ async def get_monthly_invoice():
 
 
 @router.get("/getBackorders", response_model=List[Backorder])
-async def get_backorders():
+async def get_backorders(
+    order: str = Query(
+        "desc", pattern="^(asc|desc)$", description="Orden por días de retraso"
+    ),
+):
     """
-    Retrieve backorders.
+    Retrieve the backorders, streamed as a JSON array as they are read.
+
+    Args:
+        order (str): "desc" for the most delayed first, "asc" for the least delayed.
 
     Returns:
-        List[Purchase]: A list of backorders.
+        List[Backorder]: A list of backorders.
 
     Raises:
         HTTPException: If an error occurs while retrieving the backorders.
     """
+    backorders = PurchaseService.stream_backorders(order)
+    try:
+        # Read the first backorder before streaming, so errors are still reported
+        first = await anext(backorders, None)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve backorders: {str(e)}",
+        ) from e
+
+    async def encode():
+        if first is None:
+            yield "[]"
+            return
+        yield "[" + Backorder(**first).model_dump_json()
+        async for backorder in backorders:
+            yield "," + Backorder(**backorder).model_dump_json()
+        yield "]"
+
+    return StreamingResponse(encode(), media_type="application/json")
+
+
+@router.get("/getBackordersByCursor", response_model=Dict[str, Any])
+async def get_backorders_by_cursor(
+    cursor: Optional[str] = Query(None, description="Cursor de la página"),
+    order: str = Query(
+        "desc", pattern="^(asc|desc)$", description="Orden por días de retraso"
+    ),
+):
+    """
+    Retrieve a page of backorders after or before a cursor.
+
+    Args:
+        cursor (Optional[str]): The next or previous cursor of a page, None for
+            the first page.
+        order (str): "desc" for the most delayed first, "asc" for the least delayed.
+
+    Returns:
+        Dict[str, Any]: The backorders of the page as items, and the next and
+        previous cursors, None at the ends of the results.
+
+    Raises:
+        HTTPException: If the cursor is invalid or an error occurs.
+    """
     try:
-        return await PurchaseService.get_backorders()
+        return await PurchaseService.get_backorders_page(ITEMS_PER_PAGE, cursor, order)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        ) from e
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -343,17 +472,190 @@ async def get_monthly_kilograms():
         ) from e
 
 
-@router.patch("/changeStatus/{arapack_lot}", response_model=Purchase)
-async def change_status(
-    arapack_lot: str, new_status: str, background_tasks: BackgroundTasks
+@router.get("/getBackorderSummary", response_model=Dict[str, Any])
+async def get_backorder_summary():
+    """
+    Retrieve the number and missing quantity of the backorders.
+
+    Returns:
+        Dict[str, Any]: The count and missing quantity of the open purchases due
+        before today.
+
+    Raises:
+        HTTPException: If an error occurs while retrieving the summary.
+    """
+    try:
+        return await PurchaseService.get_backorder_summary()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve backorder summary: {str(e)}",
+        ) from e
+
+
+@router.post("/rebuildKpiRollups", response_model=int)
+async def rebuild_kpi_rollups():
+    """
+    Rebuild the KPI rollups from every purchase.
+
+    Returns:
+        int: The number of buckets written.
+
+    Raises:
+        HTTPException: If an error occurs while rebuilding the rollups.
+    """
+    try:
+        return await PurchaseService.rebuild_kpi_rollups()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to rebuild KPI rollups: {str(e)}",
+        ) from e
+
+
+@router.get("/planHorizon", response_model=Dict[str, Any])
+async def plan_horizon(
+    weeks: int = Query(
+        PLANNING_HORIZON_WEEKS, ge=1, le=26, description="Número de semanas"
+    ),
 ):
+    """
+    Propose the runs of the open purchases without runs over the next weeks.
+
+    Nothing is written, POST /planHorizon applies the proposal.
+
+    Args:
+        weeks: The number of weeks of the horizon, from the current one.
+
+    Returns:
+        Dict[str, Any]: The new runs and machine time of each week, and the lots
+        that could not be placed.
+
+    Raises:
+        HTTPException: If an error occurs while planning the horizon.
+    """
+    try:
+        return await PurchaseService.plan_horizon(weeks)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to plan the horizon: {str(e)}",
+        ) from e
+
+
+@router.post("/planHorizon", response_model=Optional[PlanningJob])
+async def queue_horizon_plan(
+    weeks: int = Query(
+        PLANNING_HORIZON_WEEKS, ge=1, le=26, description="Número de semanas"
+    ),
+):
+    """
+    Place the open purchases without runs over the next weeks.
+
+    The runs are appended by a planning job holding the locks of every week of
+    the horizon.
+
+    Args:
+        weeks: The number of weeks of the horizon, from the current one.
+
+    Returns:
+        Optional[PlanningJob]: The queued job, its result holds the new runs.
+
+    Raises:
+        HTTPException: If an error occurs while queueing the job.
+    """
+    try:
+        return await PurchaseService.queue_horizon_plan(weeks)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to plan the horizon: {str(e)}",
+        ) from e
+
+
+@router.post("/optimizePairing", response_model=Optional[PlanningJob])
+async def optimize_pairing(
+    year: int = Query(..., description="Año ISO"),
+    week: int = Query(..., ge=1, le=53, description="Semana ISO"),
+    budget: float = Query(
+        PLANNING_EXACT_BUDGET_SECONDS,
+        ge=1,
+        le=PLANNING_LOCK_SECONDS // 2,
+        description="Segundos de búsqueda",
+    ),
+    apply: bool = Query(False, description="Reemplazar las corridas de la semana"),
+):
+    """
+    Queue the search of the pairing with the minimum refile of the open purchases
+    of a week. The search runs offline, its runs are in the result of the job.
+
+    Args:
+        year: The ISO year of the week.
+        week: The ISO week.
+        budget: The wall-clock seconds the search may take.
+        apply: Whether to replace the runs of the week with the new pairing.
+
+    Returns:
+        Optional[PlanningJob]: The queued planning job.
+
+    Raises:
+        HTTPException: If an error occurs while queuing the search.
+    """
+    try:
+        return await PurchaseService.queue_pairing_optimization(
+            (year, week), apply, budget
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to queue the pairing optimization: {str(e)}",
+        ) from e
+
+
+@router.get("/kpis", response_model=List[Dict[str, Any]])
+async def get_kpis(
+    start: Optional[datetime] = Query(
+        None, alias="from", description="Fecha de recepción inicial (incluida)"
+    ),
+    end: Optional[datetime] = Query(
+        None, alias="to", description="Fecha de recepción final (excluida)"
+    ),
+    group_by: str = Query(
+        "month", pattern="^(month|client|week)$", description="Agrupación"
+    ),
+):
+    """
+    Retrieve the invoice, kilograms and count of the purchases received in a range.
+
+    Args:
+        start (Optional[datetime]): The first receipt date included.
+        end (Optional[datetime]): The first receipt date excluded.
+        group_by (str): "month", "client" or "week" (ISO).
+
+    Returns:
+        List[Dict[str, Any]]: The fields of each bucket (year and month, client,
+        or ISO year and week) with its invoice, kilograms and count.
+
+    Raises:
+        HTTPException: If an error occurs while computing the KPIs.
+    """
+    try:
+        return await PurchaseService.get_kpis(start, end, group_by)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve KPIs: {str(e)}",
+        ) from e
+
+
+@router.patch("/changeStatus/{arapack_lot}", response_model=Purchase)
+async def change_status(arapack_lot: str, new_status: str):
     """
     Change the status of a purchase.
 
     Args:
         arapack_lot (str): The arapack lot of the purchase to update.
         new_status (str): The new status to set for the purchase.
-        background_tasks (BackgroundTasks): FastAPI background tasks for asynchronous processing.
 
     Returns:
         Purchase: The updated purchase with the new status.
@@ -362,9 +664,7 @@ async def change_status(
         HTTPException: If the purchase is not found or an error occurs during the update.
     """
     try:
-        return await PurchaseService.change_status(
-            arapack_lot, new_status, background_tasks
-        )
+        return await PurchaseService.change_status(arapack_lot, new_status)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
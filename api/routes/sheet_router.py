@@ -2,7 +2,7 @@
 Routes for sheet operations using MongoDB.
 """
 
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from beanie import PydanticObjectId
 from fastapi import APIRouter, HTTPException, status, Query
@@ -83,6 +83,47 @@ async def get_pages(query: str = Query("", description="Filtro de búsqueda")):
         ) from e
 
 
+@router.get("/search", response_model=Dict[str, Any])
+async def search_sheets(
+    query: str = Query("", description="Filtro de búsqueda"),
+    page: int = Query(1, description="Número de página"),
+):
+    """Get a page of sheets with its total and facet counts in one query"""
+    if page < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El número de página debe ser mayor a 0",
+        )
+
+    try:
+        return await SheetService.search_sheets(query, page, ITEMS_PER_PAGE)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search sheets: {str(e)}",
+        ) from e
+
+
+@router.get("/getFilteredSheetsByCursor", response_model=Dict[str, Any])
+async def get_filtered_sheets_by_cursor(
+    query: str = Query("", description="Filtro de búsqueda"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página"),
+):
+    """Get a page of sheets after or before a cursor"""
+    try:
+        return await SheetService.get_sheets_by_cursor(query, ITEMS_PER_PAGE, cursor)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        ) from e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve sheets: {str(e)}",
+        ) from e
+
+
 @router.put("/update/{sheet_id}", response_model=Sheet)
 async def update_sheet(sheet_id: PydanticObjectId, update_data: dict):
     """
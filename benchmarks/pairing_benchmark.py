@@ -0,0 +1,159 @@
+"""
+Exact pairing benchmark.
+
+Pairs random order books with the BinPacker and the ExactPacker and reports the
+refile area of both, the lower bound of the search and how often it proved its
+pairing optimal within the budget. It runs offline, without server or database:
+
+    python -m benchmarks.pairing_benchmark --demands 10 20 40 80 --budget 10
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from services.planning.exact_packer import ExactPacker, refile_area
+from services.planning.packer import BinPacker
+from utils.iso_week import iso_week, monday
+
+# ECTs the random boxes are drawn from, every sheet accepts all of them
+ECTS = [19, 21]
+
+# Roll widths of the random sheets, in cm
+ROLL_WIDTHS = list(range(140, 250, 10))
+
+
+def random_book(
+    count: int, first_day: date
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Create the demands of a random order book due in a week, and the sheets.
+
+    Args:
+        count: The number of purchases.
+        first_day: The Monday of the week.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]: The demands with their
+        purchase and box data, and the sheets.
+    """
+    sheets = [
+        {"id": f"S{width}", "roll_width": width, "ect": ECTS, "speed": 120}
+        for width in ROLL_WIDTHS
+    ]
+    demands = []
+    for index in range(count):
+        quantity = random.randint(500, 10000)
+        demands.append(
+            {
+                "purchase": {
+                    "arapack_lot": f"L{index}",
+                    "order_number": f"O{index}",
+                    "symbol": f"B{index}",
+                    "quantity": quantity,
+                    "missing_quantity": quantity,
+                    "estimated_delivery_date": datetime.combine(
+                        first_day + timedelta(days=random.randint(0, 5)),
+                        datetime.min.time(),
+                    ),
+                },
+                "box": {
+                    "symbol": f"B{index}",
+                    "ect": random.choice(ECTS),
+                    "treatment": random.random() < 0.2,
+                    "width": random.uniform(25, 90),
+                    "length": random.uniform(80, 200),
+                },
+            }
+        )
+    return demands, sheets
+
+
+def measure(count: int, repeat: int, packer: ExactPacker) -> Dict[str, Any]:
+    """
+    Pair random order books of a number of purchases.
+
+    Args:
+        count: The number of purchases of each order book.
+        repeat: The number of order books.
+        packer: The exact packer measured, with its budget.
+
+    Returns:
+        Dict[str, Any]: The mean refile area of both packers, the mean lower bound
+        and runtime of the search, and the share of optimal pairings.
+    """
+    first_day = monday(iso_week(date.today()))
+    greedy = BinPacker()
+    totals = {"greedy_area": 0, "exact_area": 0, "lower_bound": 0, "seconds": 0}
+    optimal = 0
+    for _ in range(repeat):
+        demands, sheets = random_book(count, first_day)
+        totals["greedy_area"] += refile_area(
+            greedy.plan(demands, sheets, start_date=first_day).runs
+        )
+        started = time.perf_counter()
+        result = packer.plan(demands, sheets, start_date=first_day)
+        totals["seconds"] += time.perf_counter() - started
+        totals["exact_area"] += result.refile_area
+        totals["lower_bound"] += result.lower_bound
+        optimal += result.optimal
+    means = {key: value / repeat for key, value in totals.items()}
+    return {
+        "demands": count,
+        **means,
+        "saved": (
+            1 - means["exact_area"] / means["greedy_area"]
+            if means["greedy_area"]
+            else 0
+        ),
+        "optimal": optimal / repeat,
+    }
+
+
+def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--demands",
+        type=int,
+        nargs="+",
+        default=[10, 20, 40, 80],
+        help="Purchases per order book",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Books of each size")
+    parser.add_argument(
+        "--budget", type=float, default=10, help="Search seconds of each book"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    packer = ExactPacker(budget_seconds=args.budget)
+    report = [measure(count, args.repeat, packer) for count in args.demands]
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print_report(report)
+
+
+def print_report(report: List[Dict[str, Any]]) -> None:
+    """Print the benchmark report as a table."""
+    print(
+        f"{'demands':>8}{'greedy m²':>11}{'exact m²':>10}{'saved':>8}"
+        f"{'bound m²':>10}{'optimal':>9}{'seconds':>9}"
+    )
+    for row in report:
+        print(
+            f"{row['demands']:>8}{row['greedy_area']:>11.0f}{row['exact_area']:>10.0f}"
+            f"{row['saved']:>8.1%}{row['lower_bound']:>10.0f}"
+            f"{row['optimal']:>9.0%}{row['seconds']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Planning latency benchmark.
+
+Drives the purchase endpoints that queue production plan updates at fixed rates
+against a running server and reports the end-to-end planning latency of the
+queued jobs and the depth of the planning queue.
+
+Start the server with the fake model backend so no Bedrock quota is spent:
+
+    AI_BACKEND=fake FAKE_MODEL_LATENCY_MS=1500 uvicorn main:app
+
+Then run the benchmark, seeding its boxes and sheets in the same database:
+
+    python -m benchmarks.planning_benchmark --seed --cleanup \
+        --duration 60 --create-rate 2 --update-rate 0.5 --cancel-rate 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Prefix of the documents created by the benchmark
+BENCH_PREFIX = "BENCH"
+
+
+def percentile(values: List[float], rank: float) -> Optional[float]:
+    """
+    Get a percentile with the nearest-rank method.
+
+    Args:
+        values: The samples.
+        rank: The percentile between 0 and 100.
+
+    Returns:
+        Optional[float]: The percentile, or None without samples.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(rank / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """Get the count, p50, p99 and maximum of some latencies."""
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+class PlanningBenchmark:
+    """Open-loop load generator of the planning endpoints."""
+
+    def __init__(self, client: httpx.AsyncClient, symbols: List[Dict[str, Any]]):
+        """
+        Initialize the PlanningBenchmark.
+
+        Args:
+            client: The HTTP client pointing to the server.
+            symbols: The boxes the purchases are created for, with their ECT.
+        """
+        self.client = client
+        self.symbols = symbols
+        self.open_lots: List[str] = []
+        self.lots: List[str] = []
+        self.http_latency: Dict[str, List[float]] = {
+            "create": [],
+            "update": [],
+            "cancel": [],
+        }
+        self.errors: Dict[str, int] = {"create": 0, "update": 0, "cancel": 0}
+        self.queue_depth: List[int] = []
+
+    async def create(self) -> None:
+        """Create a purchase with POST /purchases/create_with_ai."""
+        box = random.choice(self.symbols)
+        lot = f"{BENCH_PREFIX}-{uuid.uuid4().hex[:12]}"
+        quantity = random.randint(1000, 20000)
+        delivery = datetime.now() + timedelta(days=random.randint(7, 28))
+        purchase = {
+            "receipt_date": datetime.now().isoformat(),
+            "order_number": lot,
+            "client": BENCH_PREFIX,
+            "symbol": box["symbol"],
+            "repetition_new": "NUEVO",
+            "type": "CRR",
+            "flute": "C",
+            "liner": "KRAFT",
+            "ect": box["ect"],
+            "quantity": quantity,
+            "estimated_delivery_date": delivery.isoformat(),
+            "unit_cost": 1.0,
+            "arapack_lot": lot,
+            "subtotal": quantity,
+            "total_invoice": quantity * 1.16,
+            "total_kilograms": quantity * 0.2,
+            "status": "ABIERTO",
+        }
+        if await self._send(
+            "create", "POST", "/purchases/create_with_ai", json=purchase
+        ):
+            self.lots.append(lot)
+            self.open_lots.append(lot)
+
+    async def update(self) -> None:
+        """Move a purchase with PATCH /purchases/update_delivery_date."""
+        if not self.open_lots:
+            return
+        lot = random.choice(self.open_lots)
+        delivery = datetime.now() + timedelta(days=random.randint(7, 28))
+        await self._send(
+            "update",
+            "PATCH",
+            f"/purchases/update_delivery_date/{lot}",
+            json={"new_delivery_date": delivery.isoformat()},
+        )
+
+    async def cancel(self) -> None:
+        """Cancel a purchase with PATCH /purchases/changeStatus."""
+        if not self.open_lots:
+            return
+        lot = self.open_lots.pop(random.randrange(len(self.open_lots)))
+        await self._send(
+            "cancel",
+            "PATCH",
+            f"/purchases/changeStatus/{lot}",
+            params={"new_status": "CANCELED"},
+        )
+
+    async def drive(self, action, rate: float, duration: float) -> None:
+        """
+        Call an action at a fixed rate without waiting for the previous calls.
+
+        Args:
+            action: The coroutine function sending a request.
+            rate: Requests per second, nothing is sent if zero.
+            duration: Seconds to keep sending requests.
+        """
+        if rate <= 0:
+            return
+        tasks = []
+        interval = 1 / rate
+        start = time.monotonic()
+        sent = 0
+        while time.monotonic() - start < duration:
+            tasks.append(asyncio.create_task(action()))
+            sent += 1
+            await asyncio.sleep(max(0.0, start + sent * interval - time.monotonic()))
+        await asyncio.gather(*tasks)
+
+    async def sample_queue(self, interval: float, stop: asyncio.Event) -> None:
+        """Record the queue depth until stopped."""
+        while not stop.is_set():
+            stats = await self.queue_stats()
+            if stats:
+                self.queue_depth.append(stats["depth"])
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def queue_stats(self) -> Optional[Dict[str, int]]:
+        """Get the job counts from GET /jobs/getQueueStats."""
+        try:
+            response = await self.client.get("/jobs/getQueueStats")
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError:
+            return None
+
+    async def drain(self, timeout: float, interval: float) -> bool:
+        """Wait until the planning queue is empty, returning False on timeout."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            stats = await self.queue_stats()
+            if stats:
+                self.queue_depth.append(stats["depth"])
+                if stats["depth"] == 0:
+                    return True
+            await asyncio.sleep(interval)
+        return False
+
+    async def planning_latency(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Collect the planning latency of the jobs of every purchase created.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The latency summary and failures of each
+            job action, measured from enqueue to completion.
+        """
+        latencies: Dict[str, List[float]] = {}
+        failed: Dict[str, int] = {}
+        for lot in self.lots:
+            response = await self.client.get(f"/jobs/getByArapackLot/{lot}")
+            if response.status_code != 200:
+                continue
+            for job in response.json():
+                if job["status"] not in ("DONE", "FAILED"):
+                    continue
+                if (job.get("result") or {}).get("coalesced_into"):
+                    continue
+                elapsed = datetime.fromisoformat(
+                    job["updated_at"]
+                ) - datetime.fromisoformat(job["created_at"])
+                latencies.setdefault(job["action"], []).append(elapsed.total_seconds())
+                if job["status"] == "FAILED":
+                    failed[job["action"]] = failed.get(job["action"], 0) + 1
+        return {
+            action: {**summarize(values), "failed": failed.get(action, 0)}
+            for action, values in latencies.items()
+        }
+
+    async def _send(self, name: str, method: str, url: str, **kwargs) -> bool:
+        """Send a request and record its latency."""
+        start = time.monotonic()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        self.http_latency[name].append(time.monotonic() - start)
+        if not ok:
+            self.errors[name] += 1
+        return ok
+
+
+async def seed(boxes: int) -> List[Dict[str, Any]]:
+    """
+    Insert the boxes and sheets used by the benchmark.
+
+    Args:
+        boxes: The number of box designs to create.
+
+    Returns:
+        List[Dict[str, Any]]: The symbol and ECT of each box.
+    """
+    from models.box import Box, Crease, Ink
+    from models.sheet import Sheet
+
+    ects = [19, 21, 23, 26, 32]
+    symbols = []
+    for index in range(boxes):
+        ect = ects[index % len(ects)]
+        symbol = f"{BENCH_PREFIX} BOX {index:03d}"
+        await Box(
+            symbol=symbol,
+            ect=ect,
+            liner="KRAFT",
+            width=random.uniform(30, 90),
+            length=random.uniform(80, 200),
+            flute="C",
+            treatment=index % 7 == 0,
+            client=BENCH_PREFIX,
+            creases=Crease(),
+            inks=Ink(),
+            status="APPROVED",
+            type="CRR",
+        ).insert()
+        symbols.append({"symbol": symbol, "ect": ect})
+
+    for roll_width in range(140, 250, 10):
+        await Sheet(
+            roll_width=roll_width,
+            p1=110,
+            p2=110,
+            p3=110,
+            ect=ects,
+            grams=389,
+            description=BENCH_PREFIX,
+            boxes=[symbol["symbol"] for symbol in symbols],
+            speed=120,
+            available_meters=100000,
+        ).insert()
+    return symbols
+
+
+async def cleanup() -> None:
+    """Delete the documents created by the benchmark."""
+    from models.box import Box
+    from models.planning_job import PlanningJob
+    from models.purchase import Purchase
+    from models.sheet import Sheet
+
+    purchases = await Purchase.find({"client": BENCH_PREFIX}).to_list()
+    lots = [purchase.arapack_lot for purchase in purchases]
+    await PlanningJob.find({"payload.arapack_lot": {"$in": lots}}).delete()
+    await Purchase.find({"client": BENCH_PREFIX}).delete()
+    await Box.find({"client": BENCH_PREFIX}).delete()
+    await Sheet.find({"description": BENCH_PREFIX}).delete()
+
+
+async def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument(
+        "--create-rate", type=float, default=1, help="Creations per second"
+    )
+    parser.add_argument(
+        "--update-rate", type=float, default=0.2, help="Date updates per second"
+    )
+    parser.add_argument(
+        "--cancel-rate", type=float, default=0.1, help="Cancellations per second"
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=0.5,
+        help="Seconds between queue samples",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=300,
+        help="Seconds to wait for the queue to empty",
+    )
+    parser.add_argument(
+        "--seed", action="store_true", help="Insert benchmark boxes and sheets"
+    )
+    parser.add_argument("--boxes", type=int, default=20, help="Box designs to seed")
+    parser.add_argument(
+        "--symbols", nargs="*", default=[], help="Existing box symbols as SYMBOL:ECT"
+    )
+    parser.add_argument(
+        "--cleanup", action="store_true", help="Delete the benchmark documents"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    symbols = [
+        {"symbol": symbol.rsplit(":", 1)[0], "ect": int(symbol.rsplit(":", 1)[1])}
+        for symbol in args.symbols
+    ]
+    if args.seed or args.cleanup:
+        from config.mongodb import init_db
+
+        await init_db()
+    if args.seed:
+        symbols += await seed(args.boxes)
+    if not symbols:
+        parser.error("Use --seed or --symbols to choose the boxes of the purchases")
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        benchmark = PlanningBenchmark(client, symbols)
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(
+            benchmark.sample_queue(args.sample_interval, stop)
+        )
+        started = time.monotonic()
+        await asyncio.gather(
+            benchmark.drive(benchmark.create, args.create_rate, args.duration),
+            # Updates and cancellations are skipped until purchases exist
+            benchmark.drive(benchmark.update, args.update_rate, args.duration),
+            benchmark.drive(benchmark.cancel, args.cancel_rate, args.duration),
+        )
+        stop.set()
+        await sampler
+        drained = await benchmark.drain(args.drain_timeout, args.sample_interval)
+        elapsed = time.monotonic() - started
+
+        report = {
+            "duration": elapsed,
+            "drained": drained,
+            "requests": {
+                name: {**summarize(values), "errors": benchmark.errors[name]}
+                for name, values in benchmark.http_latency.items()
+            },
+            "planning": await benchmark.planning_latency(),
+            "queue_depth": {
+                "max": max(benchmark.queue_depth, default=0),
+                "mean": (
+                    sum(benchmark.queue_depth) / len(benchmark.queue_depth)
+                    if benchmark.queue_depth
+                    else 0
+                ),
+                "samples": len(benchmark.queue_depth),
+            },
+        }
+        try:
+            response = await client.get("/ia/getRepairStats")
+            report["ai"] = response.json() if response.status_code == 200 else None
+        except httpx.HTTPError:
+            report["ai"] = None
+
+    if args.cleanup:
+        await cleanup()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print_report(report)
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Print the benchmark report as tables."""
+
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:9.1f}"
+
+    print(f"Elapsed {report['duration']:.1f}s, queue drained: {report['drained']}")
+    print("\nRequest latency (ms)")
+    print(f"{'endpoint':<12}{'count':>7}{'p50':>10}{'p99':>10}{'max':>10}{'errors':>8}")
+    for name, stats in report["requests"].items():
+        print(
+            f"{name:<12}{stats['count']:>7}{ms(stats['p50'])}{ms(stats['p99'])}"
+            f"{ms(stats['max'])}{stats['errors']:>8}"
+        )
+    print("\nPlanning latency, enqueue to completion (ms)")
+    print(f"{'job':<22}{'count':>7}{'p50':>10}{'p99':>10}{'max':>10}{'failed':>8}")
+    for name, stats in report["planning"].items():
+        print(
+            f"{name:<22}{stats['count']:>7}{ms(stats['p50'])}{ms(stats['p99'])}"
+            f"{ms(stats['max'])}{stats['failed']:>8}"
+        )
+    depth = report["queue_depth"]
+    print(
+        f"\nQueue depth: max {depth['max']}, mean {depth['mean']:.1f} "
+        f"over {depth['samples']} samples"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,192 @@
+"""
+Run sequencer benchmark.
+
+Orders random weeks of production runs with the RunSequencer and reports its
+runtime and the setup time and late runs before and after. It runs offline,
+without server or database:
+
+    python -m benchmarks.sequencer_benchmark --runs 200 500 1000 --repeat 5
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import date, datetime, time as day_time, timedelta
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.planning_benchmark import percentile
+from models.program_planning import ProductionRun
+from services.planning.sequencer import RunSequencer
+from utils.iso_week import iso_week, monday
+
+# Sheet ECTs and roll widths the random runs are drawn from
+ECTS = [19, 21, 23, 26, 32]
+ROLL_WIDTHS = list(range(140, 250, 10))
+
+# Speed of the random runs in meters per minute
+SPEED = 100
+
+
+def random_week(
+    count: int, load: float, families: int, first_day: date, sequencer: RunSequencer
+) -> Tuple[List[ProductionRun], Dict[str, date]]:
+    """
+    Create the runs of a week in random order and the delivery dates of their lots.
+
+    Args:
+        count: The number of runs.
+        load: The production time of the runs as a share of the week capacity.
+        families: The number of distinct ECT, roll width and treatment mixes.
+        first_day: The Monday of the week.
+        sequencer: The sequencer whose calendar gives the week capacity.
+
+    Returns:
+        Tuple[List[ProductionRun], Dict[str, date]]: The runs and the delivery
+        dates keyed by arapack lot.
+    """
+    capacity = sequencer.scheduler.calendar.week_minutes(iso_week(first_day))
+    mixes = [
+        (random.choice(ECTS), random.choice(ROLL_WIDTHS), random.random() < 0.15)
+        for _ in range(families)
+    ]
+    working_days = [
+        first_day + timedelta(days=offset)
+        for offset in range(7)
+        if sequencer.scheduler.calendar.windows(first_day + timedelta(days=offset))
+    ]
+    runs = []
+    due_dates = {}
+    for _ in range(count):
+        ect, roll_width, treatment = random.choice(mixes)
+        minutes = max(1, round(random.uniform(0.5, 1.5) * load * capacity / count))
+        lot = uuid.uuid4().hex[:12]
+        runs.append(
+            ProductionRun(
+                processed_boxes=[
+                    {
+                        "order_number": lot,
+                        "symbol": lot,
+                        "quantity": 1,
+                        "output": 1,
+                        "hierarchy": "priority",
+                        "part": 1,
+                        "remaining": 0,
+                        "arapack_lot": lot,
+                    }
+                ],
+                authorized_refile=False,
+                sheet={
+                    "id": lot,
+                    "ect": ect,
+                    "roll_width": roll_width,
+                    "p1": 0,
+                    "p2": 0,
+                    "p3": 0,
+                },
+                scheduled_date=first_day,
+                treatment=treatment,
+                start_time=day_time.min,
+                end_time=day_time.min,
+                refile=0,
+                linear_meters=minutes * SPEED,
+                speed=SPEED,
+            )
+        )
+        # Most purchases are due at the end of the week, some earlier
+        due_dates[lot] = (
+            working_days[-1] if random.random() < 0.6 else random.choice(working_days)
+        )
+    return runs, due_dates
+
+
+def measure(
+    count: int, repeat: int, load: float, families: int, sequencer: RunSequencer
+) -> Dict[str, Any]:
+    """
+    Sequence random weeks of a number of runs.
+
+    Args:
+        count: The number of runs of each week.
+        repeat: The number of weeks.
+        load: The production time of the runs as a share of the week capacity.
+        families: The number of distinct sheet mixes of each week.
+        sequencer: The sequencer measured.
+
+    Returns:
+        Dict[str, Any]: The runtime percentiles and the mean setup minutes and
+        late runs before and after.
+    """
+    first_day = monday(iso_week(date.today()))
+    start = datetime.combine(first_day, day_time.min)
+    runtimes: List[float] = []
+    totals = {"setup_before": 0, "setup_after": 0, "late_before": 0, "late_after": 0}
+    for _ in range(repeat):
+        runs, due_dates = random_week(count, load, families, first_day, sequencer)
+        started = time.perf_counter()
+        result = sequencer.sequence(runs, start, due_dates)
+        runtimes.append(time.perf_counter() - started)
+        for key in totals:
+            totals[key] += getattr(result, key)
+    means = {key: value / repeat for key, value in totals.items()}
+    return {
+        "runs": count,
+        "p50": percentile(runtimes, 50),
+        "max": max(runtimes),
+        **means,
+        "reduction": (
+            1 - means["setup_after"] / means["setup_before"]
+            if means["setup_before"]
+            else 0
+        ),
+    }
+
+
+def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--runs", type=int, nargs="+", default=[200, 500, 1000], help="Runs per week"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Weeks of each size")
+    parser.add_argument(
+        "--load", type=float, default=0.9, help="Production time per week capacity"
+    )
+    parser.add_argument(
+        "--families", type=int, default=12, help="Sheet mixes of each week"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sequencer = RunSequencer()
+    report = [
+        measure(count, args.repeat, args.load, args.families, sequencer)
+        for count in args.runs
+    ]
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print_report(report)
+
+
+def print_report(report: List[Dict[str, Any]]) -> None:
+    """Print the benchmark report as a table."""
+    print(
+        f"{'runs':>6}{'p50 ms':>10}{'max ms':>10}{'setup before':>14}"
+        f"{'setup after':>13}{'saved':>8}{'late before':>13}{'late after':>12}"
+    )
+    for row in report:
+        print(
+            f"{row['runs']:>6}{row['p50'] * 1000:>10.1f}{row['max'] * 1000:>10.1f}"
+            f"{row['setup_before']:>14.0f}{row['setup_after']:>13.0f}"
+            f"{row['reduction']:>8.0%}{row['late_before']:>13.1f}"
+            f"{row['late_after']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,65 @@
 """AWS Bedrock service configuration."""
+import asyncio
 import os
 import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ReadTimeoutError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
 from dotenv import load_dotenv
 
+from config.logging import logger
+
 # Load environment variables
 load_dotenv()
 
+# Endpoint override, used to point the client to a local stub server
+BEDROCK_ENDPOINT_URL = os.getenv("AWS_BEDROCK_ENDPOINT_URL") or None
+# Maximum number of model invocations in flight, also the connection pool size
+BEDROCK_MAX_CONCURRENCY = int(os.getenv("BEDROCK_MAX_CONCURRENCY", "4"))
+# Seconds to wait for a connection and for each read of a response, the client
+# read timeout bounds every blocking invocation
+BEDROCK_CONNECT_TIMEOUT = float(os.getenv("BEDROCK_CONNECT_TIMEOUT", "10"))
+BEDROCK_TIMEOUT = float(os.getenv("BEDROCK_TIMEOUT", "120"))
+# Retries of throttled or failed invocations with jittered exponential backoff
+BEDROCK_MAX_RETRIES = int(os.getenv("BEDROCK_MAX_RETRIES", "3"))
+BEDROCK_BACKOFF_BASE = float(os.getenv("BEDROCK_BACKOFF_BASE", "0.5"))
+BEDROCK_BACKOFF_MAX = float(os.getenv("BEDROCK_BACKOFF_MAX", "8"))
+# When enabled, responses are streamed with the converse API and parsed as they arrive
+BEDROCK_STREAMING = os.getenv("BEDROCK_STREAMING", "true").lower() == "true"
+# When enabled, the static prefix of the prompts is marked for Bedrock prompt caching
+BEDROCK_PROMPT_CACHING = os.getenv("BEDROCK_PROMPT_CACHING", "true").lower() == "true"
+
+# Error codes returned by Bedrock that are worth retrying
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "InternalServerException",
+}
+
 
 class AWSBedrockService:
     """AWS Bedrock service configuration."""
 
     client = None
+    _executor = None
+    _semaphore = None
+    _semaphore_loop = None
+    _usage_lock = threading.Lock()
+    # Token usage reported by Bedrock
+    usage = {
+        "requests": 0,
+        "input_tokens": 0,
+        "cache_read_tokens": 0,
+        "cache_write_tokens": 0,
+        "output_tokens": 0,
+    }
 
     @classmethod
     def configure(cls):
@@ -19,6 +67,15 @@ class AWSBedrockService:
         cls.client = boto3.client(
             service_name="bedrock-runtime",
             region_name=os.getenv("AWS_REGION", "us-east-1"),
+            endpoint_url=BEDROCK_ENDPOINT_URL,
+            config=Config(
+                max_pool_connections=BEDROCK_MAX_CONCURRENCY,
+                connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+                read_timeout=BEDROCK_TIMEOUT,
+                tcp_keepalive=True,
+                # Retries are handled by ainvoke_model
+                retries={"max_attempts": 0, "mode": "standard"},
+            ),
         )
 
     @classmethod
@@ -29,14 +86,17 @@ class AWSBedrockService:
         return cls.client
 
     @classmethod
-    def invoke_model(cls, prompt, model_id="amazon.nova-pro-v1:0"):
+    def invoke_model(cls, prompt, model_id="amazon.nova-pro-v1:0", prefix=None):
         """
         Invoke the Bedrock model with a prompt.
+
+        When the prompt starts with a static prefix, the prefix is followed by a
+        cache point so Bedrock reuses it across invocations.
         """
         client = cls.get_client()
         body = json.dumps(
             {
-                "messages": [{"role": "user", "content": [{"text": prompt}]}],
+                "messages": [{"role": "user", "content": cls._content(prompt, prefix)}],
                 "inferenceConfig": {"temperature": 0.4},
             }
         )
@@ -50,4 +110,188 @@ class AWSBedrockService:
 
         # Parse and return the response
         response_body = json.loads(response.get("body").read())
+        usage = response_body.get("usage") or {}
+        cls.record_usage(
+            usage.get("inputTokens", 0),
+            usage.get("cacheReadInputTokenCount", 0),
+            usage.get("cacheWriteInputTokenCount", 0),
+            usage.get("outputTokens", 0),
+        )
         return response_body["output"]["message"]["content"][0]["text"]
+
+    @classmethod
+    async def ainvoke_model(cls, prompt, model_id="amazon.nova-pro-v1:0", prefix=None):
+        """
+        Invoke the Bedrock model without blocking the event loop.
+
+        The blocking boto3 call runs on a dedicated thread pool that shares the
+        client connection pool. At most BEDROCK_MAX_CONCURRENCY invocations are in
+        flight, each one bounded by the read timeout of the client so its thread
+        always ends, and retried with jittered exponential backoff when Bedrock
+        throttles or fails transiently. The slot is released while backing off.
+        """
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            try:
+                async with cls._get_semaphore():
+                    return await loop.run_in_executor(
+                        cls._get_executor(),
+                        cls.invoke_model,
+                        prompt,
+                        model_id,
+                        prefix,
+                    )
+            except Exception as e:
+                if attempt >= BEDROCK_MAX_RETRIES or not cls._is_retryable(e):
+                    raise
+                delay = cls._backoff(attempt)
+                attempt += 1
+                logger.warning(
+                    f"Bedrock invocation failed ({e!r}), "
+                    f"retry {attempt} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+    @classmethod
+    async def astream_model(cls, prompt, model_id="amazon.nova-pro-v1:0", prefix=None):
+        """
+        Stream the response of the Bedrock model with the converse API.
+
+        The blocking event stream is read on the invocation thread pool and its
+        text deltas are handed to the event loop as they arrive. Closing the
+        generator stops reading the stream, so a consumer can abort early. Only
+        failures before the first delta are retried, and the slot is released
+        while backing off.
+        """
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            received = False
+            try:
+                async with cls._get_semaphore():
+                    queue = asyncio.Queue()
+                    stop = threading.Event()
+                    loop.run_in_executor(
+                        cls._get_executor(),
+                        cls._read_stream,
+                        prompt,
+                        model_id,
+                        prefix,
+                        loop,
+                        queue,
+                        stop,
+                    )
+                    try:
+                        while True:
+                            item = await asyncio.wait_for(
+                                queue.get(), timeout=BEDROCK_TIMEOUT
+                            )
+                            if item is None:
+                                return
+                            if isinstance(item, Exception):
+                                raise item
+                            received = True
+                            yield item
+                    finally:
+                        stop.set()
+            except Exception as e:
+                if (
+                    received
+                    or attempt >= BEDROCK_MAX_RETRIES
+                    or not cls._is_retryable(e)
+                ):
+                    raise
+                delay = cls._backoff(attempt)
+                attempt += 1
+                logger.warning(
+                    f"Bedrock stream failed ({e!r}), retry {attempt} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+    @classmethod
+    def _read_stream(cls, prompt, model_id, prefix, loop, queue, stop):
+        """Read a converse stream on a worker thread, ending with None or an error."""
+        try:
+            response = cls.get_client().converse_stream(
+                modelId=model_id,
+                messages=[{"role": "user", "content": cls._content(prompt, prefix)}],
+                inferenceConfig={"temperature": 0.4},
+            )
+            stream = response["stream"]
+            try:
+                for event in stream:
+                    if stop.is_set():
+                        break
+                    if "metadata" in event:
+                        usage = event["metadata"].get("usage") or {}
+                        cls.record_usage(
+                            usage.get("inputTokens", 0),
+                            usage.get("cacheReadInputTokens", 0),
+                            usage.get("cacheWriteInputTokens", 0),
+                            usage.get("outputTokens", 0),
+                        )
+                    text = event.get("contentBlockDelta", {}).get("delta", {}).get("text")
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+            finally:
+                stream.close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        except Exception as e:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    @classmethod
+    def record_usage(cls, input_tokens, cache_read_tokens, cache_write_tokens, output_tokens):
+        """Add the token usage of an invocation to the counters."""
+        with cls._usage_lock:
+            cls.usage["requests"] += 1
+            cls.usage["input_tokens"] += input_tokens
+            cls.usage["cache_read_tokens"] += cache_read_tokens
+            cls.usage["cache_write_tokens"] += cache_write_tokens
+            cls.usage["output_tokens"] += output_tokens
+
+    @staticmethod
+    def _content(prompt, prefix=None):
+        """Build the message content, with a cache point after the static prefix."""
+        if not BEDROCK_PROMPT_CACHING or not prefix or not prompt.startswith(prefix):
+            return [{"text": prompt}]
+        return [
+            {"text": prefix},
+            {"cachePoint": {"type": "default"}},
+            {"text": prompt[len(prefix) :]},
+        ]
+
+    @classmethod
+    def _get_executor(cls):
+        """Get the thread pool running the blocking invocations."""
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(
+                max_workers=BEDROCK_MAX_CONCURRENCY, thread_name_prefix="bedrock"
+            )
+        return cls._executor
+
+    @classmethod
+    def _get_semaphore(cls):
+        """Get the semaphore limiting the invocations in flight on this event loop."""
+        loop = asyncio.get_running_loop()
+        if cls._semaphore is None or cls._semaphore_loop is not loop:
+            cls._semaphore = asyncio.Semaphore(BEDROCK_MAX_CONCURRENCY)
+            cls._semaphore_loop = loop
+        return cls._semaphore
+
+    @staticmethod
+    def _backoff(attempt):
+        """Get the jittered delay before a retry, in seconds."""
+        return random.uniform(
+            0, min(BEDROCK_BACKOFF_MAX, BEDROCK_BACKOFF_BASE * 2**attempt)
+        )
+
+    @staticmethod
+    def _is_retryable(error):
+        """Check whether a failed invocation should be retried."""
+        if isinstance(error, (asyncio.TimeoutError, BotocoreConnectionError, ReadTimeoutError)):
+            return True
+        if isinstance(error, ClientError):
+            return error.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+        return False
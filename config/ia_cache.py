@@ -0,0 +1,15 @@
+"""AI response cache configuration."""
+
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# When enabled, AI responses are reused for identical planning inputs
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+# Number of responses kept in memory, the least recently used are evicted first
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "256"))
+# Seconds a cached response stays valid, in memory and in MongoDB
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", "86400"))
@@ -0,0 +1,18 @@
+"""AI model backend configuration."""
+
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Backend answering the planning prompts: "bedrock" or "fake" for load tests
+AI_BACKEND = os.getenv("AI_BACKEND", "bedrock").lower()
+# Milliseconds the fake backend waits before answering, plus a random jitter
+FAKE_MODEL_LATENCY_MS = int(os.getenv("FAKE_MODEL_LATENCY_MS", "2000"))
+FAKE_MODEL_JITTER_MS = int(os.getenv("FAKE_MODEL_JITTER_MS", "500"))
+# JSON file with recorded responses by action type, synthetic plans when unset
+FAKE_MODEL_RESPONSES = os.getenv("FAKE_MODEL_RESPONSES") or None
+# Characters of each chunk streamed by the fake backend
+FAKE_MODEL_CHUNK_SIZE = int(os.getenv("FAKE_MODEL_CHUNK_SIZE", "256"))
@@ -12,7 +12,10 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from config.logging import logger
 
 # Import the required models
+from models.ai_response import AIResponse
 from models.box import Box
+from models.kpi_rollup import KpiRollup
+from models.planning_job import PlanningJob
 from models.program_planning import ProgramPlanning
 from models.purchase import Purchase
 from models.sheet import Sheet
@@ -24,6 +27,11 @@ dotenv.load_dotenv()
 MONGODB_URL = os.getenv("MONGODB_URL")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME")
 
+# Whether the plans of the main queries are checked for collection scans on startup
+MONGODB_CHECK_QUERY_PLANS = (
+    os.getenv("MONGODB_CHECK_QUERY_PLANS", "true").lower() == "true"
+)
+
 
 # Connect to the MongoDB
 async def init_db():
@@ -38,7 +46,18 @@ async def init_db():
 
         db = client[MONGODB_DB_NAME]
         await init_beanie(
-            database=db, document_models=[Box, Sheet, Purchase, ProgramPlanning, BoxWildcardList, SheetsSelection]
+            database=db,
+            document_models=[
+                Box,
+                Sheet,
+                Purchase,
+                ProgramPlanning,
+                BoxWildcardList,
+                SheetsSelection,
+                PlanningJob,
+                AIResponse,
+                KpiRollup,
+            ],
         )
         logger.info("Database initialization complete.")
     except Exception as e:
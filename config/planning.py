@@ -0,0 +1,50 @@
+"""Planning engine configuration."""
+
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# When enabled, the deterministic plan is sent to the AI model for refinement
+PLANNING_AI_REFINEMENT = os.getenv("PLANNING_AI_REFINEMENT", "false").lower() == "true"
+
+# Number of workers processing queued planning jobs
+PLANNING_WORKERS = int(os.getenv("PLANNING_WORKERS", "2"))
+# Times a planning job is attempted before it is marked as failed
+PLANNING_JOB_MAX_ATTEMPTS = int(os.getenv("PLANNING_JOB_MAX_ATTEMPTS", "3"))
+# Seconds a worker holds the lock of a week before another worker may take it
+PLANNING_LOCK_SECONDS = int(os.getenv("PLANNING_LOCK_SECONDS", "600"))
+# Seconds an idle worker waits before looking for new jobs
+PLANNING_POLL_SECONDS = float(os.getenv("PLANNING_POLL_SECONDS", "2"))
+# Seconds between two sweeps returning the jobs of dead workers to the queue
+PLANNING_REAP_SECONDS = float(os.getenv("PLANNING_REAP_SECONDS", "60"))
+# Milliseconds a week waits after its first pending job so a burst is planned at once
+PLANNING_BATCH_WINDOW_MS = int(os.getenv("PLANNING_BATCH_WINDOW_MS", "500"))
+# Number of pending jobs that triggers the planning of a week before the window ends
+PLANNING_BATCH_MAX_SIZE = int(os.getenv("PLANNING_BATCH_MAX_SIZE", "50"))
+# Number of sheets sent to the planner for each box, best refile first
+PLANNING_CANDIDATE_SHEETS = int(os.getenv("PLANNING_CANDIDATE_SHEETS", "10"))
+# Number of weeks the horizon planner loads and places purchases in
+PLANNING_HORIZON_WEEKS = int(os.getenv("PLANNING_HORIZON_WEEKS", "4"))
+# Working shifts of the corrugator as comma separated HH:MM-HH:MM windows
+PLANNING_SHIFTS = os.getenv("PLANNING_SHIFTS", "06:00-22:00")
+# Working days of the corrugator as comma separated weekdays, Monday is 0
+PLANNING_WORKING_DAYS = os.getenv("PLANNING_WORKING_DAYS", "0,1,2,3,4,5")
+# Setup minutes added between consecutive runs of different ECT
+PLANNING_CHANGEOVER_ECT_MINUTES = int(
+    os.getenv("PLANNING_CHANGEOVER_ECT_MINUTES", "15")
+)
+# Setup minutes added between runs with and without anti-humidity treatment
+PLANNING_CHANGEOVER_TREATMENT_MINUTES = int(
+    os.getenv("PLANNING_CHANGEOVER_TREATMENT_MINUTES", "20")
+)
+# Setup minutes added between consecutive runs of different roll width
+PLANNING_CHANGEOVER_WIDTH_MINUTES = int(
+    os.getenv("PLANNING_CHANGEOVER_WIDTH_MINUTES", "10")
+)
+# Seconds the exact pairing search may take before returning its best pairing
+PLANNING_EXACT_BUDGET_SECONDS = float(os.getenv("PLANNING_EXACT_BUDGET_SECONDS", "60"))
+# Repair prompts or new calls made when the AI output does not match the plan models
+PLANNING_AI_MAX_REPAIRS = int(os.getenv("PLANNING_AI_MAX_REPAIRS", "2"))
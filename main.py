@@ -10,12 +10,20 @@ import os
 
 from api.routes import program_planning_router
 from config.logging import logger, log_config
-from config.mongodb import init_db
+from config.mongodb import MONGODB_CHECK_QUERY_PLANS, init_db
 from api.routes.box_router import router as box_router
 from api.routes.sheet_router import router as sheet_router
 from api.routes.purchase_router import router as purchase_router
 from api.routes.program_planning_router import router as program_planning_router
 from api.routes.selection_router import router as selection_router
+from api.routes.planning_job_router import router as planning_job_router
+from api.routes.ia_router import router as ia_router
+from repositories.query_plans import check_query_plans
+from services.box_service import BoxService
+from services.kpi_rollup_service import KpiRollupService
+from services.planning_queue import planning_queue
+from services.program_planning_service import ProgramPlanningService
+from services.purchase_service import PurchaseService
 
 
 @asynccontextmanager
@@ -23,13 +31,29 @@ async def lifespan(app: FastAPI):
     """
     Manage the application lifecycle.
 
-    This context manager handles database initialization on startup.
+    This context manager handles database initialization, the check of the
+    query plans, the search terms of older boxes and purchases, the ISO weeks of
+    older program plannings, the KPI rollups and the planning workers on startup.
     """
     logger.info("Initializing database connection...")
     await init_db()
     logger.info("Database initialization completed")
+    if MONGODB_CHECK_QUERY_PLANS:
+        await check_query_plans()
+    indexed = await BoxService.backfill_search_terms()
+    if indexed:
+        logger.info(f"Indexed the search terms of {indexed} boxes")
+    indexed = await PurchaseService.backfill_search_terms()
+    if indexed:
+        logger.info(f"Indexed the search terms of {indexed} purchases")
+    migrated = await ProgramPlanningService.migrate_iso_weeks()
+    if migrated:
+        logger.info(f"Set the ISO week of {migrated} plannings, purchases and jobs")
+    await KpiRollupService.ensure_built()
+    await planning_queue.start(PurchaseService.process_planning_jobs)
     yield
     logger.info("Shutting down application...")
+    await planning_queue.stop()
 
 
 def create_application() -> FastAPI:
@@ -83,6 +107,10 @@ def create_application() -> FastAPI:
     application.include_router(
         router=selection_router, prefix="/selections", tags=["Selections"]
     )
+    application.include_router(
+        router=planning_job_router, prefix="/jobs", tags=["Planning Jobs"]
+    )
+    application.include_router(router=ia_router, prefix="/ia", tags=["AI"])
     return application
 
 
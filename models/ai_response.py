@@ -0,0 +1,39 @@
+"""AIResponse model definition."""
+
+from datetime import datetime
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class AIResponse(Document):
+    """AIResponse model representing a cached response of the AI model."""
+
+    key: str  # Hash of the action type and the normalized input data
+    action_type: str  # Action the prompt was built for
+    response: str  # Raw text returned by the AI model
+    created_at: datetime = Field(default_factory=datetime.now)
+    expires_at: datetime  # MongoDB removes the response after this date
+
+    class Settings:
+        """Settings for the AIResponse model."""
+
+        name = "ai_responses"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+    class Config:
+        """Configuration for the AIResponse model."""
+
+        json_schema_extra = {
+            "example": {
+                "key": "5d41402abc4b2a76b9719d911017c592",
+                "action_type": "register",
+                "response": '{"production_runs": []}',
+                "created_at": "2025-01-08T00:00:00",
+                "expires_at": "2025-01-09T00:00:00",
+            }
+        }
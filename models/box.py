@@ -2,9 +2,15 @@
 Box model for MongoDB.
 """
 
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
-from beanie import Document, Indexed
+from beanie import Document, Indexed, Insert, Replace, Save, before_event
+from pymongo import ASCENDING, IndexModel
+
+from utils.search import search_terms
+
+# Fields whose words are matched by the box search
+SEARCH_FIELDS = ("symbol", "liner", "flute", "client", "status")
 
 
 # pylint: disable=too-many-ancestors
@@ -42,12 +48,25 @@ class Box(Document):
     status: str  # Status of the box (e.g., approved, pending, disabled)
     type: str  # Type of the extra information
     pdf_link: str = ""  # Link to the PDF document of the box
+    search_terms: List[str] = []  # Prefixes of the searchable words of the box
+
+    @before_event(Insert, Replace, Save)
+    def update_search_terms(self):
+        """Refresh the search terms from the searchable fields."""
+        self.search_terms = search_terms(
+            getattr(self, field) for field in SEARCH_FIELDS
+        )
 
     # pylint: disable=too-few-public-methods
     class Settings:
         """Settings for the Box model."""
 
         name = "boxes"  # Collection name in MongoDB
+        indexes = [
+            IndexModel([("search_terms", ASCENDING)]),
+            IndexModel([("ect", ASCENDING)]),
+            IndexModel([("symbol", ASCENDING), ("_id", ASCENDING)]),
+        ]
 
     # pylint: disable=too-few-public-methods
     class Config:
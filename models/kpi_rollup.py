@@ -0,0 +1,44 @@
+"""KpiRollup model definition."""
+
+from datetime import datetime
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class KpiRollup(Document):
+    """KpiRollup model representing the purchase totals of a bucket."""
+
+    kind: str  # Bucket kind: "day", "week" or "client" of receipt, "due" day
+    key: str  # Bucket key: ISO date, ISO year and week, or client name
+    invoice: float = 0.0  # Invoice total of the purchases received
+    kilograms: float = 0.0  # Kilograms of the purchases received
+    purchase_count: int = 0  # Number of purchases received
+    open_count: int = 0  # Number of open purchases due, for "due" buckets
+    missing_quantity: int = 0  # Quantity missing of the open purchases due
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        """Settings for the KpiRollup model."""
+
+        name = "kpi_rollups"
+        indexes = [
+            IndexModel([("kind", ASCENDING), ("key", ASCENDING)], unique=True),
+        ]
+
+    class Config:
+        """Configuration for the KpiRollup model."""
+
+        json_schema_extra = {
+            "example": {
+                "kind": "day",
+                "key": "2025-01-08",
+                "invoice": 74588.00,
+                "kilograms": 2220.00,
+                "purchase_count": 1,
+                "open_count": 0,
+                "missing_quantity": 0,
+                "updated_at": "2025-01-08T00:00:00",
+            }
+        }
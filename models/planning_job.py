@@ -0,0 +1,59 @@
+"""PlanningJob model definition."""
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from beanie import Document
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class PlanningJob(Document):
+    """PlanningJob model representing a queued update of the production plan."""
+
+    action: str  # Updater run by the job, see PlanningQueue.enqueue
+    iso_year: Optional[int] = None  # ISO year of the week, None on jobs of old versions
+    # ISO week whose plan is updated, jobs of a week run one at a time
+    iso_week: int
+    payload: Dict[str, Any] = {}  # Updater data (arapack_lot, original_week)
+    status: str = "PENDING"  # PENDING, RUNNING, DONE or FAILED
+    attempts: int = 0  # Number of times the job has been picked by a worker
+    owner: Optional[str] = None  # Worker running the job, renewed through updated_at
+    result: Optional[Dict[str, Any]] = None  # Summary of the planning pass
+    error: Optional[str] = None  # Last error raised while processing the job
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    class Settings:
+        """Settings for the PlanningJob model."""
+
+        name = "planning_jobs"
+        indexes = [
+            IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+            IndexModel(
+                [
+                    ("iso_year", ASCENDING),
+                    ("iso_week", ASCENDING),
+                    ("status", ASCENDING),
+                ]
+            ),
+            IndexModel([("payload.arapack_lot", ASCENDING)]),
+        ]
+
+    class Config:
+        """Configuration for the PlanningJob model."""
+
+        json_schema_extra = {
+            "example": {
+                "action": "register",
+                "iso_year": 2025,
+                "iso_week": 20,
+                "payload": {"arapack_lot": "25055"},
+                "status": "DONE",
+                "attempts": 1,
+                "result": {"iso_week": 20, "iso_year": 2025, "batch_size": 1},
+                "error": None,
+                "created_at": "2025-01-08T00:00:00",
+                "updated_at": "2025-01-08T00:00:05",
+            }
+        }
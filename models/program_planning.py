@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from beanie import Document
 from pydantic import BaseModel
+from pymongo import ASCENDING, IndexModel
 
 
 class ProcessedBox(BaseModel):
@@ -33,6 +34,7 @@ class ProductionRun(BaseModel):
     treatment: bool
     start_time: time
     end_time: time
+    end_date: Optional[date] = None  # Set when the run ends past its scheduled date
     refile: float
     linear_meters: int
     speed: int
@@ -41,10 +43,19 @@ class ProductionRun(BaseModel):
 class ProgramPlanning(Document):
     production_runs: Optional[List[ProductionRun]] = []
     created_at: datetime = datetime.now()
-    week_of_year: Optional[int] = 0
+    iso_year: Optional[int] = None
+    iso_week: Optional[int] = None
 
     class Settings:
         name = "program_planning"
+        indexes = [
+            IndexModel(
+                [("iso_year", ASCENDING), ("iso_week", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"iso_year": {"$type": "number"}},
+            ),
+            IndexModel([("production_runs.processed_boxes.arapack_lot", ASCENDING)]),
+        ]
 
     class Config:
         json_schema_extra = {
@@ -82,6 +93,7 @@ class ProgramPlanning(Document):
                     }
                 ],
                 "created_at": "2023-10-23T19:23:00",
-                "week_of_year": 20,
+                "iso_year": 2025,
+                "iso_week": 20,
             }
         }
@@ -2,8 +2,14 @@
 
 from typing import Optional, List
 from datetime import datetime
-from beanie import Document, Indexed
+from beanie import Document, Indexed, Insert, Replace, Save, before_event
 from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from utils.search import search_terms
+
+# Fields whose words are matched by the purchase search
+SEARCH_FIELDS = ("symbol", "order_number", "client", "arapack_lot")
 
 
 class DeliveryDate(BaseModel):
@@ -44,12 +50,45 @@ class Purchase(Document):
     delivery_delay_days: Optional[int] = 0
     created_at: datetime = datetime.now()
     week_of_year: Optional[int] = None
+    iso_year: Optional[int] = None
+    search_terms: List[str] = []  # Prefixes of the searchable words of the purchase
+
+    @before_event(Insert, Replace, Save)
+    def update_search_terms(self):
+        """Refresh the search terms from the searchable fields."""
+        self.search_terms = search_terms(
+            getattr(self, field) for field in SEARCH_FIELDS
+        )
 
     class Settings:
         """Settings for the Purchase model."""
 
         use_state_management = True
         name = "purchases"
+        indexes = [
+            # Listing sorted by receipt date, cursors and receipt date ranges
+            IndexModel([("receipt_date", DESCENDING), ("_id", DESCENDING)]),
+            # Purchases without delivery date, backorders sorted by delay
+            IndexModel([("estimated_delivery_date", ASCENDING), ("_id", ASCENDING)]),
+            # Purchases of a week, by status
+            IndexModel(
+                [
+                    ("iso_year", ASCENDING),
+                    ("week_of_year", ASCENDING),
+                    ("status", ASCENDING),
+                ]
+            ),
+            # Status filters, by delivery date
+            IndexModel([("status", ASCENDING), ("estimated_delivery_date", ASCENDING)]),
+            # Search by word prefix, sorted by receipt date
+            IndexModel(
+                [
+                    ("search_terms", ASCENDING),
+                    ("receipt_date", DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            ),
+        ]
 
     class Config:
         """Configuration for the Purchase model."""
@@ -0,0 +1,54 @@
+"""
+Repository for the cached AIResponse documents.
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+from models.ai_response import AIResponse
+
+
+class AIResponseRepository:
+    """AIResponse repository for MongoDB using Beanie ORM functions."""
+
+    @staticmethod
+    async def get_by_key(key: str) -> Optional[AIResponse]:
+        """
+        Get a cached response that has not expired.
+
+        :param key: The hash of the action type and input data.
+        :type key: str
+        :return: The AIResponse document, or None if not found or expired.
+        :rtype: Optional[AIResponse]
+        """
+        return await AIResponse.find_one(
+            {"key": key, "expires_at": {"$gt": datetime.now()}}
+        )
+
+    @staticmethod
+    async def save(key: str, action_type: str, response: str, ttl_seconds: int) -> None:
+        """
+        Create or replace the cached response of a key.
+
+        :param key: The hash of the action type and input data.
+        :type key: str
+        :param action_type: The action the prompt was built for.
+        :type action_type: str
+        :param response: The raw text returned by the AI model.
+        :type response: str
+        :param ttl_seconds: Seconds the response stays valid.
+        :type ttl_seconds: int
+        """
+        now = datetime.now()
+        await AIResponse.get_motor_collection().update_one(
+            {"key": key},
+            {
+                "$set": {
+                    "action_type": action_type,
+                    "response": response,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=ttl_seconds),
+                }
+            },
+            upsert=True,
+        )
@@ -6,7 +6,15 @@ from typing import List, Optional, Dict, Any, Mapping
 
 from beanie import PydanticObjectId
 
-from models.box import Box
+from models.box import SEARCH_FIELDS, Box
+from utils.pagination import facet_search_pipeline, facet_search_result, keyset_page
+from utils.search import search_filter, search_terms
+
+# Fields of the boxes counted by value in the search results
+FACET_FIELDS = ("client", "status", "flute", "ect")
+
+# Sort of the pages of boxes, ending in a unique field so it can be used as a cursor
+PAGE_SORT = [("symbol", 1), ("_id", 1)]
 
 
 class BoxRepository:
@@ -34,6 +42,18 @@ class BoxRepository:
         """
         return await Box.find_one(Box.symbol == symbol)
 
+    @staticmethod
+    async def get_by_symbols(symbols: List[str]) -> List[Box]:
+        """
+        Get the boxes matching a list of symbols in a single query.
+
+        :param symbols: The symbols of the boxes to retrieve.
+        :type symbols: List[str]
+        :return: List of Box documents found, in no particular order.
+        :rtype: List[Box]
+        """
+        return await Box.find({"symbol": {"$in": list(symbols)}}).to_list()
+
     @staticmethod
     async def get_by_id(id: PydanticObjectId) -> Optional[Box]:
         """
@@ -78,7 +98,12 @@ class BoxRepository:
 
         # Get the filtered boxes from the database
         collection = Box.get_motor_collection()
-        cursor = collection.find(filters).sort("symbol", 1).skip(offset).limit(limit)
+        cursor = (
+            collection.find(filters, {"search_terms": 0})
+            .sort("symbol", 1)
+            .skip(offset)
+            .limit(limit)
+        )
         boxes = await cursor.to_list(length=None)
 
         return boxes
@@ -97,6 +122,59 @@ class BoxRepository:
         total_count = await Box.find(filters).count()
         return total_count
 
+    @staticmethod
+    async def search(query: str, offset: int, limit: int) -> Dict[str, Any]:
+        """
+        Get a page of filtered boxes, their total count and their facet counts
+        in a single aggregation.
+
+        :param query: The search query to filter boxes.
+        :type query: str
+        :param offset: The number of records to skip.
+        :type offset: int
+        :param limit: The maximum number of records to return.
+        :type limit: int
+        :return: The items, total, pages and facets by client, status, flute and ECT.
+        :rtype: Dict[str, Any]
+        """
+        pipeline = facet_search_pipeline(
+            BoxRepository._create_search_filter(query),
+            sort=[("symbol", 1)],
+            offset=offset,
+            limit=limit,
+            facet_fields=FACET_FIELDS,
+            projection={"search_terms": 0},
+        )
+        collection = Box.get_motor_collection()
+        result = await collection.aggregate(pipeline).to_list(length=None)
+        return facet_search_result(result, limit)
+
+    @staticmethod
+    async def get_page_by_cursor(
+        query: str, limit: int, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a page of filtered boxes after or before a cursor, sorted by symbol.
+
+        :param query: The search query to filter boxes.
+        :type query: str
+        :param limit: The maximum number of records to return.
+        :type limit: int
+        :param cursor: A cursor returned with a previous page, None for the first page.
+        :type cursor: Optional[str]
+        :return: The boxes as items, and the next and previous cursors.
+        :rtype: Dict[str, Any]
+        :raises ValueError: If the cursor is not valid.
+        """
+        return await keyset_page(
+            Box.get_motor_collection(),
+            BoxRepository._create_search_filter(query),
+            sort=PAGE_SORT,
+            limit=limit,
+            cursor=cursor,
+            projection={"search_terms": 0},
+        )
+
     @staticmethod
     async def get_all_symbols() -> List[str]:
         """
@@ -126,26 +204,48 @@ class BoxRepository:
         box = await Box.get(box_id)
         if not box:
             return None
+        # Keep the search terms in line with the updated fields
+        values = {**box.model_dump(include=set(SEARCH_FIELDS)), **update_data}
+        update_data = {
+            **update_data,
+            "search_terms": search_terms(values.get(field) for field in SEARCH_FIELDS),
+        }
         await box.update({"$set": update_data})
         return await Box.get(box_id)
 
+    @staticmethod
+    async def backfill_search_terms() -> int:
+        """
+        Set the search terms of the boxes stored without them.
+
+        :return: The number of boxes updated.
+        :rtype: int
+        """
+        collection = Box.get_motor_collection()
+        cursor = collection.find(
+            {"search_terms": {"$exists": False}}, {field: 1 for field in SEARCH_FIELDS}
+        )
+        updated = 0
+        async for doc in cursor:
+            terms = search_terms(doc.get(field) for field in SEARCH_FIELDS)
+            await collection.update_one(
+                {"_id": doc["_id"]}, {"$set": {"search_terms": terms}}
+            )
+            updated += 1
+        return updated
+
     @staticmethod
     def _create_search_filter(query: str) -> dict:
         """
         Create a search filter for MongoDB queries.
 
+        Every word of the query must be the prefix of a word of the symbol, liner,
+        flute, client or status, matched through the multikey index of the search
+        terms. Numeric words also match the ECT by equality.
+
         :param query: La consulta de búsqueda.
         :type query: str
         :return: El filtro para consultas MongoDB.
         :rtype: dict
         """
-        return {
-            "$or": [
-                {"symbol": {"$regex": query, "$options": "i"}},
-                {"liner": {"$regex": query, "$options": "i"}},
-                {"flute": {"$regex": query, "$options": "i"}},
-                {"client": {"$regex": query, "$options": "i"}},
-                {"status": {"$regex": query, "$options": "i"}},
-                {"ect": {"$regex": query, "$options": "i"}},
-            ]
-        }
+        return search_filter(query, numeric_field="ect")
@@ -0,0 +1,101 @@
+"""
+Repository for the KpiRollup documents.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from pymongo import ASCENDING, UpdateOne
+
+from models.kpi_rollup import KpiRollup
+
+
+class KpiRollupRepository:
+    """KpiRollup repository for MongoDB using Beanie ORM functions."""
+
+    @staticmethod
+    async def apply(deltas: Dict[Tuple[str, str], Dict[str, float]]) -> None:
+        """
+        Add some amounts to the totals of their buckets, creating missing buckets.
+
+        :param deltas: The amounts to add by field, by (kind, key) bucket.
+        :type deltas: Dict[Tuple[str, str], Dict[str, float]]
+        """
+        if not deltas:
+            return
+        now = datetime.now()
+        await KpiRollup.get_motor_collection().bulk_write(
+            [
+                UpdateOne(
+                    {"kind": kind, "key": key},
+                    {"$inc": amounts, "$set": {"updated_at": now}},
+                    upsert=True,
+                )
+                for (kind, key), amounts in deltas.items()
+            ],
+            ordered=False,
+        )
+
+    @staticmethod
+    async def get_range(
+        kind: str, start: Optional[str] = None, end: Optional[str] = None
+    ) -> List[KpiRollup]:
+        """
+        Get the buckets of a kind within a range of keys.
+
+        :param kind: The kind of the buckets.
+        :type kind: str
+        :param start: The first key included, unbounded if None.
+        :type start: Optional[str]
+        :param end: The first key excluded, unbounded if None.
+        :type end: Optional[str]
+        :return: The KpiRollup documents, sorted by key.
+        :rtype: List[KpiRollup]
+        """
+        filters: Dict[str, object] = {"kind": kind}
+        key = {}
+        if start is not None:
+            key["$gte"] = start
+        if end is not None:
+            key["$lt"] = end
+        if key:
+            filters["key"] = key
+        return await KpiRollup.find(filters).sort("key").to_list()
+
+    @staticmethod
+    async def count() -> int:
+        """
+        Get the number of buckets.
+
+        :return: The number of KpiRollup documents.
+        :rtype: int
+        """
+        return await KpiRollup.find_all().count()
+
+    @staticmethod
+    async def replace(totals: Dict[Tuple[str, str], Dict[str, float]]) -> None:
+        """
+        Replace every bucket with new totals.
+
+        The buckets are written to a staging collection swapped in with a rename,
+        so the rollups are never read empty or half written.
+
+        :param totals: The amounts by field, by (kind, key) bucket.
+        :type totals: Dict[Tuple[str, str], Dict[str, float]]
+        """
+        collection = KpiRollup.get_motor_collection()
+        staging = collection.database[f"{collection.name}_rebuild_{uuid4().hex}"]
+        await staging.create_index(
+            [("kind", ASCENDING), ("key", ASCENDING)], unique=True
+        )
+        now = datetime.now()
+        if totals:
+            await staging.insert_many(
+                [
+                    {"kind": kind, "key": key, **amounts, "updated_at": now}
+                    for (kind, key), amounts in totals.items()
+                ],
+                ordered=False,
+            )
+        await staging.rename(collection.name, dropTarget=True)
@@ -0,0 +1,386 @@
+"""
+Repository for PlanningJob documents and the per-week planning locks.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
+
+from models.planning_job import PlanningJob
+from utils.iso_week import IsoWeek, resolve_week
+
+
+class PlanningJobRepository:
+    """PlanningJob repository for MongoDB using Beanie ORM functions."""
+
+    @staticmethod
+    async def create(job: PlanningJob) -> PlanningJob:
+        """
+        Create a new planning job in the database.
+
+        :param job: The PlanningJob document to create.
+        :type job: PlanningJob
+        :return: The created PlanningJob document.
+        :rtype: PlanningJob
+        """
+        return await job.create()
+
+    @staticmethod
+    async def get_by_id(job_id: PydanticObjectId) -> Optional[PlanningJob]:
+        """
+        Get a planning job by its ID.
+
+        :param job_id: The ID of the job to retrieve.
+        :type job_id: PydanticObjectId
+        :return: The PlanningJob document, or None if not found.
+        :rtype: Optional[PlanningJob]
+        """
+        return await PlanningJob.get(job_id)
+
+    @staticmethod
+    async def get_by_arapack_lot(arapack_lot: str) -> List[PlanningJob]:
+        """
+        Get the planning jobs of a purchase, newest first.
+
+        :param arapack_lot: The arapack lot of the purchase.
+        :type arapack_lot: str
+        :return: List of PlanningJob documents of the purchase.
+        :rtype: List[PlanningJob]
+        """
+        return (
+            await PlanningJob.find({"payload.arapack_lot": arapack_lot})
+            .sort("-created_at")
+            .to_list()
+        )
+
+    @staticmethod
+    async def get_pending_weeks(limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Get the weeks with pending jobs, the week of the oldest job first.
+
+        :param limit: The maximum number of weeks to return.
+        :type limit: int
+        :return: List of dictionaries with the ISO (year, week), the creation date
+            of its oldest pending job and its number of pending jobs.
+        :rtype: List[Dict[str, Any]]
+        """
+        collection = PlanningJob.get_motor_collection()
+        cursor = collection.aggregate(
+            [
+                {"$match": {"status": "PENDING"}},
+                {
+                    "$group": {
+                        "_id": {"year": "$iso_year", "week": "$iso_week"},
+                        "oldest": {"$min": "$created_at"},
+                        "count": {"$sum": 1},
+                    }
+                },
+                {"$sort": {"oldest": 1}},
+                {"$limit": limit},
+            ]
+        )
+        weeks: Dict[IsoWeek, Dict[str, Any]] = {}
+        for group in await cursor.to_list(length=None):
+            # Jobs of old versions have no ISO year, they join the nearest one
+            week = PlanningJobRepository.job_week(
+                group["_id"].get("year"), group["_id"]["week"]
+            )
+            pending = weeks.setdefault(
+                week, {"week": week, "oldest": group["oldest"], "count": 0}
+            )
+            pending["oldest"] = min(pending["oldest"], group["oldest"])
+            pending["count"] += group["count"]
+        return sorted(weeks.values(), key=lambda pending: pending["oldest"])
+
+    @staticmethod
+    async def get_pending_by_week(
+        week: IsoWeek, limit: Optional[int] = None
+    ) -> List[PlanningJob]:
+        """
+        Get the pending jobs of a week in creation order.
+
+        :param week: The ISO year and week.
+        :type week: IsoWeek
+        :param limit: The maximum number of jobs to return.
+        :type limit: Optional[int]
+        :return: List of pending PlanningJob documents.
+        :rtype: List[PlanningJob]
+        """
+        year, number = week
+        query = PlanningJob.find(
+            {
+                "iso_year": {"$in": [year, None]},
+                "iso_week": number,
+                "status": "PENDING",
+            }
+        ).sort("created_at")
+        if limit:
+            query = query.limit(limit)
+        jobs = await query.to_list()
+        return [job for job in jobs if PlanningJobRepository.week_of_job(job) == week]
+
+    @staticmethod
+    def job_week(iso_year: Optional[int], week: int) -> IsoWeek:
+        """
+        Get the ISO week of a job from its fields.
+
+        :param iso_year: The ISO year of the job, None on jobs of old versions.
+        :type iso_year: Optional[int]
+        :param week: The ISO week number of the job.
+        :type week: int
+        :return: The ISO year and week, in the nearest year if the job has none.
+        :rtype: IsoWeek
+        """
+        return (iso_year, week) if iso_year else resolve_week(week)
+
+    @staticmethod
+    def week_of_job(job: PlanningJob) -> IsoWeek:
+        """
+        Get the ISO week whose plan a job updates.
+
+        :param job: The planning job.
+        :type job: PlanningJob
+        :return: The ISO year and week.
+        :rtype: IsoWeek
+        """
+        return PlanningJobRepository.job_week(job.iso_year, job.iso_week)
+
+    @staticmethod
+    async def rename_week_fields() -> int:
+        """
+        Move the ISO week of the jobs stored as week_of_year to iso_week.
+
+        :return: The number of jobs updated.
+        :rtype: int
+        """
+        result = await PlanningJob.get_motor_collection().update_many(
+            {"week_of_year": {"$exists": True}},
+            {"$rename": {"week_of_year": "iso_week"}},
+        )
+        return result.modified_count
+
+    @staticmethod
+    async def count_by_status() -> Dict[str, int]:
+        """
+        Count the planning jobs of each status.
+
+        :return: The number of jobs by status.
+        :rtype: Dict[str, int]
+        """
+        collection = PlanningJob.get_motor_collection()
+        cursor = collection.aggregate(
+            [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        )
+        return {
+            group["_id"]: group["count"] for group in await cursor.to_list(length=None)
+        }
+
+    @staticmethod
+    async def mark_running(jobs: List[PlanningJob], owner: str) -> List[PlanningJob]:
+        """
+        Mark pending jobs as running, skipping the ones taken in the meantime.
+
+        :param jobs: The jobs to claim.
+        :type jobs: List[PlanningJob]
+        :param owner: The identifier of the worker claiming the jobs.
+        :type owner: str
+        :return: The jobs that were claimed.
+        :rtype: List[PlanningJob]
+        """
+        collection = PlanningJob.get_motor_collection()
+        claimed = []
+        for job in jobs:
+            result = await collection.update_one(
+                {"_id": job.id, "status": "PENDING"},
+                {
+                    "$set": {
+                        "status": "RUNNING",
+                        "owner": owner,
+                        "updated_at": datetime.now(),
+                    },
+                    "$inc": {"attempts": 1},
+                },
+            )
+            if result.modified_count:
+                job.status = "RUNNING"
+                job.owner = owner
+                job.attempts += 1
+                claimed.append(job)
+        return claimed
+
+    @staticmethod
+    async def renew(jobs: List[PlanningJob], owner: str) -> None:
+        """
+        Extend the lease of the running jobs of a worker.
+
+        :param jobs: The jobs being processed.
+        :type jobs: List[PlanningJob]
+        :param owner: The identifier of the worker running the jobs.
+        :type owner: str
+        """
+        collection = PlanningJob.get_motor_collection()
+        await collection.update_many(
+            {
+                "_id": {"$in": [job.id for job in jobs]},
+                "status": "RUNNING",
+                "owner": owner,
+            },
+            {"$set": {"updated_at": datetime.now()}},
+        )
+
+    @staticmethod
+    async def finish(
+        job: PlanningJob,
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+    ) -> bool:
+        """
+        Record the outcome of a job, unless another worker took it in the meantime.
+
+        :param job: The job to update.
+        :type job: PlanningJob
+        :param status: The new status of the job.
+        :type status: str
+        :param result: The summary of the planning pass.
+        :type result: Optional[Dict[str, Any]]
+        :param error: The error raised while processing the job.
+        :type error: Optional[str]
+        :return: True if the outcome was recorded.
+        :rtype: bool
+        """
+        collection = PlanningJob.get_motor_collection()
+        update = await collection.update_one(
+            {"_id": job.id, "status": "RUNNING", "owner": job.owner},
+            {
+                "$set": {
+                    "status": status,
+                    "owner": None,
+                    "result": result,
+                    "error": error,
+                    "updated_at": datetime.now(),
+                }
+            },
+        )
+        return bool(update.modified_count)
+
+    @staticmethod
+    async def requeue_stale(lock_seconds: int) -> int:
+        """
+        Return to the queue the running jobs whose worker stopped renewing them.
+
+        :param lock_seconds: Seconds without renewal after which a running job is
+            considered abandoned.
+        :type lock_seconds: int
+        :return: The number of jobs requeued.
+        :rtype: int
+        """
+        collection = PlanningJob.get_motor_collection()
+        result = await collection.update_many(
+            {
+                "status": "RUNNING",
+                "updated_at": {"$lt": datetime.now() - timedelta(seconds=lock_seconds)},
+            },
+            {
+                "$set": {
+                    "status": "PENDING",
+                    "owner": None,
+                    "updated_at": datetime.now(),
+                }
+            },
+        )
+        return result.modified_count
+
+    @staticmethod
+    async def acquire_week_locks(
+        weeks: List[IsoWeek], owner: str, lock_seconds: int
+    ) -> bool:
+        """
+        Take the locks of some weeks, or none of them if one is held by another owner.
+
+        :param weeks: The ISO (year, week) pairs to lock.
+        :type weeks: List[IsoWeek]
+        :param owner: The identifier of the worker taking the locks.
+        :type owner: str
+        :param lock_seconds: Seconds after which an unreleased lock expires.
+        :type lock_seconds: int
+        :return: True if all the locks were taken.
+        :rtype: bool
+        """
+        locks = PlanningJobRepository._locks_collection()
+        now = datetime.now()
+        acquired = []
+        for week in sorted(set(weeks)):
+            try:
+                await locks.update_one(
+                    {
+                        "_id": PlanningJobRepository._lock_id(week),
+                        "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}],
+                    },
+                    {
+                        "$set": {
+                            "owner": owner,
+                            "expires_at": now + timedelta(seconds=lock_seconds),
+                        }
+                    },
+                    upsert=True,
+                )
+                acquired.append(week)
+            except DuplicateKeyError:
+                await PlanningJobRepository.release_week_locks(acquired, owner)
+                return False
+        return True
+
+    @staticmethod
+    async def renew_week_locks(
+        weeks: List[IsoWeek], owner: str, lock_seconds: int
+    ) -> bool:
+        """
+        Extend the locks of some weeks still held by a worker, never taking new ones.
+
+        :param weeks: The ISO (year, week) pairs locked by the worker.
+        :type weeks: List[IsoWeek]
+        :param owner: The identifier of the worker holding the locks.
+        :type owner: str
+        :param lock_seconds: Seconds after which an unreleased lock expires.
+        :type lock_seconds: int
+        :return: True if the worker still held every lock.
+        :rtype: bool
+        """
+        locks = PlanningJobRepository._locks_collection()
+        ids = list({PlanningJobRepository._lock_id(week) for week in weeks})
+        result = await locks.update_many(
+            {"_id": {"$in": ids}, "owner": owner},
+            {"$set": {"expires_at": datetime.now() + timedelta(seconds=lock_seconds)}},
+        )
+        return result.matched_count == len(ids)
+
+    @staticmethod
+    async def release_week_locks(weeks: List[IsoWeek], owner: str) -> None:
+        """
+        Release the locks of some weeks held by a worker.
+
+        :param weeks: The ISO (year, week) pairs to unlock.
+        :type weeks: List[IsoWeek]
+        :param owner: The identifier of the worker holding the locks.
+        :type owner: str
+        """
+        locks = PlanningJobRepository._locks_collection()
+        await locks.delete_many(
+            {
+                "_id": {"$in": [PlanningJobRepository._lock_id(w) for w in weeks]},
+                "owner": owner,
+            }
+        )
+
+    @staticmethod
+    def _lock_id(week: IsoWeek) -> str:
+        """Get the ID of the lock of an ISO week, such as 2025-W07."""
+        return f"{week[0]}-W{week[1]:02d}"
+
+    @staticmethod
+    def _locks_collection():
+        """Get the collection holding one lock document per week being planned."""
+        return PlanningJob.get_motor_collection().database["planning_locks"]
@@ -1,6 +1,19 @@
-from typing import List
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, Any, List, Optional, Set, Tuple
 
-from models.program_planning import ProgramPlanning
+from pymongo.errors import DuplicateKeyError
+
+from config.logging import logger
+from models.program_planning import ProgramPlanning, ProductionRun
+from utils.iso_week import (
+    IsoWeek,
+    WeekRef,
+    iso_week,
+    resolve_week,
+    week_filter,
+    week_range,
+)
 
 
 class ProgramPlanningRepository:
@@ -9,12 +22,229 @@ class ProgramPlanningRepository:
     """
 
     @staticmethod
-    async def get_by_week(week: int) -> ProgramPlanning:
+    async def get_by_week(week: WeekRef) -> ProgramPlanning:
         """
         Get all production runs for a specific week.
-        :param week: The week number to filter by.
-        :type week: Int
+        :param week: The ISO (year, week) to filter by, or a week number of the
+            nearest year.
+        :type week: WeekRef
         :return: List of ProgramPlanning documents for the specified week.
         :rtype: List[ProgramPlanning]
         """
-        return await ProgramPlanning.find_one({"week_of_year": week})
+        return await ProgramPlanning.find_one(week_filter(week))
+
+    @staticmethod
+    async def get_range(start: IsoWeek, weeks: int) -> List[ProgramPlanning]:
+        """
+        Get the program plannings of consecutive weeks in one read.
+        :param start: The ISO (year, week) of the first week.
+        :type start: IsoWeek
+        :param weeks: The number of weeks.
+        :type weeks: int
+        :return: The program plannings that exist, ordered by week.
+        :rtype: List[ProgramPlanning]
+        """
+        clauses = [
+            {"iso_year": year, "iso_week": {"$in": [week for _, week in group]}}
+            for year, group in groupby(week_range(start, weeks), key=lambda w: w[0])
+        ]
+        if not clauses:
+            return []
+        return (
+            await ProgramPlanning.find({"$or": clauses})
+            .sort([("iso_year", 1), ("iso_week", 1)])
+            .to_list()
+        )
+
+    @staticmethod
+    async def get_planned_lots(arapack_lots: List[str]) -> Set[str]:
+        """
+        Get the purchases that already have runs in any week.
+        :param arapack_lots: The arapack lots of the purchases.
+        :type arapack_lots: List[str]
+        :return: The arapack lots found in a program planning.
+        :rtype: Set[str]
+        """
+        if not arapack_lots:
+            return set()
+        collection = ProgramPlanning.get_motor_collection()
+        found = await collection.distinct(
+            "production_runs.processed_boxes.arapack_lot",
+            {"production_runs.processed_boxes.arapack_lot": {"$in": arapack_lots}},
+        )
+        return set(found) & set(arapack_lots)
+
+    @staticmethod
+    async def get_run(week: WeekRef, index: int) -> Optional[ProductionRun]:
+        """
+        Get a single production run of a week without loading the others.
+        :param week: The ISO (year, week) of the program planning.
+        :type week: WeekRef
+        :param index: The position of the run in the week.
+        :type index: int
+        :return: The production run, or None if it does not exist.
+        :rtype: Optional[ProductionRun]
+        """
+        collection = ProgramPlanning.get_motor_collection()
+        document = await collection.find_one(
+            week_filter(week),
+            {"production_runs": {"$slice": [index, 1]}},
+        )
+        if not document or not document.get("production_runs") or index < 0:
+            return None
+        return ProductionRun.model_validate(document["production_runs"][0])
+
+    @staticmethod
+    async def find_runs_with_lot(
+        week: WeekRef, arapack_lot: str
+    ) -> List[Tuple[int, ProductionRun]]:
+        """
+        Get the production runs of a week that process a purchase.
+        :param week: The ISO (year, week) of the program planning.
+        :type week: WeekRef
+        :param arapack_lot: The arapack lot of the purchase.
+        :type arapack_lot: str
+        :return: Pairs of (position, run) for each run containing the purchase.
+        :rtype: List[Tuple[int, ProductionRun]]
+        """
+        collection = ProgramPlanning.get_motor_collection()
+        document = await collection.find_one(
+            {
+                **week_filter(week),
+                "production_runs.processed_boxes.arapack_lot": arapack_lot,
+            },
+            {"production_runs": 1},
+        )
+        if not document:
+            return []
+        return [
+            (index, ProductionRun.model_validate(run))
+            for index, run in enumerate(document.get("production_runs") or [])
+            if any(
+                box.get("arapack_lot") == arapack_lot
+                for box in run.get("processed_boxes", [])
+            )
+        ]
+
+    @staticmethod
+    async def push_runs(
+        week: WeekRef, runs: List[Dict[str, Any]], position: Optional[int] = None
+    ) -> None:
+        """
+        Append production runs to a week, creating the program planning if needed.
+        :param week: The ISO (year, week) of the program planning.
+        :type week: WeekRef
+        :param runs: The serialized runs to add.
+        :type runs: List[Dict[str, Any]]
+        :param position: The position to insert the runs at, or None to append them.
+        :type position: Optional[int]
+        """
+        push: Dict[str, Any] = {"$each": runs}
+        if position is not None:
+            push["$position"] = position
+
+        collection = ProgramPlanning.get_motor_collection()
+        await collection.update_one(
+            week_filter(week),
+            {
+                "$push": {"production_runs": push},
+                "$setOnInsert": {"created_at": datetime.now()},
+            },
+            upsert=True,
+        )
+
+    @staticmethod
+    async def set_runs(week: WeekRef, runs: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Replace some production runs of a week in place.
+        :param week: The ISO (year, week) of the program planning.
+        :type week: WeekRef
+        :param runs: The serialized runs keyed by their position in the week.
+        :type runs: Dict[int, Dict[str, Any]]
+        """
+        if not runs:
+            return
+        collection = ProgramPlanning.get_motor_collection()
+        await collection.update_one(
+            week_filter(week),
+            {"$set": {f"production_runs.{index}": run for index, run in runs.items()}},
+        )
+
+    @staticmethod
+    async def remove_runs(week: WeekRef, indexes: List[int]) -> None:
+        """
+        Remove some production runs of a week.
+        :param week: The ISO (year, week) of the program planning.
+        :type week: WeekRef
+        :param indexes: The positions of the runs to remove.
+        :type indexes: List[int]
+        """
+        if not indexes:
+            return
+        # Positions of the runs kept, in order
+        kept = {
+            "$filter": {
+                "input": {"$range": [0, {"$size": "$production_runs"}]},
+                "as": "index",
+                "cond": {"$not": [{"$in": ["$$index", list(indexes)]}]},
+            }
+        }
+        # A single pipeline update, so readers never see the array with gaps
+        collection = ProgramPlanning.get_motor_collection()
+        await collection.update_one(
+            week_filter(week),
+            [
+                {
+                    "$set": {
+                        "production_runs": {
+                            "$map": {
+                                "input": kept,
+                                "as": "index",
+                                "in": {"$arrayElemAt": ["$production_runs", "$$index"]},
+                            }
+                        }
+                    }
+                }
+            ],
+        )
+
+    @staticmethod
+    async def backfill_iso_weeks() -> int:
+        """
+        Set the ISO year and week of the program plannings stored without them.
+
+        The year is the one of the first run scheduled in the week, or the one
+        nearest to the creation of the program planning.
+
+        :return: The number of program plannings updated.
+        :rtype: int
+        """
+        collection = ProgramPlanning.get_motor_collection()
+        cursor = collection.find(
+            {"iso_year": None, "week_of_year": {"$gt": 0}},
+            {"week_of_year": 1, "created_at": 1, "production_runs.scheduled_date": 1},
+        )
+        updated = 0
+        async for doc in cursor:
+            week = doc["week_of_year"]
+            scheduled = [
+                iso_week(run.get("scheduled_date"))
+                for run in doc.get("production_runs") or []
+            ]
+            year, week = next(
+                (found for found in scheduled if found and found[1] == week),
+                resolve_week(week, (doc.get("created_at") or datetime.now()).date()),
+            )
+            try:
+                await collection.update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {"iso_year": year, "iso_week": week}},
+                )
+            except DuplicateKeyError:
+                logger.warning(
+                    f"Program planning {doc['_id']} left without ISO week, "
+                    f"another one already holds {year}-W{week:02d}"
+                )
+                continue
+            updated += 1
+        return updated
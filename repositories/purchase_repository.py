@@ -2,11 +2,39 @@
 Repository for Purchase documents in the database.
 """
 
-from typing import List
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from models.box import Box
-from models.purchase import Purchase
+from models.purchase import SEARCH_FIELDS, Purchase
 from models.sheet import Sheet
+from utils.pagination import facet_search_pipeline, facet_search_result, keyset_page
+from utils.search import search_filter, search_terms
+
+# Fields of the purchases counted by value in the search results
+FACET_FIELDS = ("client", "status", "flute", "ect")
+
+# Sort of the pages of purchases, ending in a unique field so it can be used as a cursor
+PAGE_SORT = [("receipt_date", -1), ("_id", -1)]
+
+# Buckets of the purchase KPIs, by the receipt date or the client
+KPI_GROUPS = {
+    "month": {
+        "year": {"$year": "$receipt_date"},
+        "month": {"$month": "$receipt_date"},
+    },
+    "week": {
+        "year": {"$isoWeekYear": "$receipt_date"},
+        "week": {"$isoWeek": "$receipt_date"},
+    },
+    "client": {"client": "$client"},
+}
+
+# Sorts of the backorders by delay, ending in a unique field so they can be used as cursors
+BACKORDER_SORTS = {
+    "desc": [("estimated_delivery_date", 1), ("_id", 1)],
+    "asc": [("estimated_delivery_date", -1), ("_id", -1)],
+}
 
 
 class PurchaseRepository:
@@ -36,18 +64,14 @@ class PurchaseRepository:
         query: str, offset: int, limit: int
     ) -> List[Purchase]:
         # Filtro de búsqueda
-        filters = {
-            "$or": [
-                {"symbol": {"$regex": query, "$options": "i"}},
-                {"order_number": {"$regex": query, "$options": "i"}},
-                {"client": {"$regex": query, "$options": "i"}},
-                {"arapack_lot": {"$regex": query, "$options": "i"}},
-            ]
-        }
+        filters = PurchaseRepository._create_search_filter(query)
 
         collection = Purchase.get_motor_collection()
         cursor = (
-            collection.find(filters).sort("receipt_date", -1).skip(offset).limit(limit)
+            collection.find(filters, {"search_terms": 0})
+            .sort("receipt_date", -1)
+            .skip(offset)
+            .limit(limit)
         )
         # purchases = await Purchase.find(filters).sort("receipt_date", 1).skip(offset).limit(limit).to_list()
         purchases = await cursor.to_list(length=None)
@@ -64,18 +88,105 @@ class PurchaseRepository:
         :return: The total count of filtered purchases.
         :rtype: int
         """
-        filters = {
-            "$or": [
-                {"symbol": {"$regex": query, "$options": "i"}},
-                {"order_number": {"$regex": query, "$options": "i"}},
-                {"client": {"$regex": query, "$options": "i"}},
-                {"arapack_lot": {"$regex": query, "$options": "i"}},
-            ]
-        }
+        filters = PurchaseRepository._create_search_filter(query)
 
         total_count = await Purchase.find(filters).count()
         return total_count
 
+    @staticmethod
+    async def search(query: str, offset: int, limit: int) -> Dict[str, Any]:
+        """
+        Get a page of filtered purchases, their total count and their facet counts
+        in a single aggregation.
+
+        :param query: The search query to filter purchases.
+        :type query: str
+        :param offset: The number of records to skip.
+        :type offset: int
+        :param limit: The maximum number of records to return.
+        :type limit: int
+        :return: The items, total, pages and facets by client, status, flute and ECT.
+        :rtype: Dict[str, Any]
+        """
+        pipeline = facet_search_pipeline(
+            PurchaseRepository._create_search_filter(query),
+            sort=[("receipt_date", -1)],
+            offset=offset,
+            limit=limit,
+            facet_fields=FACET_FIELDS,
+            projection={"search_terms": 0},
+        )
+        collection = Purchase.get_motor_collection()
+        result = await collection.aggregate(pipeline).to_list(length=None)
+        return facet_search_result(result, limit)
+
+    @staticmethod
+    async def get_page_by_cursor(
+        query: str, limit: int, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a page of filtered purchases after or before a cursor, sorted by newest receipt date.
+
+        :param query: The search query to filter purchases.
+        :type query: str
+        :param limit: The maximum number of records to return.
+        :type limit: int
+        :param cursor: A cursor returned with a previous page, None for the first page.
+        :type cursor: Optional[str]
+        :return: The purchases as items, and the next and previous cursors.
+        :rtype: Dict[str, Any]
+        :raises ValueError: If the cursor is not valid.
+        """
+        return await keyset_page(
+            Purchase.get_motor_collection(),
+            PurchaseRepository._create_search_filter(query),
+            sort=PAGE_SORT,
+            limit=limit,
+            cursor=cursor,
+            projection={"search_terms": 0},
+        )
+
+    @staticmethod
+    async def get_kpis(
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        group_by: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the invoice, kilograms and count of the purchases received in a range,
+        summed in a single aggregation.
+
+        :param start: The first receipt date included, unbounded if None.
+        :type start: Optional[datetime]
+        :param end: The first receipt date excluded, unbounded if None.
+        :type end: Optional[datetime]
+        :param group_by: "month", "week" or "client", a single total if None.
+        :type group_by: Optional[str]
+        :return: The fields of each bucket with its invoice, kilograms and count,
+            sorted by bucket.
+        :rtype: List[Dict[str, Any]]
+        """
+        receipt_date = {}
+        if start:
+            receipt_date["$gte"] = start
+        if end:
+            receipt_date["$lt"] = end
+        pipeline = [
+            {"$match": {"receipt_date": receipt_date} if receipt_date else {}},
+            {
+                "$group": {
+                    "_id": KPI_GROUPS[group_by] if group_by else None,
+                    "invoice": {"$sum": "$total_invoice"},
+                    "kilograms": {"$sum": "$total_kilograms"},
+                    "count": {"$sum": 1},
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ]
+        collection = Purchase.get_motor_collection()
+        result = await collection.aggregate(pipeline).to_list(length=None)
+        return [{**(bucket.pop("_id") or {}), **bucket} for bucket in result]
+
     @staticmethod
     async def create(purchase: Purchase):
         """
@@ -87,6 +198,85 @@ class PurchaseRepository:
         """
         return await purchase.create()
 
+    @staticmethod
+    async def backfill_iso_years() -> int:
+        """
+        Set the ISO year of the purchases stored with only their week of the year.
+        :return: The number of purchases updated.
+        :rtype: int
+        """
+        collection = Purchase.get_motor_collection()
+        result = await collection.update_many(
+            {"iso_year": None, "estimated_delivery_date": {"$ne": None}},
+            [{"$set": {"iso_year": {"$isoWeekYear": "$estimated_delivery_date"}}}],
+        )
+        return result.modified_count
+
+    @staticmethod
+    async def backfill_search_terms() -> int:
+        """
+        Set the search terms of the purchases stored without them.
+        :return: The number of purchases updated.
+        :rtype: int
+        """
+        collection = Purchase.get_motor_collection()
+        cursor = collection.find(
+            {"search_terms": {"$exists": False}}, {field: 1 for field in SEARCH_FIELDS}
+        )
+        updated = 0
+        async for doc in cursor:
+            terms = search_terms(doc.get(field) for field in SEARCH_FIELDS)
+            await collection.update_one(
+                {"_id": doc["_id"]}, {"$set": {"search_terms": terms}}
+            )
+            updated += 1
+        return updated
+
+    @staticmethod
+    async def get_open_by_delivery(start: datetime, end: datetime) -> List[Purchase]:
+        """
+        Get the purchases due in a range that still have a quantity to produce.
+        :param start: The first delivery date included.
+        :type start: datetime
+        :param end: The first delivery date excluded.
+        :type end: datetime
+        :return: The open purchases, by delivery date.
+        :rtype: List[Purchase]
+        """
+        return (
+            await Purchase.find(
+                {
+                    "estimated_delivery_date": {"$gte": start, "$lt": end},
+                    "status": {"$ne": "CANCELED"},
+                    "missing_quantity": {"$gt": 0},
+                }
+            )
+            .sort([("estimated_delivery_date", 1), ("_id", 1)])
+            .to_list()
+        )
+
+    @staticmethod
+    async def get_delivery_dates(arapack_lots: List[str]) -> Dict[str, datetime]:
+        """
+        Get the delivery dates of some purchases.
+        :param arapack_lots: The arapack lots of the purchases.
+        :type arapack_lots: List[str]
+        :return: The delivery dates keyed by arapack lot, purchases without one are left out.
+        :rtype: Dict[str, datetime]
+        """
+        collection = Purchase.get_motor_collection()
+        documents = await collection.find(
+            {
+                "arapack_lot": {"$in": arapack_lots},
+                "estimated_delivery_date": {"$ne": None},
+            },
+            {"arapack_lot": 1, "estimated_delivery_date": 1},
+        ).to_list(None)
+        return {
+            document["arapack_lot"]: document["estimated_delivery_date"]
+            for document in documents
+        }
+
     @staticmethod
     async def get_null_delivery_dates():
         """
@@ -95,3 +285,148 @@ class PurchaseRepository:
         :rtype: List[Purchase]
         """
         return await Purchase.find({"estimated_delivery_date": None}).to_list()
+
+    @staticmethod
+    async def get_backorders_page(
+        limit: int, cursor: Optional[str] = None, order: str = "desc"
+    ) -> Dict[str, Any]:
+        """
+        Get a page of backorders after or before a cursor.
+
+        :param limit: The maximum number of records to return.
+        :type limit: int
+        :param cursor: A cursor returned with a previous page, None for the first page.
+        :type cursor: Optional[str]
+        :param order: "desc" for the most delayed first, "asc" for the least delayed.
+        :type order: str
+        :return: The backorders as items, and the next and previous cursors.
+        :rtype: Dict[str, Any]
+        :raises ValueError: If the cursor is not valid.
+        """
+        now = datetime.now()
+        return await keyset_page(
+            Purchase.get_motor_collection(),
+            PurchaseRepository._backorder_filter(now),
+            sort=BACKORDER_SORTS[order],
+            limit=limit,
+            cursor=cursor,
+            projection=PurchaseRepository._backorder_projection(now),
+        )
+
+    @staticmethod
+    async def iter_backorders(order: str = "desc") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Iterate over all the backorders, fetched from the database in batches.
+
+        :param order: "desc" for the most delayed first, "asc" for the least delayed.
+        :type order: str
+        :return: The backorders, one at a time.
+        :rtype: AsyncIterator[Dict[str, Any]]
+        """
+        now = datetime.now()
+        cursor = (
+            Purchase.get_motor_collection()
+            .find(
+                PurchaseRepository._backorder_filter(now),
+                PurchaseRepository._backorder_projection(now),
+            )
+            .sort(BACKORDER_SORTS[order])
+            .batch_size(500)
+        )
+        async for backorder in cursor:
+            yield backorder
+
+    @staticmethod
+    async def get_backorder_totals(since: datetime, now: datetime) -> Dict[str, int]:
+        """
+        Get the number and missing quantity of the backorders due since a moment.
+
+        :param since: The first estimated delivery date included.
+        :type since: datetime
+        :param now: The current date, the first estimated delivery date excluded.
+        :type now: datetime
+        :return: The count and missing quantity of the backorders.
+        :rtype: Dict[str, int]
+        """
+        filters = PurchaseRepository._backorder_filter(now)
+        filters["estimated_delivery_date"] = {"$gte": since, "$lt": now}
+        pipeline = [
+            {"$match": filters},
+            {
+                "$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "missing_quantity": {
+                        "$sum": {"$ifNull": ["$missing_quantity", 0]}
+                    },
+                }
+            },
+        ]
+        result = await Purchase.get_motor_collection().aggregate(pipeline).to_list(
+            length=None
+        )
+        totals = result[0] if result else {}
+        return {
+            "count": totals.get("count", 0),
+            "missing_quantity": totals.get("missing_quantity", 0),
+        }
+
+    @staticmethod
+    def _backorder_filter(now: datetime) -> dict:
+        """
+        Create the filter of the backorders: purchases not canceled, past their
+        estimated delivery date, without deliveries or with an unfinished one.
+
+        :param now: The current date.
+        :type now: datetime
+        :return: The filter for MongoDB queries.
+        :rtype: dict
+        """
+        return {
+            "estimated_delivery_date": {"$lt": now},
+            "status": {"$ne": "CANCELED"},
+            "$or": [
+                {"delivery_dates.0": {"$exists": False}},
+                {"delivery_dates": {"$elemMatch": {"finish_shipping_date": None}}},
+            ],
+        }
+
+    @staticmethod
+    def _backorder_projection(now: datetime) -> dict:
+        """
+        Create the projection of the backorders, with their delay in days.
+
+        :param now: The current date.
+        :type now: datetime
+        :return: The projection for MongoDB queries.
+        :rtype: dict
+        """
+        return {
+            "arapack_lot": 1,
+            "estimated_delivery_date": 1,
+            "quantity": 1,
+            "missing_quantity": {"$ifNull": ["$missing_quantity", 0]},
+            "delivery_delay_days": {
+                "$dateDiff": {
+                    "startDate": "$estimated_delivery_date",
+                    "endDate": now,
+                    "unit": "day",
+                }
+            },
+        }
+
+    @staticmethod
+    def _create_search_filter(query: str) -> dict:
+        """
+        Create a search filter for MongoDB queries.
+
+        Every word of the query must be the prefix of a word of the symbol, order
+        number, client or lot, matched through the multikey index of the search
+        terms.
+
+        :param query: The search query.
+        :type query: str
+        :return: The filter matching the symbol, order number, client or lot.
+        :rtype: dict
+        """
+        return search_filter(query)
@@ -0,0 +1,145 @@
+"""
+Check of the query plans of the main queries against the declared indexes.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Type
+
+from beanie import Document
+
+from config.logging import logger
+from models.box import Box
+from models.program_planning import ProgramPlanning
+from models.purchase import Purchase
+from repositories.box_repository import BoxRepository
+from repositories.purchase_repository import (
+    BACKORDER_SORTS,
+    PAGE_SORT,
+    PurchaseRepository,
+)
+from utils.iso_week import week_filter
+
+# Documents examined per document returned above which a query is reported
+MAX_EXAMINED_RATIO = 10
+
+# Main queries as (name, model, filter, sort), with sample values
+MAIN_QUERIES: List[
+    Tuple[str, Type[Document], Mapping[str, Any], Optional[List[Tuple[str, int]]]]
+] = [
+    ("purchases by lot", Purchase, {"arapack_lot": "0"}, None),
+    ("purchase listing", Purchase, {}, PAGE_SORT),
+    (
+        "purchase search",
+        Purchase,
+        PurchaseRepository._create_search_filter("0"),
+        PAGE_SORT,
+    ),
+    (
+        "purchases without delivery date",
+        Purchase,
+        {"estimated_delivery_date": None},
+        None,
+    ),
+    (
+        "purchases of a week",
+        Purchase,
+        {"iso_year": 2000, "week_of_year": 1, "status": "ABIERTO"},
+        None,
+    ),
+    ("purchases by status", Purchase, {"status": "ABIERTO"}, None),
+    (
+        "backorders",
+        Purchase,
+        PurchaseRepository._backorder_filter(datetime(2000, 1, 1)),
+        BACKORDER_SORTS["desc"],
+    ),
+    ("box search", Box, BoxRepository._create_search_filter("0"), [("symbol", 1)]),
+    ("program of a week", ProgramPlanning, week_filter((2000, 1)), None),
+    (
+        "programs of a range",
+        ProgramPlanning,
+        {"$or": [{"iso_year": 2000, "iso_week": {"$in": [1, 2]}}]},
+        [("iso_year", 1), ("iso_week", 1)],
+    ),
+]
+
+
+def plan_stages(plan: Mapping[str, Any]) -> Iterator[str]:
+    """
+    Get the stages of a query plan and of its input stages.
+
+    :param plan: The winning plan of an explain() output.
+    :type plan: Mapping[str, Any]
+    :return: The names of the stages.
+    :rtype: Iterator[str]
+    """
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+async def explain(
+    model: Type[Document],
+    filters: Mapping[str, Any],
+    sort: Optional[List[Tuple[str, int]]] = None,
+) -> Dict[str, Any]:
+    """
+    Get the query plan and execution statistics of a query.
+
+    :param model: The model of the queried collection.
+    :type model: Type[Document]
+    :param filters: The filter of the query.
+    :type filters: Mapping[str, Any]
+    :param sort: The sort of the query, if any.
+    :type sort: Optional[List[Tuple[str, int]]]
+    :return: The explain output, with the executionStats verbosity.
+    :rtype: Dict[str, Any]
+    """
+    collection = model.get_motor_collection()
+    command: Dict[str, Any] = {"find": collection.name, "filter": dict(filters)}
+    if sort:
+        command["sort"] = dict(sort)
+    return await collection.database.command(
+        "explain", command, verbosity="executionStats"
+    )
+
+
+async def check_query_plans() -> List[str]:
+    """
+    Explain the main queries and warn about those scanning their whole collection.
+
+    A query whose plan uses an index may still examine every document when the
+    index only serves its sort and the filter is applied on the fetched
+    documents, so the documents examined are compared with those returned too.
+
+    :return: The names of the queries planned with a collection scan or
+        examining far more documents than they return.
+    :rtype: List[str]
+    """
+    scans = []
+    for name, model, filters, sort in MAIN_QUERIES:
+        try:
+            output = await explain(model, filters, sort)
+        except Exception as e:
+            logger.warning(f"Could not explain the {name} query: {str(e)}")
+            continue
+        winning_plan = output.get("queryPlanner", {}).get("winningPlan", {})
+        stats = output.get("executionStats", {})
+        examined = stats.get("totalDocsExamined", 0)
+        returned = stats.get("nReturned", 0)
+        if "COLLSCAN" in plan_stages(winning_plan):
+            scans.append(name)
+            logger.warning(
+                f"The {name} query scans the whole {model.Settings.name} collection"
+            )
+        elif examined > MAX_EXAMINED_RATIO * max(returned, 1):
+            scans.append(name)
+            logger.warning(
+                f"The {name} query examines {examined} documents of the "
+                f"{model.Settings.name} collection to return {returned}"
+            )
+    return scans
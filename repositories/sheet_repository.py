@@ -2,12 +2,19 @@
 Sheet repository for interacting with the sheets collection in MongoDB.
 """
 
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 
 from beanie import PydanticObjectId
 from bson import ObjectId
 
 from models.sheet import Sheet
+from utils.pagination import facet_search_pipeline, facet_search_result, keyset_page
+
+# Fields of the sheets counted by value in the search results
+FACET_FIELDS = ("ect", "roll_width", "status")
+
+# Sort of the pages of sheets, used as a cursor
+PAGE_SORT = [("_id", 1)]
 
 
 class SheetRepository:
@@ -35,6 +42,21 @@ class SheetRepository:
         """
         return await Sheet.find_one({"_id": ObjectId(sheet_id)})
 
+    @staticmethod
+    async def get_by_ids(sheet_ids: List[str]) -> List[Sheet]:
+        """
+        Get the sheets matching a list of IDs in a single query.
+
+        :param sheet_ids: The IDs of the sheets to retrieve, invalid IDs are ignored.
+        :type sheet_ids: List[str]
+        :return: List of Sheet documents found, in no particular order.
+        :rtype: List[Sheet]
+        """
+        ids = [
+            ObjectId(sheet_id) for sheet_id in sheet_ids if ObjectId.is_valid(sheet_id)
+        ]
+        return await Sheet.find({"_id": {"$in": ids}}).to_list()
+
     @staticmethod
     async def create(sheet: Sheet) -> Sheet:
         """
@@ -54,17 +76,7 @@ class SheetRepository:
         """Obtiene todas las hojas con paginación y total"""
 
         # Filtro de búsqueda
-        filters = {
-            "$or": [
-                {"grams": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"ect": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"roll_width": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"p1": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"p2": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"p3": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"description": {"$regex": query, "$options": "i"}},
-            ]
-        }
+        filters = SheetRepository._create_search_filter(query)
 
         # Obtener las hojas con paginación
         sheets = await Sheet.find(filters).skip(offset).limit(limit).to_list()
@@ -75,21 +87,63 @@ class SheetRepository:
     async def get_total_count(query: str) -> int:
         """Obtiene el total de hojas filtradas"""
 
-        filters = {
-            "$or": [
-                {"grams": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"ect": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"roll_width": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"p1": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"p2": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"p3": {"$in": [int(query)]}} if query.isdigit() else {},
-                {"description": {"$regex": query, "$options": "i"}},
-            ]
-        }
+        filters = SheetRepository._create_search_filter(query)
 
         total_count = await Sheet.find(filters).count()
         return total_count
 
+    @staticmethod
+    async def search(query: str, offset: int, limit: int) -> Dict[str, Any]:
+        """
+        Get a page of filtered sheets, their total count and their facet counts
+        in a single aggregation.
+
+        :param query: The search query to filter sheets.
+        :type query: str
+        :param offset: The number of records to skip.
+        :type offset: int
+        :param limit: The maximum number of records to return.
+        :type limit: int
+        :return: The items, total, pages and facets by ECT, roll width and status.
+        :rtype: Dict[str, Any]
+        """
+        pipeline = facet_search_pipeline(
+            SheetRepository._create_search_filter(query),
+            sort=PAGE_SORT,
+            offset=offset,
+            limit=limit,
+            facet_fields=FACET_FIELDS,
+            array_fields=("ect",),
+        )
+        collection = Sheet.get_motor_collection()
+        result = await collection.aggregate(pipeline).to_list(length=None)
+        return facet_search_result(result, limit)
+
+    @staticmethod
+    async def get_page_by_cursor(
+        query: str, limit: int, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a page of filtered sheets after or before a cursor, sorted by creation order.
+
+        :param query: The search query to filter sheets.
+        :type query: str
+        :param limit: The maximum number of records to return.
+        :type limit: int
+        :param cursor: A cursor returned with a previous page, None for the first page.
+        :type cursor: Optional[str]
+        :return: The sheets as items, and the next and previous cursors.
+        :rtype: Dict[str, Any]
+        :raises ValueError: If the cursor is not valid.
+        """
+        return await keyset_page(
+            Sheet.get_motor_collection(),
+            SheetRepository._create_search_filter(query),
+            sort=PAGE_SORT,
+            limit=limit,
+            cursor=cursor,
+        )
+
     @staticmethod
     async def update_sheet(
         sheet_id: PydanticObjectId, update_data: dict
@@ -109,3 +163,27 @@ class SheetRepository:
             return None
         await sheet.update({"$set": update_data})
         return await Sheet.get(sheet_id)
+
+    @staticmethod
+    def _create_search_filter(query: str) -> dict:
+        """
+        Create a search filter for MongoDB queries.
+
+        Numeric queries match the grams, ECT, roll width and papers by equality,
+        any query matches the description.
+
+        :param query: The search query.
+        :type query: str
+        :return: The filter for MongoDB queries, empty if the query is empty.
+        :rtype: dict
+        """
+        if not query:
+            return {}
+        clauses = [{"description": {"$regex": query, "$options": "i"}}]
+        if query.isdigit():
+            value = int(query)
+            clauses += [
+                {field: value}
+                for field in ("grams", "ect", "roll_width", "p1", "p2", "p3")
+            ]
+        return {"$or": clauses}
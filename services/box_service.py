@@ -140,6 +140,60 @@ class BoxService:
         total_pages = (total_items + items_per_page - 1) // items_per_page  # Round up
         return total_pages
 
+    @staticmethod
+    async def backfill_search_terms() -> int:
+        """
+        Index the boxes stored before the search terms existed.
+
+        Returns:
+            int: The number of boxes indexed.
+        """
+        return await BoxRepository.backfill_search_terms()
+
+    @staticmethod
+    async def search_boxes(
+        query: str, page: int, items_per_page: int
+    ) -> Dict[str, Any]:
+        """
+        Retrieve a page of filtered boxes with the total count and the facet counts.
+
+        Args:
+            query (str): The search query to filter boxes.
+            page (int): The page number to retrieve.
+            items_per_page (int): The number of items per page.
+
+        Returns:
+            Dict[str, Any]: The boxes of the page as items, the total count, the
+            number of pages and the counts by client, status, flute and ECT.
+        """
+        offset = (page - 1) * items_per_page
+        result = await BoxRepository.search(query, offset, items_per_page)
+        result["items"] = [Box.model_validate(item) for item in result["items"]]
+        return result
+
+    @staticmethod
+    async def get_boxes_by_cursor(
+        query: str, items_per_page: int, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Retrieve a page of filtered boxes after or before a cursor.
+
+        Args:
+            query (str): The search query to filter boxes.
+            items_per_page (int): The number of items per page.
+            cursor (Optional[str]): A cursor returned with a previous page.
+
+        Returns:
+            Dict[str, Any]: The boxes of the page as items, and the next and
+            previous cursors, None at the ends of the results.
+
+        Raises:
+            ValueError: If the cursor is not valid.
+        """
+        page = await BoxRepository.get_page_by_cursor(query, items_per_page, cursor)
+        page["items"] = [Box.model_validate(item) for item in page["items"]]
+        return page
+
     @staticmethod
     async def get_all_symbols() -> list[str]:
         """
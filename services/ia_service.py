@@ -2,11 +2,24 @@
 This module implements the IAService class for AI interactions.
 """
 
+import hashlib
 import json
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, List, Optional
 
-from config.aws_bedrock import AWSBedrockService
-from utils.prompt_builder import PromptBuilder
+from config.aws_bedrock import BEDROCK_STREAMING
+from config.planning import PLANNING_AI_MAX_REPAIRS
+from services.model_backend import ModelBackend, model_backend
+from services.output_repair import (
+    InvalidOutputError,
+    apply_repairs,
+    find_invalid_runs,
+    repair_data,
+    repair_metrics,
+)
+from services.response_cache import ResponseCache, cache_key, response_cache
+from utils.json_stream import MalformedOutputError, PlanStreamParser
+from utils.prompt_builder import PromptBuilder, merge_plan_delta, prompt_size
 from config.logging import logger
 
 
@@ -15,9 +28,36 @@ class IAService:
     Service for interacting with AI models and processing their responses.
     """
 
-    def __init__(self):
-        """Initialize the IAService with a PromptBuilder."""
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        streaming: bool = BEDROCK_STREAMING,
+        max_repairs: int = PLANNING_AI_MAX_REPAIRS,
+        backend: Optional[ModelBackend] = None,
+    ):
+        """
+        Initialize the IAService with a PromptBuilder.
+
+        Args:
+            cache: The cache of AI responses, shared by default.
+            streaming: Whether responses are streamed and validated as they arrive.
+            max_repairs: The repair prompts or new calls allowed for each request.
+            backend: The model answering the prompts, shared and configured by AI_BACKEND
+                by default.
+        """
         self.prompt_builder = PromptBuilder()
+        self.backend = backend or model_backend
+        self.cache = cache or response_cache
+        self.streaming = streaming
+        self.max_repairs = max_repairs
+        self.metrics = repair_metrics
+        # Responses are only reused for prompts built from the same templates
+        self._prompt_version = hashlib.sha256(
+            json.dumps(
+                [self.prompt_builder.compact, self.prompt_builder.instructions],
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
 
     def build_prompt(self, action_type: str, data: Dict[str, Any]) -> str:
         """
@@ -32,24 +72,195 @@ class IAService:
         """
         return self.prompt_builder.build(action_type, data)
 
-    async def call(self, prompt: str) -> str:
+    async def call(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> str:
         """
-        Call the AWS Bedrock client with the given prompt.
+        Call the model backend with the given prompt.
 
         Args:
             prompt: The prompt to send to the AI model.
+            action_type: The action the prompt was built for.
+            prefix: The static start of the prompt, cached by the model backend.
 
         Returns:
             str: The AI model's response.
         """
         try:
-            # Call AWS Bedrock service
-            response = AWSBedrockService.invoke_model(prompt)
+            # Call the model backend without blocking the event loop
+            response = await self.backend.invoke(prompt, action_type, prefix)
             return response
         except Exception as e:
             logger.error(f"Error calling AI service: {str(e)}")
             return ""
 
+    async def stream(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Stream the response of the AI model, validating each production run as it arrives.
+
+        The stream is aborted on the first malformed run, without waiting for the
+        rest of the response. Nothing is persisted from a partial response.
+
+        Args:
+            prompt: The prompt to send to the AI model.
+            action_type: The action the prompt was built for.
+            prefix: The static start of the prompt, cached by the model backend.
+
+        Returns:
+            Optional[Dict[str, Any]]: The parsed JSON object, or None if the response
+            is malformed or the call fails.
+        """
+        # Runs that do not match the model abort the stream only when they cannot be repaired
+        parser = PlanStreamParser(strict=not self.max_repairs)
+        started = time.monotonic()
+        stream = self.backend.stream(prompt, action_type, prefix)
+        try:
+            async for chunk in stream:
+                parser.feed(chunk)
+                if parser.done:
+                    break
+            return parser.finish()
+        except MalformedOutputError as e:
+            logger.error(
+                f"Aborted AI response after {time.monotonic() - started:.2f}s and "
+                f"{len(parser.runs)} valid runs: {str(e)}"
+            )
+            return None
+        except Exception as e:
+            logger.error(f"Error streaming AI service: {str(e)}")
+            return None
+        finally:
+            await stream.aclose()
+
+    async def request(
+        self,
+        action_type: str,
+        data: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Build the prompt of an action, call the AI model and parse its response.
+
+        The production runs of the response are validated against the planning
+        models. Invalid runs are sent back in a short repair prompt holding only
+        their validation errors, and unusable responses are requested again,
+        within a budget of max_repairs calls. Valid responses are cached by the
+        normalized action type and data, so identical inputs do not call the AI
+        model again.
+
+        Args:
+            action_type: The type of action.
+            data: The domain data to include in the prompt.
+
+        Returns:
+            Optional[Dict[str, Any]]: The validated JSON object.
+
+        Raises:
+            InvalidOutputError: If no valid response was obtained within the budget.
+        """
+        key = cache_key(action_type, data, self._prompt_version)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return self.parse_response(cached)
+
+        # Generate prompt for AI, its static prefix is cached by the model backend
+        prefix, variable = self.prompt_builder.build_parts(action_type, data)
+        prompt = prefix + variable
+        self.metrics.add_prompt_size(
+            self.prompt_builder.size_report(action_type, data, (prefix, variable))
+        )
+
+        prompt_tokens = prompt_size(prompt)["tokens"]
+        self.metrics.add(responses=1, prompt_tokens=prompt_tokens)
+
+        # Call AI service until the response holds production runs
+        attempts = 0
+        while True:
+            parsed = await self._generate(prompt, action_type, prefix)
+            try:
+                invalid = find_invalid_runs(parsed) if parsed is not None else None
+            except MalformedOutputError as e:
+                logger.error(f"Unusable AI response for {action_type}: {str(e)}")
+                invalid = None
+            if invalid is not None:
+                break
+            if attempts >= self.max_repairs:
+                self.metrics.add(failed=1)
+                raise InvalidOutputError(f"No usable AI response for {action_type}")
+            attempts += 1
+            self.metrics.add(full_retries=1, prompt_tokens=prompt_tokens)
+
+        # Repair the runs that do not match the planning models
+        needed_repair = bool(invalid) or attempts > 0
+        while invalid and attempts < self.max_repairs:
+            attempts += 1
+            repair_prefix, repair_variable = self.prompt_builder.build_repair(
+                repair_data(parsed, invalid)
+            )
+            repair_prompt = repair_prefix + repair_variable
+            self.metrics.add(
+                repair_calls=1, repair_tokens=prompt_size(repair_prompt)["tokens"]
+            )
+            corrected = (
+                self.parse_response(
+                    await self.call(repair_prompt, "repair", repair_prefix)
+                )
+                or {}
+            )
+            invalid = apply_repairs(parsed, invalid, corrected.get("production_runs"))
+
+        if invalid:
+            self.metrics.add(failed=1)
+            raise InvalidOutputError(
+                f"Invalid AI response for {action_type}: "
+                + "; ".join(error for _, _, errors in invalid for error in errors)
+            )
+        self.metrics.add(**{"repaired" if needed_repair else "valid": 1})
+
+        # Only valid responses are cached
+        await self.cache.set(key, action_type, json.dumps(parsed))
+        return parsed
+
+    async def _generate(
+        self,
+        prompt: str,
+        action_type: str,
+        prefix: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Call the AI model and parse its response."""
+        if self.streaming:
+            return await self.stream(prompt, action_type, prefix)
+        return self.parse_response(await self.call(prompt, action_type, prefix))
+
+    def merge_production_runs(
+        self,
+        existing_runs: List[Dict[str, Any]],
+        response_runs: List[Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the production runs of a week from the runs returned by the AI model.
+
+        With the compact encoding the model only returns the new and changed runs,
+        which are applied to the existing runs of the week.
+
+        Args:
+            existing_runs: The production runs of the week sent in the prompt.
+            response_runs: The production runs returned by the AI model.
+
+        Returns:
+            List[Dict[str, Any]]: The production runs of the week.
+        """
+        if not self.prompt_builder.compact:
+            return response_runs
+        return merge_plan_delta(existing_runs or [], response_runs)
+
     def parse_response(self, response: str) -> Optional[Dict[str, Any]]:
         """
         Parse the text output from the AI model into a JSON object.
@@ -0,0 +1,182 @@
+"""
+KPI rollups of the purchases, maintained on write and read by the dashboards.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time
+from typing import Any, Dict, Optional, Tuple
+
+from config.logging import logger
+from models.purchase import Purchase
+from repositories.kpi_rollup_repository import KpiRollupRepository
+from repositories.purchase_repository import PurchaseRepository
+
+# Amounts of each bucket by field, by (kind, key) bucket
+Contributions = Dict[Tuple[str, str], Dict[str, float]]
+
+
+class KpiRollupService:
+    """
+    Service keeping the per-day, per-week and per-client totals of the purchases.
+
+    Each purchase contributes its invoice, kilograms and count to the day, ISO
+    week and client of its receipt, and, while it is open, its count and missing
+    quantity to the day it is due. A mutation applies the difference between the
+    contributions of the purchase before and after it, so dashboard reads sum a
+    few buckets instead of the purchases.
+    """
+
+    @staticmethod
+    def contributions(purchase: Optional[Purchase]) -> Contributions:
+        """
+        Get the amounts a purchase adds to each bucket.
+
+        Args:
+            purchase: The purchase, None for no purchase.
+
+        Returns:
+            Contributions: The amounts by field, by (kind, key) bucket.
+        """
+        if purchase is None:
+            return {}
+        totals = {
+            "invoice": purchase.total_invoice or 0.0,
+            "kilograms": purchase.total_kilograms or 0.0,
+            "purchase_count": 1,
+        }
+        receipt = purchase.receipt_date
+        year, week, _ = receipt.isocalendar()
+        contributions = {
+            ("day", receipt.date().isoformat()): totals,
+            ("week", f"{year}-W{week:02d}"): totals,
+            ("client", purchase.client): totals,
+        }
+        if KpiRollupService.is_open(purchase):
+            due = purchase.estimated_delivery_date.date().isoformat()
+            contributions[("due", due)] = {
+                "open_count": 1,
+                "missing_quantity": purchase.missing_quantity or 0,
+            }
+        return contributions
+
+    @staticmethod
+    def is_open(purchase: Purchase) -> bool:
+        """
+        Check if a purchase counts as a backorder once it is past due.
+
+        Args:
+            purchase: The purchase.
+
+        Returns:
+            bool: Whether the purchase is not canceled, has a delivery date, and
+            has no deliveries or an unfinished one.
+        """
+        if purchase.status == "CANCELED" or not purchase.estimated_delivery_date:
+            return False
+        deliveries = purchase.delivery_dates or []
+        return not deliveries or any(
+            delivery.finish_shipping_date is None for delivery in deliveries
+        )
+
+    @staticmethod
+    async def record(before: Contributions, purchase: Optional[Purchase]) -> None:
+        """
+        Apply a mutation of a purchase to the rollups.
+
+        Args:
+            before: The contributions of the purchase before the mutation, empty
+                for a new purchase.
+            purchase: The purchase after the mutation, None if it was removed.
+        """
+        after = KpiRollupService.contributions(purchase)
+        deltas: Contributions = {}
+        for bucket in set(before) | set(after):
+            old, new = before.get(bucket, {}), after.get(bucket, {})
+            amounts = {
+                field: new.get(field, 0) - old.get(field, 0)
+                for field in set(old) | set(new)
+            }
+            amounts = {field: amount for field, amount in amounts.items() if amount}
+            if amounts:
+                deltas[bucket] = amounts
+        try:
+            await KpiRollupRepository.apply(deltas)
+        except Exception as e:
+            # The purchase is already saved, a rebuild restores the totals
+            logger.error(f"Failed to update the KPI rollups: {str(e)}")
+
+    @staticmethod
+    async def rebuild() -> int:
+        """
+        Rebuild the rollups from scratch from every purchase.
+
+        The new totals are written apart and swapped in at once, so the dashboards
+        never read the rollups cleared or half rebuilt.
+
+        Returns:
+            int: The number of buckets written.
+        """
+        totals: Contributions = defaultdict(lambda: defaultdict(int))
+        async for purchase in Purchase.find_all():
+            for bucket, amounts in KpiRollupService.contributions(purchase).items():
+                for field, amount in amounts.items():
+                    totals[bucket][field] += amount
+        await KpiRollupRepository.replace(
+            {bucket: dict(amounts) for bucket, amounts in totals.items()}
+        )
+        return len(totals)
+
+    @staticmethod
+    async def ensure_built() -> None:
+        """Build the rollups if they have never been built."""
+        if await KpiRollupRepository.count() == 0:
+            buckets = await KpiRollupService.rebuild()
+            if buckets:
+                logger.info(f"Built {buckets} KPI rollup buckets")
+
+    @staticmethod
+    async def get_totals(start: date, end: date) -> Dict[str, float]:
+        """
+        Get the invoice, kilograms and count of the purchases received in a range.
+
+        Args:
+            start: The first receipt day included.
+            end: The first receipt day excluded.
+
+        Returns:
+            Dict[str, float]: The invoice, kilograms and count.
+        """
+        buckets = await KpiRollupRepository.get_range(
+            "day", start.isoformat(), end.isoformat()
+        )
+        return {
+            "invoice": sum(bucket.invoice for bucket in buckets),
+            "kilograms": sum(bucket.kilograms for bucket in buckets),
+            "count": sum(bucket.purchase_count for bucket in buckets),
+        }
+
+    @staticmethod
+    async def get_backorder_summary() -> Dict[str, Any]:
+        """
+        Get the number and missing quantity of the open purchases past their
+        estimated delivery date.
+
+        The "due" buckets hold whole days, so the backorders due earlier today are
+        counted from the purchases, with the cutoff of the backorder listings.
+
+        Returns:
+            Dict[str, Any]: The count and missing quantity of the backorders.
+        """
+        now = datetime.now()
+        today = datetime.combine(now.date(), time.min)
+        buckets = await KpiRollupRepository.get_range(
+            "due", end=today.date().isoformat()
+        )
+        due_today = await PurchaseRepository.get_backorder_totals(today, now)
+        return {
+            "count": sum(bucket.open_count for bucket in buckets) + due_today["count"],
+            "missing_quantity": (
+                sum(bucket.missing_quantity for bucket in buckets)
+                + due_today["missing_quantity"]
+            ),
+        }
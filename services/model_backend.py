@@ -0,0 +1,387 @@
+"""
+This module defines the backends answering the planning prompts: AWS Bedrock and
+a local fake used to load test the planning paths without spending quota.
+"""
+
+import asyncio
+import json
+import random
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set
+
+from config.aws_bedrock import AWSBedrockService
+from config.model_backend import (
+    AI_BACKEND,
+    FAKE_MODEL_CHUNK_SIZE,
+    FAKE_MODEL_JITTER_MS,
+    FAKE_MODEL_LATENCY_MS,
+    FAKE_MODEL_RESPONSES,
+)
+from services.planning.packer import MIN_REFILE
+from utils.prompt_builder import DATA_HEADER, prompt_size
+
+# Markers around the domain data in the prompts built by the PromptBuilder
+DATA_START = DATA_HEADER
+DATA_END = "\n\nPlease provide"
+
+
+class ModelBackend(ABC):
+    """Interface of the backends answering the planning prompts."""
+
+    @abstractmethod
+    async def invoke(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> str:
+        """
+        Get the complete response to a prompt.
+
+        Args:
+            prompt: The prompt to send to the model.
+            action_type: The action the prompt was built for, if known.
+            prefix: The static start of the prompt, cacheable across prompts.
+
+        Returns:
+            str: The text of the response.
+        """
+
+    @abstractmethod
+    def stream(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream the response to a prompt.
+
+        Args:
+            prompt: The prompt to send to the model.
+            action_type: The action the prompt was built for, if known.
+            prefix: The static start of the prompt, cacheable across prompts.
+
+        Returns:
+            AsyncGenerator[str, None]: The chunks of the response text.
+        """
+
+    @abstractmethod
+    def usage_stats(self) -> Dict[str, Any]:
+        """
+        Get the input tokens sent and read from the prompt cache.
+
+        Returns:
+            Dict[str, Any]: The token counters and the share of cached input.
+        """
+
+
+class BedrockBackend(ModelBackend):
+    """Backend calling the AWS Bedrock runtime."""
+
+    async def invoke(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> str:
+        return await AWSBedrockService.ainvoke_model(prompt, prefix=prefix)
+
+    def stream(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        return AWSBedrockService.astream_model(prompt, prefix=prefix)
+
+    def usage_stats(self) -> Dict[str, Any]:
+        return usage_stats(dict(AWSBedrockService.usage))
+
+
+class FakeBackend(ModelBackend):
+    """
+    Local stand-in of the AI model.
+
+    It answers with recorded responses of each action type, cycled in order, or
+    with synthetic plans built from the prompt data that place each purchase in
+    its own run. Every response waits a configurable latency with jitter, and
+    streamed responses are split in chunks. Token usage is estimated, with a
+    prefix seen before counted as read from the prompt cache.
+    """
+
+    def __init__(
+        self,
+        latency_ms: int = FAKE_MODEL_LATENCY_MS,
+        jitter_ms: int = FAKE_MODEL_JITTER_MS,
+        responses_path: Optional[str] = FAKE_MODEL_RESPONSES,
+        chunk_size: int = FAKE_MODEL_CHUNK_SIZE,
+    ):
+        """
+        Initialize the FakeBackend.
+
+        Args:
+            latency_ms: Milliseconds waited before answering.
+            jitter_ms: Maximum random milliseconds added to the latency.
+            responses_path: JSON file mapping action types to lists of responses.
+            chunk_size: Characters of each streamed chunk.
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_size = chunk_size
+        self.recorded: Dict[str, List[Any]] = {}
+        if responses_path:
+            with open(responses_path, "r", encoding="utf-8") as file:
+                self.recorded = json.load(file)
+        self._served: Dict[str, int] = {}
+        self._prefixes: Set[str] = set()
+        self.calls = 0
+        self.usage = {
+            "requests": 0,
+            "input_tokens": 0,
+            "cache_read_tokens": 0,
+            "cache_write_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    async def invoke(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> str:
+        await asyncio.sleep(self._latency())
+        return self.respond(prompt, action_type, prefix)
+
+    async def stream(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> AsyncGenerator[str, None]:
+        await asyncio.sleep(self._latency())
+        response = self.respond(prompt, action_type, prefix)
+        for start in range(0, len(response), self.chunk_size):
+            yield response[start : start + self.chunk_size]
+            await asyncio.sleep(0)
+
+    def respond(
+        self,
+        prompt: str,
+        action_type: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> str:
+        """
+        Get the response to a prompt without waiting.
+
+        Args:
+            prompt: The prompt to answer.
+            action_type: The action the prompt was built for.
+            prefix: The static start of the prompt.
+
+        Returns:
+            str: A recorded response, or a synthetic plan.
+        """
+        self.calls += 1
+        recorded = self.recorded.get(action_type or "")
+        if recorded:
+            served = self._served.get(action_type, 0)
+            self._served[action_type] = served + 1
+            response = recorded[served % len(recorded)]
+            response = response if isinstance(response, str) else json.dumps(response)
+        else:
+            response = json.dumps(synthetic_plan(action_type, prompt_data(prompt)))
+        self._record_usage(prompt, prefix, response)
+        return response
+
+    def usage_stats(self) -> Dict[str, Any]:
+        return usage_stats(dict(self.usage))
+
+    def _record_usage(self, prompt: str, prefix: Optional[str], response: str) -> None:
+        """Estimate the tokens of a prompt, reading a known prefix from the cache."""
+        cached = prefix if prefix and prompt.startswith(prefix) else ""
+        self.usage["requests"] += 1
+        self.usage["input_tokens"] += prompt_size(prompt[len(cached) :])["tokens"]
+        if cached in self._prefixes:
+            self.usage["cache_read_tokens"] += prompt_size(cached)["tokens"]
+        elif cached:
+            self._prefixes.add(cached)
+            self.usage["cache_write_tokens"] += prompt_size(cached)["tokens"]
+        self.usage["output_tokens"] += prompt_size(response)["tokens"]
+
+    def _latency(self) -> float:
+        """Get the seconds to wait before answering."""
+        return (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+
+
+def prompt_data(prompt: str) -> Dict[str, Any]:
+    """
+    Extract the domain data of a prompt.
+
+    Args:
+        prompt: A prompt built by the PromptBuilder.
+
+    Returns:
+        Dict[str, Any]: The decoded data, empty if it cannot be found.
+    """
+    start = prompt.find(DATA_START)
+    end = prompt.find(DATA_END, start)
+    if start == -1 or end == -1:
+        start = prompt.find("{")
+        end = prompt.rfind("}") + 1
+    else:
+        start += len(DATA_START)
+    try:
+        return json.loads(prompt[start:end])
+    except json.JSONDecodeError:
+        return {}
+
+
+def synthetic_plan(action_type: Optional[str], data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a valid plan answering a prompt.
+
+    Args:
+        action_type: The action the prompt was built for.
+        data: The domain data of the prompt.
+
+    Returns:
+        Dict[str, Any]: The plan in the output format of the action.
+    """
+    purchases = data.get("purchases") or [data.get("purchase") or {}]
+    lots = {purchase.get("arapack_lot") for purchase in purchases}
+
+    if action_type == "register":
+        program = data.get("program_planning") or {}
+        new_runs = data.get("proposed_production_runs") or [
+            _synthetic_run(purchase) for purchase in purchases
+        ]
+        return {"production_runs": _keep_runs(program, set()) + new_runs}
+    if action_type == "delete":
+        return {"production_runs": _without_lots(data.get("program_planning"), lots)}
+    if action_type == "update_info":
+        original = _without_lots(data.get("original_program_planning"), lots)
+        new_program = data.get("new_program_planning")
+        new_run = _synthetic_run(purchases[0])
+        if not new_program:
+            return {
+                "programs": {
+                    "original_program_planning": {
+                        "production_runs": original + [new_run]
+                    }
+                }
+            }
+        return {
+            "programs": {
+                "original_program_planning": {"production_runs": original},
+                "new_program_planning": {
+                    "production_runs": _keep_runs(new_program, lots) + [new_run]
+                },
+            }
+        }
+    if action_type == "repair":
+        return {
+            "production_runs": [
+                item.get("run") for item in data.get("invalid_runs", [])
+            ]
+        }
+    return {"production_runs": []}
+
+
+def _keep_runs(program: Dict[str, Any], lots: set) -> List[Dict[str, Any]]:
+    """Get the runs of a full program planning without the given lots, none for a delta."""
+    return [
+        run
+        for run in (program or {}).get("production_runs") or []
+        if not lots & {box.get("arapack_lot") for box in run.get("processed_boxes", [])}
+    ]
+
+
+def _without_lots(program: Optional[Dict[str, Any]], lots: set) -> List[Dict[str, Any]]:
+    """Remove the runs holding some lots, as removal markers for a compact delta."""
+    program = program or {}
+    if "affected_runs" in program:
+        return [
+            {"index": run["index"], "removed": True}
+            for run in program["affected_runs"]
+            if "index" in run
+        ]
+    return _keep_runs(program, lots)
+
+
+def _synthetic_run(purchase: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a run producing a whole purchase on its own."""
+    quantity = purchase.get("missing_quantity") or purchase.get("quantity") or 0
+    return {
+        "processed_boxes": [
+            {
+                "order_number": str(purchase.get("order_number", "")),
+                "symbol": purchase.get("symbol", ""),
+                "quantity": quantity,
+                "output": 1,
+                "hierarchy": "priority",
+                "part": 1,
+                "remaining": 0,
+                "arapack_lot": purchase.get("arapack_lot", ""),
+            }
+        ],
+        "authorized_refile": False,
+        "sheet": {
+            "id": "fake",
+            "ect": int(purchase.get("ect") or 0),
+            "roll_width": 0,
+            "p1": 0,
+            "p2": 0,
+            "p3": 0,
+        },
+        "scheduled_date": date.today().isoformat(),
+        "treatment": False,
+        "start_time": "06:00",
+        "end_time": "07:00",
+        "refile": MIN_REFILE,
+        "linear_meters": 0,
+        "speed": 0,
+    }
+
+
+def usage_stats(usage: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Add the share of cached input to some token counters.
+
+    Args:
+        usage: The requests, input, cache read, cache write and output tokens.
+
+    Returns:
+        Dict[str, Any]: The counters, the input tokens sent in total and the
+        share of them read from the prompt cache.
+    """
+    sent = (
+        usage["input_tokens"] + usage["cache_read_tokens"] + usage["cache_write_tokens"]
+    )
+    return {
+        **usage,
+        "sent_tokens": sent,
+        "cached_share": usage["cache_read_tokens"] / sent if sent else 0.0,
+    }
+
+
+def get_model_backend(name: str = AI_BACKEND) -> ModelBackend:
+    """
+    Get the backend configured for the planning prompts.
+
+    Args:
+        name: "bedrock" or "fake".
+
+    Returns:
+        ModelBackend: The backend instance.
+    """
+    if name == "fake":
+        return FakeBackend()
+    if name == "bedrock":
+        return BedrockBackend()
+    raise ValueError(f"Unknown AI backend: {name}")
+
+
+# Backend shared by the AI services
+model_backend = get_model_backend()
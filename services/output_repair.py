@@ -0,0 +1,200 @@
+"""
+This module validates the plans returned by the AI model against the planning
+models and applies the runs corrected by a repair prompt.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.json_stream import RUNS_KEY, MalformedOutputError, run_errors
+
+
+class InvalidOutputError(ValueError):
+    """Raised when the AI output is still invalid once the repair budget is spent."""
+
+
+# Program plannings of the update_info output format
+PROGRAM_KEYS = ["original_program_planning", "new_program_planning"]
+
+# Section of the plan holding the runs, position of the run and its errors
+InvalidRun = Tuple[Optional[str], int, List[str]]
+
+
+def plan_sections(plan: Dict[str, Any]) -> Dict[Optional[str], List[Any]]:
+    """
+    Get the production runs of each program planning of a plan.
+
+    Args:
+        plan: The parsed output of the AI model.
+
+    Returns:
+        Dict[Optional[str], List[Any]]: The runs by program planning key, None for
+        a plan holding its runs at the root.
+
+    Raises:
+        MalformedOutputError: If the plan holds no list of production runs.
+    """
+    if not isinstance(plan, dict):
+        raise MalformedOutputError("The response must be a JSON object")
+    if RUNS_KEY in plan:
+        sections = {None: plan[RUNS_KEY]}
+    else:
+        programs = plan.get("programs", plan)
+        if not isinstance(programs, dict):
+            raise MalformedOutputError("programs must be an object")
+        sections = {}
+        for key in PROGRAM_KEYS:
+            if key not in programs:
+                continue
+            program = programs[key] or {}
+            if not isinstance(program, dict):
+                raise MalformedOutputError(f"{key} must be an object")
+            sections[key] = program.get(RUNS_KEY, [])
+    if not sections:
+        raise MalformedOutputError(f"The response has no {RUNS_KEY}")
+    for key, runs in sections.items():
+        if not isinstance(runs, list):
+            raise MalformedOutputError(f"{key or 'root'} {RUNS_KEY} must be a list")
+    return sections
+
+
+def find_invalid_runs(plan: Dict[str, Any]) -> List[InvalidRun]:
+    """
+    Validate every production run of a plan.
+
+    Args:
+        plan: The parsed output of the AI model.
+
+    Returns:
+        List[InvalidRun]: The section, position and errors of each invalid run.
+
+    Raises:
+        MalformedOutputError: If the plan holds no list of production runs.
+    """
+    invalid = []
+    for section, runs in plan_sections(plan).items():
+        for index, run in enumerate(runs):
+            errors = run_errors(run)
+            if errors:
+                invalid.append((section, index, errors))
+    return invalid
+
+
+def repair_data(plan: Dict[str, Any], invalid: List[InvalidRun]) -> Dict[str, Any]:
+    """
+    Build the data of a repair prompt.
+
+    Args:
+        plan: The parsed output of the AI model.
+        invalid: The invalid runs of the plan.
+
+    Returns:
+        Dict[str, Any]: Each invalid run with its validation errors.
+    """
+    sections = plan_sections(plan)
+    return {
+        "invalid_runs": [
+            {"run": sections[section][index], "errors": errors}
+            for section, index, errors in invalid
+        ]
+    }
+
+
+def apply_repairs(
+    plan: Dict[str, Any], invalid: List[InvalidRun], corrected: Any
+) -> List[InvalidRun]:
+    """
+    Replace the invalid runs of a plan with the runs returned by a repair prompt.
+
+    Args:
+        plan: The parsed output of the AI model, updated in place.
+        invalid: The invalid runs sent in the repair prompt.
+        corrected: The production runs returned for them, in the same order.
+
+    Returns:
+        List[InvalidRun]: The runs that are still invalid.
+    """
+    sections = plan_sections(plan)
+    corrected = corrected if isinstance(corrected, list) else []
+    remaining = []
+    for position, (section, index, errors) in enumerate(invalid):
+        run = corrected[position] if position < len(corrected) else None
+        run_errors_left = run_errors(run) if run is not None else errors
+        if run is not None and not run_errors_left:
+            sections[section][index] = run
+        else:
+            remaining.append((section, index, run_errors_left))
+    return remaining
+
+
+class RepairMetrics:
+    """Counters of the validation and repair of the AI output."""
+
+    def __init__(self):
+        """Initialize the RepairMetrics."""
+        self.counters = {
+            "responses": 0,  # Responses received for a planning prompt
+            "valid": 0,  # Responses valid without any repair
+            "repaired": 0,  # Responses made valid by repair prompts or new calls
+            "failed": 0,  # Responses still invalid once the budget was spent
+            "repair_calls": 0,  # Repair prompts sent
+            "full_retries": 0,  # Planning prompts sent again after unusable output
+            "prompt_tokens": 0,  # Estimated tokens of the planning prompts
+            "repair_tokens": 0,  # Estimated tokens of the repair prompts
+        }
+        self.prompt_sizes = {
+            "prompts": 0,  # Planning prompts built
+            "full_tokens": 0,  # Estimated tokens without the compact encoding
+            "compact_tokens": 0,  # Estimated tokens with the compact encoding
+            "static_prefix_tokens": 0,  # Estimated tokens of the compact prefixes
+        }
+
+    def add(self, **counts: int) -> None:
+        """Increase some counters."""
+        for name, count in counts.items():
+            self.counters[name] += count
+
+    def add_prompt_size(self, report: Dict[str, Dict[str, int]]) -> None:
+        """Record the size report of a planning prompt."""
+        self.prompt_sizes["prompts"] += 1
+        for encoding in ("full", "compact", "static_prefix"):
+            self.prompt_sizes[f"{encoding}_tokens"] += report[encoding]["tokens"]
+
+    def prompt_stats(self) -> Dict[str, Any]:
+        """
+        Get the size of the planning prompts with and without the compact encoding.
+
+        Returns:
+            Dict[str, Any]: The prompts built, their estimated tokens in both
+            encodings and the share of tokens saved by the compact encoding.
+        """
+        full = self.prompt_sizes["full_tokens"]
+        return {
+            **self.prompt_sizes,
+            "compact_saving": (
+                1 - self.prompt_sizes["compact_tokens"] / full if full else 0.0
+            ),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the counters with the repair rate and cost.
+
+        Returns:
+            Dict[str, Any]: The counters, the share of responses needing a repair
+            and the share of prompt tokens spent on repairs.
+        """
+        responses = self.counters["responses"]
+        sent = self.counters["prompt_tokens"] + self.counters["repair_tokens"]
+        return {
+            **self.counters,
+            "repair_rate": (
+                (self.counters["repaired"] + self.counters["failed"]) / responses
+                if responses
+                else 0.0
+            ),
+            "repair_cost": self.counters["repair_tokens"] / sent if sent else 0.0,
+        }
+
+
+# Metrics shared by the AI services
+repair_metrics = RepairMetrics()
@@ -0,0 +1,3 @@
+"""
+This module contains the deterministic planning engine used to build production runs.
+"""
@@ -0,0 +1,109 @@
+"""
+This module implements the CandidateFilter class, which selects the sheets worth
+sending to the planner for a set of box designs.
+"""
+
+from typing import Dict, Any, Iterable, List, Optional
+
+import numpy as np
+
+from config.planning import PLANNING_CANDIDATE_SHEETS
+from services.planning.refile_matrix import MIN_REFILE, RefileMatrix, sheet_id
+
+
+class CandidateFilter:
+    """
+    Pre-filter of the sheets used to plan a set of boxes.
+
+    A sheet is feasible for a box when it is enabled, accepts the box ECT, has
+    available meters, belongs to the current sheet selection (if any) and leaves
+    at least the minimum refile with one of its outs. The top sheets of each box,
+    ranked by refile, are kept.
+    """
+
+    def __init__(
+        self, top_n: int = PLANNING_CANDIDATE_SHEETS, min_refile: float = MIN_REFILE
+    ):
+        """
+        Initialize the CandidateFilter.
+
+        Args:
+            top_n: The number of sheets kept for each box.
+            min_refile: The minimum refile a run must leave on the roll.
+        """
+        self.top_n = top_n
+        self.min_refile = min_refile
+
+    def select(
+        self,
+        boxes: List[Dict[str, Any]],
+        sheets: List[Dict[str, Any]],
+        selected_ids: Optional[Iterable[Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Select the candidate sheets of some boxes.
+
+        Args:
+            boxes: The box data of the purchases to plan.
+            sheets: All the sheets.
+            selected_ids: The IDs of the current sheet selection, None or empty to
+                allow every sheet.
+
+        Returns:
+            List[Dict[str, Any]]: The union of the top sheets of each box, in the
+            order they were ranked.
+        """
+        selected = {str(selected_id) for selected_id in selected_ids or []}
+        available = [
+            sheet
+            for sheet in sheets
+            if (sheet.get("available_meters") or 0) > 0
+            and (not selected or sheet_id(sheet) in selected)
+        ]
+
+        candidates: Dict[str, Dict[str, Any]] = {}
+        for columns in self._ranking(boxes, available, self.top_n):
+            for column in columns:
+                sheet = available[column]
+                candidates.setdefault(sheet_id(sheet), sheet)
+        return list(candidates.values())
+
+    def rank(
+        self, box: Dict[str, Any], sheets: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank the feasible sheets of a box.
+
+        Args:
+            box: The box data.
+            sheets: The sheets to rank.
+
+        Returns:
+            List[Dict[str, Any]]: The feasible sheets, lowest refile first and most
+            available meters on ties.
+        """
+        return [
+            sheets[column] for column in self._ranking([box], sheets, len(sheets))[0]
+        ]
+
+    def _ranking(
+        self, boxes: List[Dict[str, Any]], sheets: List[Dict[str, Any]], count: int
+    ) -> List[List[int]]:
+        """
+        Rank the sheets of each box by the refile of the box alone.
+
+        A combination with another design always leaves less refile than the box
+        alone with one out, so a sheet without a single fit cannot fit a pair.
+
+        Returns:
+            List[List[int]]: The positions of the first count feasible sheets of
+            each box, lowest refile first and most available meters on ties.
+        """
+        matrix = RefileMatrix(boxes, sheets, self.min_refile, pairs=False)
+        meters = np.array(
+            [-(sheet.get("available_meters") or 0) for sheet in sheets], dtype=float
+        )
+        return [
+            [int(column) for column in columns if column >= 0]
+            for columns in matrix.top_sheets(count, meters)
+        ]
@@ -0,0 +1,440 @@
+"""
+This module implements the ExactPacker class, a planning engine that searches the
+pairing of box designs with the minimum total refile by branch and bound, within
+a wall-clock budget.
+"""
+
+import math
+import time
+from datetime import date
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from config.planning import PLANNING_EXACT_BUDGET_SECONDS
+from models.program_planning import ProductionRun
+from services.planning.packer import (
+    MAX_REFILE,
+    MIN_REFILE,
+    BinPacker,
+    PackingResult,
+)
+from services.planning.refile_matrix import RefileMatrix
+from services.planning.scheduler import MachineScheduler, linear_meters
+
+# Search nodes explored between two checks of the wall clock
+CLOCK_CHECK_NODES = 1024
+
+# Refile area below which two pairings are considered equal, in m²
+AREA_TOLERANCE = 1e-6
+
+
+class ExactPackingResult(PackingResult):
+    """Result of an exact packing pass."""
+
+    refile_area: float = 0  # Refile of the runs times their linear meters, in m²
+    heuristic_refile_area: float = 0  # Refile area of the BinPacker runs, in m²
+    lower_bound: float = 0  # No pairing of the demands has a lower refile area
+    optimal: bool = True  # Whether the search proved the pairing optimal
+    nodes: int = 0  # Search nodes explored
+    elapsed_seconds: float = 0  # Wall-clock time of the search
+
+
+def refile_area(runs: List[ProductionRun]) -> float:
+    """
+    Get the refile area of some production runs.
+
+    Args:
+        runs: The production runs.
+
+    Returns:
+        float: The refile of each run times its linear meters, in m².
+    """
+    return sum(run.refile * run.linear_meters for run in runs) / 100
+
+
+class ExactPacker(BinPacker):
+    """
+    Planning engine pairing demands with the minimum total refile.
+
+    Runs are built with the rules of the BinPacker: a demand runs alone on its
+    best sheet or shares a run with a compatible demand, the shortest one is
+    the priority and the rest of the complement is planned again. Instead of
+    taking the pairs greedily by delivery date, the pairing minimizes the
+    refile area of the whole set, the refile of each run times its meters.
+
+    Demands are split into independent groups of designs that can share a run,
+    and each group is searched depth first by branch and bound: the most
+    urgent pending demand either runs alone or is paired with another pending
+    demand, most promising first. A branch is cut when its refile area plus a
+    lower bound of the pending quantities reaches the best pairing found; the
+    bound charges every box its cheapest rate, alone or half of a shared run.
+    At the budget the best pairing found so far is returned, or the BinPacker
+    runs when the search did not improve on them.
+    """
+
+    def __init__(
+        self,
+        budget_seconds: float = PLANNING_EXACT_BUDGET_SECONDS,
+        min_refile: float = MIN_REFILE,
+        max_refile: float = MAX_REFILE,
+        scheduler: Optional[MachineScheduler] = None,
+    ):
+        """
+        Initialize the ExactPacker.
+
+        Args:
+            budget_seconds: The wall-clock time the search may take.
+            min_refile: The minimum refile a run must leave on the roll.
+            max_refile: The refile above which a run needs authorization.
+            scheduler: The timeline the new runs are laid on.
+        """
+        super().__init__(min_refile, max_refile, scheduler)
+        self.budget_seconds = budget_seconds
+
+    def plan(
+        self,
+        demands: List[Dict[str, Any]],
+        sheets: List[Dict[str, Any]],
+        existing_runs: Optional[List[Any]] = None,
+        start_date: Optional[date] = None,
+        budget_seconds: Optional[float] = None,
+    ) -> ExactPackingResult:
+        """
+        Build the production runs of the best pairing of a list of demands.
+
+        Args:
+            demands: Dictionaries with the "purchase" and "box" data of each order.
+            sheets: The available sheets.
+            existing_runs: Runs already in the plan, new runs are laid after them.
+            start_date: The first day new runs may be scheduled on.
+            budget_seconds: The wall-clock time the search may take, the budget
+                of the packer by default.
+
+        Returns:
+            ExactPackingResult: The proposed runs, the lots that could not be
+            placed, and the refile area, bound and optimality of the pairing.
+        """
+        started = time.monotonic()
+        deadline = started + (
+            self.budget_seconds if budget_seconds is None else budget_seconds
+        )
+        heuristic = super().plan(demands, sheets, existing_runs, start_date)
+
+        queue = [
+            {
+                "purchase": demand["purchase"],
+                "box": demand["box"],
+                "need": demand["purchase"].get("missing_quantity")
+                or demand["purchase"].get("quantity", 0),
+                "part": 1,
+            }
+            for demand in demands
+            if demand.get("box")
+        ]
+        queue.sort(key=self._priority)
+        matrix = self.matrix([demand["box"] for demand in queue], sheets)
+        singles = [matrix.single(row) for row in range(len(queue))]
+        pairs = self._pairs(singles, matrix)
+        rates = self._rates(queue, singles, pairs)
+
+        result = ExactPackingResult()
+        decisions: List[Tuple[int, Optional[int]]] = []
+        for group in self._groups(
+            [index for index, single in enumerate(singles) if single], pairs
+        ):
+            path, bound, optimal, nodes = self._search(
+                group, queue, singles, pairs, rates, deadline
+            )
+            decisions.extend(path)
+            result.lower_bound += bound
+            result.optimal = result.optimal and optimal
+            result.nodes += nodes
+
+        self._build(queue, singles, pairs, decisions, existing_runs, start_date, result)
+        result.refile_area = round(refile_area(result.runs), 2)
+        result.heuristic_refile_area = round(refile_area(heuristic.runs), 2)
+        if result.heuristic_refile_area < result.refile_area:
+            # Runs round their meters, the greedy runs may still be better
+            result.runs = heuristic.runs
+            result.refile_area = result.heuristic_refile_area
+        result.lower_bound = round(min(result.lower_bound, result.refile_area), 2)
+        result.elapsed_seconds = round(time.monotonic() - started, 3)
+        return result
+
+    @staticmethod
+    def _pairs(
+        singles: List[Optional[Tuple[float, Dict[str, Any], List[int]]]],
+        matrix: RefileMatrix,
+    ) -> Dict[Tuple[int, int], Tuple[float, Dict[str, Any], List[int]]]:
+        """
+        Get the best sheet and outs of each pair of demands that can share a run.
+
+        A design that fits no sheet alone cannot share one either, so demands
+        without a single run have no pairs.
+
+        Returns:
+            Dict[Tuple[int, int], Tuple[float, Dict[str, Any], List[int]]]: The
+            refile, sheet and outs of each pair, keyed by both positions in either
+            order with the outs in the order of the key.
+        """
+        pairs = {}
+        placed = np.array([single is not None for single in singles], dtype=bool)
+        feasible = np.triu(
+            np.isfinite(matrix.pair_refile) & placed[:, None] & placed[None, :], k=1
+        )
+        for a, b in zip(*np.nonzero(feasible)):
+            refile, sheet, outputs = matrix.pair(a, b)
+            pairs[(int(a), int(b))] = (refile, sheet, outputs)
+            pairs[(int(b), int(a))] = (refile, sheet, outputs[::-1])
+        return pairs
+
+    @staticmethod
+    def _rates(
+        queue: List[Dict[str, Any]],
+        singles: List[Optional[Tuple[float, Dict[str, Any], List[int]]]],
+        pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any], List[int]]],
+    ) -> List[float]:
+        """
+        Get the lowest refile area each box of a demand can be produced with.
+
+        A run alone charges its whole area to its boxes, a shared run half of it
+        to the boxes of each design, so the refile area of any pairing is at
+        least the pending quantity of each demand times its rate.
+
+        Returns:
+            List[float]: The refile area per box of each demand, in m².
+        """
+        rates = [math.inf] * len(queue)
+        for index, single in enumerate(singles):
+            if single:
+                refile, _, outputs = single
+                length = queue[index]["box"].get("length", 0)
+                rates[index] = refile * length / (10000 * outputs[0])
+        for (index, _), (refile, _, outputs) in pairs.items():
+            length = queue[index]["box"].get("length", 0)
+            rates[index] = min(rates[index], refile * length / (20000 * outputs[0]))
+        return rates
+
+    @staticmethod
+    def _groups(
+        placed: List[int],
+        pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any], List[int]]],
+    ) -> List[List[int]]:
+        """Get the demands connected by their pairs, by their first demand."""
+        parent = {index: index for index in placed}
+
+        def root(index: int) -> int:
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        for a, b in pairs:
+            parent[root(a)] = root(b)
+        groups: Dict[int, List[int]] = {}
+        for index in placed:
+            groups.setdefault(root(index), []).append(index)
+        return list(groups.values())
+
+    def _search(
+        self,
+        group: List[int],
+        queue: List[Dict[str, Any]],
+        singles: List[Optional[Tuple[float, Dict[str, Any], List[int]]]],
+        pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any], List[int]]],
+        rates: List[float],
+        deadline: float,
+    ) -> Tuple[List[Tuple[int, Optional[int]]], float, bool, int]:
+        """
+        Find the pairing of a group of demands with the minimum refile area.
+
+        The first branches taken make a greedy pairing, so a pairing is found
+        even when the budget runs out early.
+
+        Args:
+            group: The positions of the demands of the group, by priority.
+            queue: The demands with their quantity to produce.
+            singles: The best single run of each demand.
+            pairs: The best run of each pair of demands.
+            rates: The lowest refile area per box of each demand.
+            deadline: The monotonic time the search stops at.
+
+        Returns:
+            Tuple[List[Tuple[int, Optional[int]]], float, bool, int]: The runs of
+            the pairing in order, as a demand and its partner or None when it runs
+            alone, a lower bound of its refile area, whether the pairing is
+            optimal and the nodes explored.
+        """
+        pending = {index: queue[index]["need"] for index in group}
+        root_bound = sum(quantity * rates[index] for index, quantity in pending.items())
+        best_area = math.inf
+        best_path: List[Tuple[int, Optional[int]]] = []
+        path: List[Tuple[int, Optional[int]]] = []
+        bound = root_bound
+        nodes = 0
+        # Each frame holds the options of a demand, the next one to try and the
+        # pending quantities to restore once the applied one is undone
+        frames: List[List[Any]] = [
+            [
+                self._options(min(pending), pending, queue, singles, pairs, rates),
+                0,
+                None,
+            ]
+        ]
+        while frames:
+            frame = frames[-1]
+            if frame[2] is not None:
+                delta, restore = frame[2]
+                self._update(pending, restore)
+                bound -= delta
+                path.pop()
+                frame[2] = None
+
+            nodes += 1
+            if (
+                nodes % CLOCK_CHECK_NODES == 0
+                and best_path
+                and time.monotonic() > deadline
+            ):
+                return best_path, root_bound, False, nodes
+
+            options, position = frame[0], frame[1]
+            # Options are sorted by their bound, none of the rest can do better
+            if (
+                position >= len(options)
+                or bound + options[position][0] >= best_area - AREA_TOLERANCE
+            ):
+                frames.pop()
+                continue
+            delta, decision, changes = options[position]
+            frame[1] += 1
+            frame[2] = (delta, {index: pending.get(index) for index in changes})
+            self._update(pending, changes)
+            bound += delta
+            path.append(decision)
+
+            if not pending:
+                best_area, best_path = bound, list(path)
+                continue
+            frames.append(
+                [
+                    self._options(min(pending), pending, queue, singles, pairs, rates),
+                    0,
+                    None,
+                ]
+            )
+        return best_path, best_area, True, nodes
+
+    @staticmethod
+    def _options(
+        index: int,
+        pending: Dict[int, int],
+        queue: List[Dict[str, Any]],
+        singles: List[Optional[Tuple[float, Dict[str, Any], List[int]]]],
+        pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any], List[int]]],
+        rates: List[float],
+    ) -> List[Tuple[float, Tuple[int, Optional[int]], Dict[int, Optional[int]]]]:
+        """
+        Get the runs a pending demand can take, most promising first.
+
+        Returns:
+            List[Tuple[float, Tuple[int, Optional[int]], Dict[int, Optional[int]]]]:
+            For each run, the change of the bound, the run as the demand and its
+            partner, and the new pending quantities of its demands, None once a
+            demand is fully planned.
+        """
+        need = pending[index]
+        refile, _, outputs = singles[index]
+        meters = linear_meters(need, queue[index]["box"].get("length", 0), outputs[0])
+        options = [
+            (refile * meters / 100 - need * rates[index], (index, None), {index: None})
+        ]
+
+        for partner, partner_need in pending.items():
+            best = pairs.get((index, partner))
+            if best is None:
+                continue
+            refile, _, outputs = best
+            # The demand needing the shortest run is the priority, as in the BinPacker
+            entries = sorted(
+                [(index, need, outputs[0]), (partner, partner_need, outputs[1])],
+                key=lambda entry: linear_meters(
+                    entry[1], queue[entry[0]]["box"].get("length", 0), entry[2]
+                ),
+            )
+            (first, first_need, first_output), (second, second_need, output) = entries
+            meters = linear_meters(
+                first_need, queue[first]["box"].get("length", 0), first_output
+            )
+            produced = math.floor(
+                meters * 100 * output / queue[second]["box"].get("length", 1)
+            )
+            if produced <= 0:
+                continue
+            rest = max(second_need - produced, 0)
+            delta = (
+                refile * meters / 100
+                - need * rates[index]
+                - partner_need * rates[partner]
+                + rest * rates[second]
+            )
+            options.append(
+                (delta, (index, partner), {first: None, second: rest or None})
+            )
+        options.sort(key=lambda option: option[0])
+        return options
+
+    @staticmethod
+    def _update(pending: Dict[int, int], changes: Dict[int, Optional[int]]) -> None:
+        """Set the pending quantities of some demands, removing the planned ones."""
+        for index, quantity in changes.items():
+            if quantity is None:
+                pending.pop(index, None)
+            else:
+                pending[index] = quantity
+
+    def _build(
+        self,
+        queue: List[Dict[str, Any]],
+        singles: List[Optional[Tuple[float, Dict[str, Any], List[int]]]],
+        pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any], List[int]]],
+        decisions: List[Tuple[int, Optional[int]]],
+        existing_runs: Optional[List[Any]],
+        start_date: Optional[date],
+        result: ExactPackingResult,
+    ) -> None:
+        """Lay the runs of a pairing on the timeline, in the order they were chosen."""
+        cursor, previous = self._initial_cursor(existing_runs or [], start_date)
+        pending = list(queue)
+        for index, partner in decisions:
+            if partner is None:
+                refile, sheet, outputs = singles[index]
+                run, cursor = self._build_run(
+                    [(pending[index], outputs[0])], refile, sheet, cursor, previous
+                )
+            else:
+                refile, sheet, outputs = pairs[(index, partner)]
+                run, leftover, cursor = self._build_pair(
+                    pending[index],
+                    pending[partner],
+                    outputs,
+                    refile,
+                    sheet,
+                    cursor,
+                    previous,
+                )
+                if leftover:
+                    rest = (
+                        index
+                        if leftover["purchase"] is pending[index]["purchase"]
+                        else partner
+                    )
+                    pending[rest] = leftover
+            result.runs.append(run)
+            previous = run
+        result.unplaced.extend(
+            demand["purchase"].get("arapack_lot", "")
+            for demand, single in zip(queue, singles)
+            if single is None
+        )
@@ -0,0 +1,303 @@
+"""
+This module implements the HorizonPlanner class, which places new purchases over
+several consecutive weeks at once instead of one week at a time.
+"""
+
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from models.program_planning import ProductionRun
+from services.planning.packer import BinPacker, PackingResult
+from services.planning.scheduler import (
+    ShiftCalendar,
+    linear_meters,
+    production_minutes,
+    run_end,
+    run_speed,
+)
+from utils.iso_week import IsoWeek, iso_week, monday
+
+
+def run_minutes(run: Any, calendar: ShiftCalendar) -> int:
+    """
+    Get the machine time taken by a run.
+
+    Args:
+        run: The production run, as a model or a dictionary.
+        calendar: The working windows of the corrugator.
+
+    Returns:
+        int: The working minutes between its start and its end.
+    """
+    if not isinstance(run, ProductionRun):
+        run = ProductionRun.model_validate(run)
+    return calendar.working_minutes(
+        datetime.combine(run.scheduled_date, run.start_time), run_end(run)
+    )
+
+
+class WeekLoad(BaseModel):
+    """New runs and machine time of a week of the horizon."""
+
+    iso_year: int
+    iso_week: int
+    capacity_minutes: int  # Machine time available in the week
+    used_minutes: int  # Machine time of the existing and new runs
+    runs: List[ProductionRun] = []  # New runs to add to the week
+
+
+class HorizonResult(BaseModel):
+    """Result of a horizon planning pass."""
+
+    weeks: List[WeekLoad] = []  # Changes of each week, in order
+    unplaced: List[str] = []  # Arapack lots that could not be placed on any sheet
+    overflow: List[str] = []  # Arapack lots with no machine time left in the horizon
+
+
+class HorizonPlanner:
+    """
+    Planning engine spreading new purchases over a horizon of weeks.
+
+    Each purchase is assigned to the latest week, up to the week of its delivery
+    date, that still has machine time for it; the earlier weeks absorb what
+    does not fit, and what fits in none of them is carried to the first later
+    week with time left. The purchases of each week are then packed by the
+    BinPacker after the runs the week already has, so the cost grows with the
+    number of runs and weeks rather than with the size of the whole order book.
+    Purchases whose runs would end past the Sunday of their week are carried to
+    the next one, and reported as overflow past the last week of the horizon.
+    """
+
+    def __init__(
+        self,
+        packer: Optional[BinPacker] = None,
+        calendar: Optional[ShiftCalendar] = None,
+    ):
+        """
+        Initialize the HorizonPlanner.
+
+        Args:
+            packer: The planning engine used to build the runs of each week.
+            calendar: The working windows of a week, those of the packer timeline
+                by default.
+        """
+        self.packer = packer or BinPacker()
+        self.calendar = calendar or self.packer.scheduler.calendar
+
+    def plan(
+        self,
+        weeks: List[IsoWeek],
+        existing_runs: Dict[IsoWeek, List[Any]],
+        demands: List[Dict[str, Any]],
+        sheets: List[Dict[str, Any]],
+        today: Optional[date] = None,
+    ) -> HorizonResult:
+        """
+        Place demands over the weeks of the horizon.
+
+        Args:
+            weeks: The consecutive weeks of the horizon.
+            existing_runs: The runs already planned in each week.
+            demands: Dictionaries with the "purchase" and "box" data of each order.
+            sheets: The available sheets.
+            today: The first day new runs may be scheduled on, today by default.
+
+        Returns:
+            HorizonResult: The new runs of each week, the lots left unplaced,
+            either without box or without a sheet that fits it, and the lots
+            without machine time left in the horizon.
+        """
+        today = today or date.today()
+        capacities = [self._capacity(week, today) for week in weeks]
+        used = [
+            sum(
+                run_minutes(run, self.calendar) for run in existing_runs.get(week) or []
+            )
+            for week in weeks
+        ]
+        assigned: List[List[Dict[str, Any]]] = [[] for _ in weeks]
+        result = HorizonResult()
+        estimates: Dict[Tuple[Any, int], Optional[int]] = {}
+
+        for demand in sorted(demands, key=self._priority):
+            minutes = (
+                self._estimate(demand, sheets, estimates) if demand.get("box") else None
+            )
+            if minutes is None:
+                result.unplaced.append(demand["purchase"].get("arapack_lot", ""))
+                continue
+            index = self._choose_week(weeks, capacities, used, demand, minutes)
+            if index is None:
+                result.overflow.append(demand["purchase"].get("arapack_lot", ""))
+                continue
+            used[index] += minutes
+            assigned[index].append(demand)
+
+        carried: List[Dict[str, Any]] = []
+        for week, capacity, week_demands in zip(weeks, capacities, assigned):
+            runs = existing_runs.get(week) or []
+            packed, carried = self._pack_week(
+                week, carried + week_demands, sheets, runs, today
+            )
+            result.unplaced.extend(packed.unplaced)
+            result.weeks.append(
+                WeekLoad(
+                    iso_year=week[0],
+                    iso_week=week[1],
+                    capacity_minutes=capacity,
+                    used_minutes=sum(run_minutes(run, self.calendar) for run in runs)
+                    + sum(run_minutes(run, self.calendar) for run in packed.runs),
+                    runs=packed.runs,
+                )
+            )
+        result.overflow.extend(
+            demand["purchase"].get("arapack_lot", "") for demand in carried
+        )
+        return result
+
+    def _pack_week(
+        self,
+        week: IsoWeek,
+        demands: List[Dict[str, Any]],
+        sheets: List[Dict[str, Any]],
+        runs: List[Any],
+        today: date,
+    ) -> Tuple[PackingResult, List[Dict[str, Any]]]:
+        """
+        Pack the demands of a week, leaving out those whose runs end past it.
+
+        The machine time of a demand is estimated alone, so a week may still
+        overflow once its demands are paired and laid with their setups. The
+        demands of the runs ending past the Sunday are left out and the rest
+        packed again, until every run ends in the week.
+
+        Args:
+            week: The week.
+            demands: The demands assigned to the week.
+            sheets: The available sheets.
+            runs: The runs the week already has.
+            today: The first day new runs may be scheduled on.
+
+        Returns:
+            Tuple[PackingResult, List[Dict[str, Any]]]: The packing of the demands
+            kept in the week, and the demands carried to the next week.
+        """
+        carried: List[Dict[str, Any]] = []
+        while True:
+            packed = self.packer.plan(demands, sheets, runs, max(monday(week), today))
+            late = {
+                box.arapack_lot
+                for run in self.packer.scheduler.overflow(packed.runs, week)
+                for box in run.processed_boxes
+            }
+            kept = [
+                demand
+                for demand in demands
+                if demand["purchase"].get("arapack_lot", "") not in late
+            ]
+            if len(kept) == len(demands):
+                return packed, carried
+            carried.extend(
+                demand
+                for demand in demands
+                if demand["purchase"].get("arapack_lot", "") in late
+            )
+            demands = kept
+
+    def _choose_week(
+        self,
+        weeks: List[IsoWeek],
+        capacities: List[int],
+        used: List[int],
+        demand: Dict[str, Any],
+        minutes: int,
+    ) -> Optional[int]:
+        """
+        Get the position of the week a demand is planned in.
+
+        Args:
+            weeks: The weeks of the horizon.
+            capacities: The machine time available in each week.
+            used: The machine time already taken in each week.
+            demand: The demand to place.
+            minutes: The estimated machine time of the demand.
+
+        Returns:
+            Optional[int]: The latest week up to the delivery week with enough
+            machine time, else the first later week with it, or None if no week
+            of the horizon has it.
+        """
+        due = iso_week(demand["purchase"].get("estimated_delivery_date"))
+        due_index = len(weeks) - 1
+        if due and due < weeks[0]:
+            due_index = 0
+        elif due and due in weeks:
+            due_index = weeks.index(due)
+
+        for index in range(due_index, -1, -1):
+            if used[index] + minutes <= capacities[index]:
+                return index
+        for index in range(due_index + 1, len(weeks)):
+            if used[index] + minutes <= capacities[index]:
+                return index
+        return None
+
+    def _capacity(self, week: IsoWeek, today: date) -> int:
+        """
+        Get the machine time of a week from today on.
+
+        Args:
+            week: The week.
+            today: The first day new runs may be scheduled on.
+
+        Returns:
+            int: The minutes of the working windows left in the week.
+        """
+        return self.calendar.week_minutes(week, max(monday(week), today))
+
+    def _estimate(
+        self,
+        demand: Dict[str, Any],
+        sheets: List[Dict[str, Any]],
+        estimates: Dict[Tuple[Any, int], Optional[int]],
+    ) -> Optional[int]:
+        """
+        Estimate the machine time of a demand run alone on its best sheet.
+
+        Args:
+            demand: The demand to estimate.
+            sheets: The available sheets.
+            estimates: The estimates already computed, by box and quantity.
+
+        Returns:
+            Optional[int]: The minutes of the run, or None if no sheet fits the box.
+        """
+        box = demand["box"]
+        need = self._need(demand)
+        key = (box.get("symbol") or id(box), need)
+        if key not in estimates:
+            best = self.packer.best_single(box, sheets)
+            if best is None:
+                estimates[key] = None
+            else:
+                _, sheet, outputs = best
+                meters = linear_meters(need, box.get("length", 0), outputs[0])
+                speed = run_speed(sheet.get("speed", 1), bool(box.get("treatment")))
+                estimates[key] = production_minutes(meters, speed)
+        return estimates[key]
+
+    @staticmethod
+    def _need(demand: Dict[str, Any]) -> int:
+        """Get the quantity of a demand still to produce."""
+        purchase = demand["purchase"]
+        return purchase.get("missing_quantity") or purchase.get("quantity", 0)
+
+    @staticmethod
+    def _priority(demand: Dict[str, Any]) -> Tuple[datetime, int]:
+        """Order demands by earliest delivery date and highest quantity."""
+        delivery = demand["purchase"].get("estimated_delivery_date") or datetime.max
+        if isinstance(delivery, str):
+            delivery = datetime.fromisoformat(delivery)
+        return delivery, -HorizonPlanner._need(demand)
@@ -0,0 +1,362 @@
+"""
+This module implements the BinPacker class, a deterministic planning engine that
+combines one or two box designs per sheet roll following the corrugator rules
+described in templates/instructions.json.
+"""
+
+import math
+from datetime import date, datetime, time
+from typing import Dict, Any, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from models.program_planning import ProcessedBox, ProductionRun
+from models.program_planning import Sheet as RunSheet
+from services.planning.refile_matrix import (
+    MAX_REFILE,
+    MIN_REFILE,
+    RefileMatrix,
+    sheet_id,
+)
+from services.planning.scheduler import (
+    MachineScheduler,
+    linear_meters,
+    production_minutes,
+    run_end,
+    run_speed,
+)
+from utils.iso_week import WeekRef, monday
+
+
+class PackingResult(BaseModel):
+    """Result of a packing pass."""
+
+    runs: List[ProductionRun] = []  # Production runs proposed by the engine
+    unplaced: List[str] = []  # Arapack lots that could not be placed on any sheet
+
+
+def compute_refile(roll_width: float, widths_outputs: List[Tuple[float, int]]) -> float:
+    """
+    Calculate the refile left on a roll by one or two box designs.
+
+    Args:
+        roll_width: The width of the sheet roll.
+        widths_outputs: Pairs of (box width, outs) for each design in the run.
+
+    Returns:
+        float: The refile, negative if the designs do not fit.
+    """
+    return roll_width - sum(width * output for width, output in widths_outputs)
+
+
+def week_start(purchase: Dict[str, Any], week_of_year: WeekRef) -> date:
+    """
+    Get the first day the runs of a purchase may be scheduled on.
+
+    Args:
+        purchase: The purchase data.
+        week_of_year: The ISO (year, week) the purchase is planned in, or the
+            week number in the year of its delivery date.
+
+    Returns:
+        date: The Monday of the week, or today if that day has already passed.
+    """
+    if isinstance(week_of_year, tuple):
+        return max(monday(week_of_year), date.today())
+    delivery = purchase.get("estimated_delivery_date")
+    if isinstance(delivery, str):
+        delivery = datetime.fromisoformat(delivery)
+    year = delivery.isocalendar()[0] if delivery else date.today().year
+    return max(date.fromisocalendar(year, week_of_year, 1), date.today())
+
+
+class BinPacker:
+    """
+    Deterministic planning engine that builds production runs from purchases.
+
+    Each run holds one design, or two compatible designs, on the sheet that
+    leaves the smallest feasible refile. Demands are served by earliest
+    delivery date and highest quantity.
+    """
+
+    def __init__(
+        self,
+        min_refile: float = MIN_REFILE,
+        max_refile: float = MAX_REFILE,
+        scheduler: Optional[MachineScheduler] = None,
+    ):
+        """
+        Initialize the BinPacker.
+
+        Args:
+            min_refile: The minimum refile a run must leave on the roll.
+            max_refile: The refile above which a run needs authorization.
+            scheduler: The timeline the new runs are laid on.
+        """
+        self.min_refile = min_refile
+        self.max_refile = max_refile
+        self.scheduler = scheduler or MachineScheduler()
+
+    def matrix(
+        self,
+        boxes: List[Dict[str, Any]],
+        sheets: List[Dict[str, Any]],
+        pairs: bool = True,
+    ) -> RefileMatrix:
+        """
+        Compute the refile of some box designs, alone and in pairs, on the sheets.
+
+        Args:
+            boxes: The box data, one row each.
+            sheets: The available sheets.
+            pairs: Whether to compute the pairs of designs too.
+
+        Returns:
+            RefileMatrix: The refile and outs of every combination.
+        """
+        return RefileMatrix(boxes, sheets, self.min_refile, pairs)
+
+    def best_single(
+        self, box: Dict[str, Any], sheets: List[Dict[str, Any]]
+    ) -> Optional[Tuple[float, Dict[str, Any], List[int]]]:
+        """
+        Find the best sheet for a single box design.
+
+        Args:
+            box: The box data.
+            sheets: The available sheets.
+
+        Returns:
+            Optional[Tuple[float, Dict[str, Any], List[int]]]: The refile, the sheet
+            and the outs of the best combination, or None if no sheet fits.
+        """
+        return self.matrix([box], sheets, pairs=False).single(0)
+
+    def best_pair(
+        self,
+        box_a: Dict[str, Any],
+        box_b: Dict[str, Any],
+        sheets: List[Dict[str, Any]],
+    ) -> Optional[Tuple[float, Dict[str, Any], List[int]]]:
+        """
+        Find the best sheet and outs for a combination of two box designs.
+
+        Args:
+            box_a: The first box data.
+            box_b: The second box data.
+            sheets: The available sheets.
+
+        Returns:
+            Optional[Tuple[float, Dict[str, Any], List[int]]]: The refile, the sheet
+            and the outs of each design, or None if they cannot be combined.
+        """
+        return self.matrix([box_a, box_b], sheets).pair(0, 1)
+
+    def plan(
+        self,
+        demands: List[Dict[str, Any]],
+        sheets: List[Dict[str, Any]],
+        existing_runs: Optional[List[Any]] = None,
+        start_date: Optional[date] = None,
+    ) -> PackingResult:
+        """
+        Build production runs for a list of demands.
+
+        Args:
+            demands: Dictionaries with the "purchase" and "box" data of each order.
+            sheets: The available sheets.
+            existing_runs: Runs already in the plan, new runs are laid after them.
+            start_date: The first day new runs may be scheduled on.
+
+        Returns:
+            PackingResult: The proposed runs and the lots that could not be placed.
+        """
+        queue = [
+            {
+                "purchase": demand["purchase"],
+                "box": demand["box"],
+                "need": demand["purchase"].get("missing_quantity")
+                or demand["purchase"].get("quantity", 0),
+                "part": 1,
+            }
+            for demand in demands
+            if demand.get("box")
+        ]
+        # Leftovers keep the row of their demand in the matrix
+        for row, demand in enumerate(queue):
+            demand["row"] = row
+        matrix = self.matrix([demand["box"] for demand in queue], sheets)
+        queue.sort(key=self._priority)
+
+        result = PackingResult()
+        cursor, previous = self._initial_cursor(existing_runs or [], start_date)
+
+        while queue:
+            head = queue.pop(0)
+            best = matrix.single(head["row"])
+            partner_index = None
+            if queue:
+                rows = [other["row"] for other in queue]
+                refiles = matrix.pair_refile[head["row"], rows]
+                index = int(refiles.argmin())
+                if refiles[index] < (best[0] if best else math.inf):
+                    best = matrix.pair(head["row"], rows[index])
+                    partner_index = index
+
+            if best is None:
+                result.unplaced.append(head["purchase"].get("arapack_lot", ""))
+                continue
+
+            refile, sheet, outputs = best
+            if partner_index is None:
+                run, cursor = self._build_run(
+                    [(head, outputs[0])], refile, sheet, cursor, previous
+                )
+            else:
+                partner = queue.pop(partner_index)
+                run, leftover, cursor = self._build_pair(
+                    head, partner, outputs, refile, sheet, cursor, previous
+                )
+                if leftover:
+                    queue.append(leftover)
+                    queue.sort(key=self._priority)
+            result.runs.append(run)
+            previous = run
+
+        return result
+
+    def _build_pair(
+        self,
+        demand_a: Dict[str, Any],
+        demand_b: Dict[str, Any],
+        outputs: List[int],
+        refile: float,
+        sheet: Dict[str, Any],
+        cursor: datetime,
+        previous: Optional[ProductionRun],
+    ) -> Tuple[ProductionRun, Optional[Dict[str, Any]], datetime]:
+        """
+        Build a two-design run, the design needing the shortest run is the priority.
+
+        Returns:
+            Tuple[ProductionRun, Optional[Dict[str, Any]], datetime]: The run, the
+            complement demand still pending if any, and the next free slot.
+        """
+        entries = sorted(
+            [(demand_a, outputs[0]), (demand_b, outputs[1])],
+            key=lambda entry: linear_meters(
+                entry[0]["need"], entry[0]["box"].get("length", 0), entry[1]
+            ),
+        )
+        run, cursor = self._build_run(entries, refile, sheet, cursor, previous)
+
+        complement = entries[1][0]
+        produced = run.processed_boxes[1].quantity
+        if produced >= complement["need"]:
+            return run, None, cursor
+        leftover = dict(complement, need=complement["need"] - produced)
+        leftover["part"] = complement["part"] + 1
+        return run, leftover, cursor
+
+    def _build_run(
+        self,
+        entries: List[Tuple[Dict[str, Any], int]],
+        refile: float,
+        sheet: Dict[str, Any],
+        cursor: datetime,
+        previous: Optional[ProductionRun],
+    ) -> Tuple[ProductionRun, datetime]:
+        """
+        Build a production run from its demands and lay it on the timeline.
+
+        Args:
+            entries: Pairs of (demand, outs), the first one is the priority design.
+            refile: The refile left on the roll.
+            sheet: The sheet used for the run.
+            cursor: The first free slot on the timeline.
+            previous: The run before on the timeline, for its changeover.
+
+        Returns:
+            Tuple[ProductionRun, datetime]: The run and the next free slot.
+        """
+        priority, priority_output = entries[0]
+        priority_box = priority["box"]
+        meters = linear_meters(
+            priority["need"], priority_box.get("length", 0), priority_output
+        )
+
+        processed_boxes = []
+        for index, (demand, output) in enumerate(entries):
+            quantity = demand["need"]
+            if index > 0:
+                # The complement fills the same length of roll as the priority
+                produced = math.floor(
+                    meters * 100 * output / demand["box"].get("length", 1)
+                )
+                quantity = min(produced, demand["need"])
+            purchase = demand["purchase"]
+            processed_boxes.append(
+                ProcessedBox(
+                    order_number=purchase.get("order_number", ""),
+                    symbol=purchase.get("symbol", ""),
+                    quantity=quantity,
+                    output=output,
+                    hierarchy="priority" if index == 0 else "complement",
+                    part=demand["part"],
+                    remaining=demand["need"] - quantity,
+                    arapack_lot=purchase.get("arapack_lot", ""),
+                )
+            )
+
+        treatment = bool(priority_box.get("treatment"))
+        speed = run_speed(sheet.get("speed", 1), treatment)
+
+        run = ProductionRun(
+            processed_boxes=processed_boxes,
+            authorized_refile=refile > self.max_refile,
+            sheet=RunSheet(
+                id=sheet_id(sheet),
+                ect=priority_box.get("ect"),
+                roll_width=sheet.get("roll_width", 0),
+                p1=sheet.get("p1", 0),
+                p2=sheet.get("p2", 0),
+                p3=sheet.get("p3", 0),
+            ),
+            scheduled_date=cursor.date(),
+            treatment=treatment,
+            start_time=cursor.time(),
+            end_time=cursor.time(),
+            refile=round(refile, 2),
+            linear_meters=math.ceil(meters),
+            speed=speed,
+        )
+        end = self.scheduler.place(
+            run, cursor, previous, production_minutes(meters, speed)
+        )
+        return run, end
+
+    @staticmethod
+    def _priority(demand: Dict[str, Any]) -> Tuple[datetime, int]:
+        """Order demands by earliest delivery date and highest quantity."""
+        delivery = demand["purchase"].get("estimated_delivery_date") or datetime.max
+        if isinstance(delivery, str):
+            delivery = datetime.fromisoformat(delivery)
+        return delivery, -demand["need"]
+
+    @staticmethod
+    def _initial_cursor(
+        existing_runs: List[Any], start_date: Optional[date]
+    ) -> Tuple[datetime, Optional[ProductionRun]]:
+        """Get the first free moment after the existing runs, and the last of them."""
+        cursor = datetime.combine(start_date or date.today(), time.min)
+        previous = None
+        for existing in existing_runs:
+            run = (
+                existing
+                if isinstance(existing, ProductionRun)
+                else ProductionRun.model_validate(existing)
+            )
+            end = run_end(run)
+            if end >= cursor:
+                cursor, previous = end, run
+        return cursor, previous
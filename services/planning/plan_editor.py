@@ -0,0 +1,530 @@
+"""
+This module implements the PlanEditor class, which applies incremental edits to the
+production runs of a week instead of rewriting the whole program planning.
+"""
+
+import math
+from datetime import date, datetime, time
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from config.logging import logger
+from models.program_planning import ProductionRun
+from repositories.box_repository import BoxRepository
+from repositories.program_planning_repository import ProgramPlanningRepository
+from repositories.purchase_repository import PurchaseRepository
+from repositories.sheet_repository import SheetRepository
+from services.planning.packer import MAX_REFILE, compute_refile
+from services.planning.scheduler import (
+    MachineScheduler,
+    ShiftCalendar,
+    linear_meters,
+    production_minutes,
+    run_end,
+    set_run_end,
+)
+from services.planning.sequencer import RunSequencer, SequenceResult
+from utils.iso_week import WeekRef, monday, resolve_week
+
+
+def recompute_run(
+    run: ProductionRun,
+    boxes: Dict[str, Dict[str, Any]],
+    calendar: Optional[ShiftCalendar] = None,
+) -> ProductionRun:
+    """
+    Recalculate the derived fields of a run after its boxes changed.
+
+    The first processed box is the priority design and sets the length of the run.
+    Complements are adjusted to that length, keeping their pending quantity in
+    remaining. The run keeps its start time and its end is recalculated in the
+    windows of the shift calendar, on a later day if it does not fit in its own.
+
+    Args:
+        run: The production run to recompute.
+        boxes: The box data of the run designs keyed by symbol.
+        calendar: The working windows of the corrugator.
+
+    Returns:
+        ProductionRun: The recomputed run.
+    """
+    priority = run.processed_boxes[0]
+    priority.hierarchy = "priority"
+    meters = linear_meters(
+        priority.quantity, boxes[priority.symbol].get("length", 0), priority.output
+    )
+
+    for complement in run.processed_boxes[1:]:
+        need = complement.quantity + complement.remaining
+        produced = math.floor(
+            meters * 100 * complement.output / boxes[complement.symbol].get("length", 1)
+        )
+        complement.hierarchy = "complement"
+        complement.quantity = min(produced, need)
+        complement.remaining = need - complement.quantity
+
+    run.refile = round(
+        compute_refile(
+            run.sheet.roll_width,
+            [
+                (boxes[box.symbol].get("width", 0), box.output)
+                for box in run.processed_boxes
+            ],
+        ),
+        2,
+    )
+    run.authorized_refile = run.refile > MAX_REFILE
+    run.linear_meters = math.ceil(meters)
+    set_run_end(
+        run,
+        (calendar or ShiftCalendar()).advance(
+            datetime.combine(run.scheduled_date, run.start_time),
+            production_minutes(meters, run.speed),
+        ),
+    )
+    return run
+
+
+def serialize_run(run: ProductionRun) -> Dict[str, Any]:
+    """
+    Serialize a run the way production runs are stored in the database.
+
+    Args:
+        run: The production run to serialize.
+
+    Returns:
+        Dict[str, Any]: The run with dates and times as ISO strings.
+    """
+    return run.model_dump(mode="json")
+
+
+class PlanEditor:
+    """
+    Incremental edits on the production runs of a week.
+
+    Each edit reads only the runs it touches, recomputes them and persists them
+    with targeted $push/$set updates, so the cost of an edit does not depend on
+    the size of the week.
+    """
+
+    def __init__(
+        self,
+        scheduler: Optional[MachineScheduler] = None,
+        sequencer: Optional[RunSequencer] = None,
+    ):
+        """
+        Initialize the PlanEditor.
+
+        Args:
+            scheduler: The timeline used to lay the runs of a week again.
+            sequencer: The optimizer of the order of the runs of a week, on the
+                same timeline by default.
+        """
+        self.scheduler = scheduler or MachineScheduler()
+        self.sequencer = sequencer or RunSequencer(self.scheduler)
+
+    async def insert_runs(
+        self, week: WeekRef, runs: List[ProductionRun], position: Optional[int] = None
+    ) -> None:
+        """
+        Insert production runs into a week.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            runs: The runs to insert, already scheduled.
+            position: The position to insert the runs at, or None to append them.
+        """
+        if not runs:
+            return
+        await ProgramPlanningRepository.push_runs(
+            week, [serialize_run(run) for run in runs], position
+        )
+
+    async def remove_box(self, week: WeekRef, arapack_lot: str) -> bool:
+        """
+        Remove a purchase from every run of a week.
+
+        Runs left without boxes are removed, the others are recomputed with their
+        remaining designs.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            arapack_lot: The arapack lot of the purchase to remove.
+
+        Returns:
+            bool: True if the purchase was removed, False if a run could not be
+            recomputed because a box is missing from the catalog.
+        """
+        matches = await ProgramPlanningRepository.find_runs_with_lot(week, arapack_lot)
+        updated: Dict[int, Dict[str, Any]] = {}
+        removed: List[int] = []
+
+        for index, run in matches:
+            run.processed_boxes = [
+                box for box in run.processed_boxes if box.arapack_lot != arapack_lot
+            ]
+            if not run.processed_boxes:
+                removed.append(index)
+                continue
+            boxes = await self._load_boxes(run)
+            if boxes is None:
+                return False
+            updated[index] = serialize_run(
+                recompute_run(run, boxes, self.scheduler.calendar)
+            )
+
+        await ProgramPlanningRepository.set_runs(week, updated)
+        await ProgramPlanningRepository.remove_runs(week, removed)
+        return True
+
+    async def remove_box_from_run(
+        self, week: WeekRef, index: int, arapack_lot: str
+    ) -> Optional[ProductionRun]:
+        """
+        Remove a purchase from a single run.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            index: The position of the run in the week.
+            arapack_lot: The arapack lot of the purchase to remove.
+
+        Returns:
+            Optional[ProductionRun]: The recomputed run, or None if the run was
+            removed or could not be found.
+        """
+        run = await ProgramPlanningRepository.get_run(week, index)
+        if not run:
+            return None
+
+        run.processed_boxes = [
+            box for box in run.processed_boxes if box.arapack_lot != arapack_lot
+        ]
+        if not run.processed_boxes:
+            await ProgramPlanningRepository.remove_runs(week, [index])
+            return None
+
+        boxes = await self._load_boxes(run)
+        if boxes is None:
+            return None
+        run = recompute_run(run, boxes, self.scheduler.calendar)
+        await ProgramPlanningRepository.set_runs(week, {index: serialize_run(run)})
+        return run
+
+    async def reschedule_run(
+        self, week: WeekRef, index: int, scheduled_date: date, start_time: time
+    ) -> Optional[ProductionRun]:
+        """
+        Move a run to another slot, keeping its working time.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            index: The position of the run in the week.
+            scheduled_date: The new production date.
+            start_time: The new start time.
+
+        Returns:
+            Optional[ProductionRun]: The rescheduled run, or None if it does not exist.
+        """
+        run = await ProgramPlanningRepository.get_run(week, index)
+        if not run:
+            return None
+
+        calendar = self.scheduler.calendar
+        minutes = calendar.working_minutes(
+            datetime.combine(run.scheduled_date, run.start_time), run_end(run)
+        )
+        run.scheduled_date = scheduled_date
+        run.start_time = start_time
+        set_run_end(
+            run,
+            calendar.advance(datetime.combine(scheduled_date, start_time), minutes),
+        )
+        await ProgramPlanningRepository.set_runs(week, {index: serialize_run(run)})
+        return run
+
+    async def split_run(
+        self, week: WeekRef, index: int, quantity: int
+    ) -> Optional[List[ProductionRun]]:
+        """
+        Split a run in two, the first one producing only part of the priority design.
+
+        The second run produces the rest as the next part of the same orders and
+        is inserted right after the first one.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            index: The position of the run in the week.
+            quantity: The priority quantity kept in the first run.
+
+        Returns:
+            Optional[List[ProductionRun]]: Both runs, or None if the run does not
+            exist, the quantity does not split it or a box is missing.
+        """
+        run = await ProgramPlanningRepository.get_run(week, index)
+        if not run or not 0 < quantity < run.processed_boxes[0].quantity:
+            return None
+        boxes = await self._load_boxes(run)
+        if boxes is None:
+            return None
+
+        second = run.model_copy(deep=True)
+        first_priority = run.processed_boxes[0]
+        second_priority = second.processed_boxes[0]
+
+        second_priority.quantity = first_priority.quantity - quantity
+        second_priority.part = first_priority.part + 1
+        first_priority.quantity = quantity
+        first_priority.remaining = first_priority.remaining + second_priority.quantity
+        first = recompute_run(run, boxes, self.scheduler.calendar)
+
+        # The complements of the second part only produce what the first one left
+        for first_box, second_box in zip(
+            first.processed_boxes[1:], second.processed_boxes[1:]
+        ):
+            second_box.quantity = 0
+            second_box.remaining = first_box.remaining
+            second_box.part = first_box.part + 1
+        second.scheduled_date = run_end(first).date()
+        second.start_time = first.end_time
+        second = recompute_run(second, boxes, self.scheduler.calendar)
+
+        await ProgramPlanningRepository.set_runs(week, {index: serialize_run(first)})
+        await ProgramPlanningRepository.push_runs(
+            week, [serialize_run(second)], index + 1
+        )
+        return [first, second]
+
+    async def retime_week(
+        self, week: WeekRef, today: Optional[date] = None
+    ) -> List[ProductionRun]:
+        """
+        Lay the runs of a week again on the timeline, in their order.
+
+        Runs of the past days of the week are kept. The others get their linear
+        meters, speed, date and times from the machine scheduler, back to back
+        after the last kept run and from today on.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            today: The first day runs may be moved to, today by default.
+
+        Returns:
+            List[ProductionRun]: The runs laid again, the purchases of those ending
+            after the week are logged.
+        """
+        program_planning = await ProgramPlanningRepository.get_by_week(week)
+        if not program_planning or not program_planning.production_runs:
+            return []
+
+        pending, cursor, previous = self._pending_runs(
+            program_planning.production_runs, week, today
+        )
+        if not pending:
+            return []
+
+        boxes, sheets = await self._load_timeline_data([run for _, run in pending])
+        self.scheduler.schedule(
+            [run for _, run in pending], cursor, previous, boxes, sheets
+        )
+        await ProgramPlanningRepository.set_runs(
+            week, {index: serialize_run(run) for index, run in pending}
+        )
+        self.overflow_lots(week, [run for _, run in pending])
+        return [run for _, run in pending]
+
+    async def sequence_week(
+        self, week: WeekRef, today: Optional[date] = None
+    ) -> SequenceResult:
+        """
+        Reorder the runs of a week to reduce their setup time, then lay them again.
+
+        Runs of the past days of the week keep their place. The others are
+        reordered by the run sequencer without making more of them end after the
+        delivery date of their purchases, and take the positions they had.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            today: The first day runs may be moved to, today by default.
+
+        Returns:
+            SequenceResult: The reordered runs, their setup before and after and
+            the purchases of those ending after the week.
+        """
+        program_planning = await ProgramPlanningRepository.get_by_week(week)
+        if not program_planning or not program_planning.production_runs:
+            return SequenceResult()
+
+        pending, cursor, previous = self._pending_runs(
+            program_planning.production_runs, week, today
+        )
+        if not pending:
+            return SequenceResult()
+
+        runs = [run for _, run in pending]
+        boxes, sheets = await self._load_timeline_data(runs)
+        due_dates = await PurchaseRepository.get_delivery_dates(
+            list({box.arapack_lot for run in runs for box in run.processed_boxes})
+        )
+        result = self.sequencer.sequence(
+            runs, cursor, due_dates, previous, boxes, sheets
+        )
+        await ProgramPlanningRepository.set_runs(
+            week,
+            {
+                index: serialize_run(run)
+                for (index, _), run in zip(pending, result.runs)
+            },
+        )
+        result.overflow = self.overflow_lots(week, result.runs)
+        return result
+
+    def overflow_lots(self, week: WeekRef, runs: List[ProductionRun]) -> List[str]:
+        """
+        Get the purchases of a week with runs laid past its Sunday, logging them.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            runs: The runs laid on the timeline.
+
+        Returns:
+            List[str]: The arapack lots of the runs ending after the week.
+        """
+        week = resolve_week(week)
+        lots = list(
+            dict.fromkeys(
+                box.arapack_lot
+                for run in self.scheduler.overflow(runs, week)
+                for box in run.processed_boxes
+            )
+        )
+        if lots:
+            logger.warning(f"Runs of week {week} end after its Sunday: {lots}")
+        return lots
+
+    async def movable_lots(
+        self, week: WeekRef, arapack_lots: List[str], today: Optional[date] = None
+    ) -> Tuple[Set[str], List[ProductionRun]]:
+        """
+        Get the purchases of a week whose runs may all be planned again.
+
+        A purchase planned in the week is movable when none of its runs is on a
+        past day of the week, nor shares a run with a purchase that is not.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            arapack_lots: The arapack lots of the purchases.
+            today: The first day runs may be moved to, today by default.
+
+        Returns:
+            Tuple[Set[str], List[ProductionRun]]: The movable lots planned in the
+            week, and the runs of the week that keep their place.
+        """
+        program_planning = await ProgramPlanningRepository.get_by_week(week)
+        if not program_planning or not program_planning.production_runs:
+            return set(), []
+
+        runs = program_planning.production_runs
+        pending, _, _ = self._pending_runs(runs, week, today)
+        pending_indexes = {index for index, _ in pending}
+        run_lots = [{box.arapack_lot for box in run.processed_boxes} for run in runs]
+        movable = {lot for lots in run_lots for lot in lots} & set(arapack_lots)
+        changed = True
+        while changed:
+            changed = False
+            for index, lots in enumerate(run_lots):
+                if lots & movable and (
+                    index not in pending_indexes or not lots <= movable
+                ):
+                    movable -= lots
+                    changed = True
+        kept = [run for lots, run in zip(run_lots, runs) if not lots & movable]
+        return movable, kept
+
+    async def replace_runs(
+        self,
+        week: WeekRef,
+        arapack_lots: Set[str],
+        runs: List[ProductionRun],
+        today: Optional[date] = None,
+    ) -> List[ProductionRun]:
+        """
+        Replace the runs of some movable purchases of a week, then lay it again.
+
+        Args:
+            week: The ISO (year, week) of the program planning.
+            arapack_lots: The arapack lots returned by movable_lots.
+            runs: The new runs of the purchases.
+            today: The first day runs may be moved to, today by default.
+
+        Returns:
+            List[ProductionRun]: The runs laid again, the purchases of those ending
+            after the week are logged.
+        """
+        program_planning = await ProgramPlanningRepository.get_by_week(week)
+        if program_planning and program_planning.production_runs:
+            pending, _, _ = self._pending_runs(
+                program_planning.production_runs, week, today
+            )
+            await ProgramPlanningRepository.remove_runs(
+                week,
+                [
+                    index
+                    for index, run in pending
+                    if any(
+                        box.arapack_lot in arapack_lots for box in run.processed_boxes
+                    )
+                ],
+            )
+        await self.insert_runs(week, runs)
+        return await self.retime_week(week, today)
+
+    @staticmethod
+    def _pending_runs(
+        runs: List[ProductionRun], week: WeekRef, today: Optional[date]
+    ) -> Tuple[List[Tuple[int, ProductionRun]], datetime, Optional[ProductionRun]]:
+        """
+        Get the runs of a week that may still move and where they start.
+
+        Returns:
+            Tuple: The positions and runs not on the past days of the week, the
+            first moment they may start at and the last kept run before them.
+        """
+        today = today or date.today()
+        first_day = monday(resolve_week(week))
+        pending = [
+            (index, run)
+            for index, run in enumerate(runs)
+            if not first_day <= run.scheduled_date < today
+        ]
+
+        cursor = datetime.combine(max(first_day, today), time.min)
+        previous = None
+        for run in runs:
+            end = run_end(run)
+            if first_day <= run.scheduled_date < today and end >= cursor:
+                cursor, previous = end, run
+        return pending, cursor, previous
+
+    @staticmethod
+    async def _load_timeline_data(
+        runs: List[ProductionRun],
+    ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """Get the priority box data by symbol and the sheet data by ID of some runs."""
+        boxes = await BoxRepository.get_by_symbols(
+            {box.symbol for run in runs for box in run.processed_boxes[:1]}
+        )
+        sheets = await SheetRepository.get_by_ids(list({run.sheet.id for run in runs}))
+        return (
+            {box.symbol: box.model_dump() for box in boxes},
+            {str(sheet.id): sheet.model_dump() for sheet in sheets},
+        )
+
+    @staticmethod
+    async def _load_boxes(run: ProductionRun) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Get the box data of the designs of a run, or None if one is missing."""
+        boxes = {}
+        for processed_box in run.processed_boxes:
+            box = await BoxRepository.get_by_symbol(processed_box.symbol)
+            if not box:
+                return None
+            boxes[processed_box.symbol] = box.model_dump()
+        return boxes
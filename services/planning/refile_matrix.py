@@ -0,0 +1,244 @@
+"""
+This module implements the RefileMatrix class, a vectorized table of refile and
+outs for every box, box pair and sheet a planning pass works with.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+# Corrugator constraints
+MAX_OUTPUTS = 4  # Maximum number of outs across the roll for a single run
+MIN_REFILE = 4.0  # Minimum trim (cm) the corrugator needs on the roll edges
+MAX_REFILE = 8.0  # Trim (cm) above which the run needs an authorized refile
+
+# Outs combinations allowed for two designs on the same roll, in search order
+_PAIR_OUTPUTS = [
+    (output_a, output_b)
+    for output_a in range(1, MAX_OUTPUTS)
+    for output_b in range(1, MAX_OUTPUTS - output_a + 1)
+]
+
+# Maximum number of (box, box, sheet) cells evaluated at once
+_CHUNK_CELLS = 4_000_000
+
+
+def sheet_id(sheet: Dict[str, Any]) -> str:
+    """
+    Get the identifier of a sheet as a string.
+
+    Args:
+        sheet: The sheet data.
+
+    Returns:
+        str: The sheet identifier.
+    """
+    return str(sheet.get("id") or sheet.get("_id") or "")
+
+
+class RefileMatrix:
+    """
+    Refile, outs and compatibility of a set of boxes on a set of sheets.
+
+    All combinations are computed in a batched NumPy pass when the matrix is
+    built, so the packers query them as plain array lookups. Infeasible
+    combinations have an infinite refile. Ties keep the first sheet, and for
+    pairs the first outs combination, like a scan of the sheets in order.
+
+    Attributes:
+        single_refile: (boxes, sheets) refile of each design alone on each sheet.
+        single_outputs: (boxes, sheets) outs of each design alone on each sheet.
+        sheet_mask: (boxes, sheets) whether the sheet is enabled and takes the box ECT.
+        compatible: (boxes, boxes) whether two designs share ECT and treatment.
+        pair_refile: (boxes, boxes) lowest refile of each pair over all sheets.
+        pair_sheet: (boxes, boxes) index of the sheet giving pair_refile.
+        pair_outputs: (boxes, boxes, 2) outs of each design of the best pair.
+    """
+
+    def __init__(
+        self,
+        boxes: List[Dict[str, Any]],
+        sheets: List[Dict[str, Any]],
+        min_refile: float = MIN_REFILE,
+        pairs: bool = True,
+    ):
+        """
+        Build the matrix for some boxes and sheets.
+
+        Args:
+            boxes: The box data, each with symbol, width, ect and treatment.
+            sheets: The sheet data, each with roll_width, ect and status.
+            min_refile: The minimum refile a run must leave on the roll.
+            pairs: Whether to compute the pair tables, they stay infeasible if not.
+        """
+        self.boxes = boxes
+        self.sheets = sheets
+        self.min_refile = min_refile
+
+        # ECTs are compared through a code per distinct value
+        self._ect_codes: Dict[Any, int] = {}
+        self.ects = np.array(
+            [
+                self._ect_codes.setdefault(box.get("ect"), len(self._ect_codes))
+                for box in boxes
+            ],
+            dtype=int,
+        )
+        self.widths = np.array([box.get("width") or 0 for box in boxes], dtype=float)
+        self.treatments = np.array(
+            [bool(box.get("treatment")) for box in boxes], dtype=bool
+        )
+        self.roll_widths = np.array(
+            [sheet.get("roll_width") or 0 for sheet in sheets], dtype=float
+        )
+
+        self.sheet_mask = self._build_sheet_mask()
+        self.compatible = (self.ects[:, None] == self.ects[None, :]) & (
+            self.treatments[:, None] == self.treatments[None, :]
+        )
+        self._build_single()
+        self._build_pairs(pairs)
+
+    def single(self, row: int) -> Optional[Tuple[float, Dict[str, Any], List[int]]]:
+        """
+        Get the best sheet for a box design alone.
+
+        Args:
+            row: The row of the box.
+
+        Returns:
+            Optional[Tuple[float, Dict[str, Any], List[int]]]: The refile, the sheet
+            and the outs of the best combination, or None if no sheet fits.
+        """
+        if not self.sheets:
+            return None
+        column = int(self.single_refile[row].argmin())
+        refile = self.single_refile[row, column]
+        if not np.isfinite(refile):
+            return None
+        return (
+            float(refile),
+            self.sheets[column],
+            [int(self.single_outputs[row, column])],
+        )
+
+    def pair(
+        self, row_a: int, row_b: int
+    ) -> Optional[Tuple[float, Dict[str, Any], List[int]]]:
+        """
+        Get the best sheet and outs for a combination of two box designs.
+
+        Args:
+            row_a: The row of the first box.
+            row_b: The row of the second box.
+
+        Returns:
+            Optional[Tuple[float, Dict[str, Any], List[int]]]: The refile, the sheet
+            and the outs of each design, or None if they cannot be combined.
+        """
+        refile = self.pair_refile[row_a, row_b]
+        if not np.isfinite(refile):
+            return None
+        return (
+            float(refile),
+            self.sheets[self.pair_sheet[row_a, row_b]],
+            [int(output) for output in self.pair_outputs[row_a, row_b]],
+        )
+
+    def top_sheets(self, k: int, tiebreak: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Rank the sheets of every box alone by refile.
+
+        Args:
+            k: The number of sheets kept for each box.
+            tiebreak: A key per sheet ordering equal refiles, lowest first. Equal
+                keys keep the order of the sheets.
+
+        Returns:
+            np.ndarray: (boxes, k) sheet columns of each box, best first, with -1
+            where the box has fewer than k feasible sheets.
+        """
+        k = max(0, min(k, len(self.sheets)))
+        if tiebreak is None:
+            tiebreak = np.zeros(len(self.sheets))
+        keys = np.broadcast_to(tiebreak, self.single_refile.shape)
+        order = np.lexsort((keys, self.single_refile), axis=-1)[:, :k]
+        feasible = np.isfinite(np.take_along_axis(self.single_refile, order, axis=1))
+        return np.where(feasible, order, -1)
+
+    def _build_sheet_mask(self) -> np.ndarray:
+        """Get which sheets are enabled and take the ECT of each box."""
+        sheet_ects = {}
+        for s, sheet in enumerate(self.sheets):
+            if not sheet.get("status", True):
+                continue
+            for ect in sheet.get("ect") or []:
+                if ect in self._ect_codes:
+                    sheet_ects.setdefault(self._ect_codes[ect], []).append(s)
+
+        mask = np.zeros((len(self.boxes), len(self.sheets)), dtype=bool)
+        for code, columns in sheet_ects.items():
+            mask[np.ix_(self.ects == code, columns)] = True
+        return mask
+
+    def _build_single(self) -> None:
+        """Compute the largest outs leaving the minimum refile on each sheet."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            outputs = np.floor(self.roll_widths[None, :] / self.widths[:, None])
+        outputs = np.where(self.widths[:, None] > 0, outputs, 0)
+        outputs = np.clip(outputs, 0, MAX_OUTPUTS).astype(int)
+
+        # Drop outs until the refile fits, the same product as compute_refile
+        for _ in range(MAX_OUTPUTS):
+            refile = self.roll_widths[None, :] - self.widths[:, None] * outputs
+            outputs = np.where(
+                (outputs > 0) & (refile < self.min_refile), outputs - 1, outputs
+            )
+        refile = self.roll_widths[None, :] - self.widths[:, None] * outputs
+
+        feasible = self.sheet_mask & (outputs > 0)
+        self.single_outputs = np.where(feasible, outputs, 0)
+        self.single_refile = np.where(feasible, refile, np.inf)
+
+    def _build_pairs(self, pairs: bool) -> None:
+        """Compute the best sheet and outs of every pair of designs."""
+        box_count = len(self.boxes)
+        sheet_count = max(len(self.sheets), 1)
+        self.pair_refile = np.full((box_count, box_count), np.inf)
+        self.pair_sheet = np.zeros((box_count, box_count), dtype=int)
+        self.pair_outputs = np.zeros((box_count, box_count, 2), dtype=int)
+        if not pairs or box_count == 0 or not self.sheets:
+            return
+
+        combos = np.array(_PAIR_OUTPUTS, dtype=int)
+        chunk = max(1, _CHUNK_CELLS // (box_count * sheet_count))
+        for start in range(0, box_count, chunk):
+            rows = slice(start, min(start + chunk, box_count))
+            # Pairs are only valid on sheets that take both designs
+            valid = (
+                self.compatible[rows, :, None]
+                & self.sheet_mask[rows, None, :]
+                & (self.widths[rows, None, None] > 0)
+            )
+
+            # Best outs on each sheet first, so ties keep the first sheet
+            best = np.full(valid.shape, np.inf)
+            best_combo = np.zeros(valid.shape, dtype=int)
+            for combo, (output_a, output_b) in enumerate(_PAIR_OUTPUTS):
+                refile = self.roll_widths[None, None, :] - (
+                    self.widths[rows, None, None] * output_a
+                    + self.widths[None, :, None] * output_b
+                )
+                refile = np.where(valid & (refile >= self.min_refile), refile, np.inf)
+                better = refile < best
+                best = np.where(better, refile, best)
+                best_combo = np.where(better, combo, best_combo)
+
+            sheet = best.argmin(axis=2)
+            self.pair_refile[rows] = np.take_along_axis(
+                best, sheet[:, :, None], axis=2
+            )[:, :, 0]
+            self.pair_sheet[rows] = sheet
+            self.pair_outputs[rows] = combos[
+                np.take_along_axis(best_combo, sheet[:, :, None], axis=2)[:, :, 0]
+            ]
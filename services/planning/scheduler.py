@@ -0,0 +1,447 @@
+"""
+This module implements the MachineScheduler class, which lays production runs on
+the corrugator timeline from their linear meters, their speed and the shift
+calendar, adding the setup time between runs of different sheets.
+"""
+
+import math
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from config.planning import (
+    PLANNING_CHANGEOVER_ECT_MINUTES,
+    PLANNING_CHANGEOVER_TREATMENT_MINUTES,
+    PLANNING_CHANGEOVER_WIDTH_MINUTES,
+    PLANNING_SHIFTS,
+    PLANNING_WORKING_DAYS,
+)
+from models.program_planning import ProductionRun
+from utils.iso_week import IsoWeek, monday
+
+# Minutes of a day
+DAY_MINUTES = 24 * 60
+
+# Days searched for a working window before giving up
+MAX_LOOKAHEAD_DAYS = 366
+
+TREATMENT_SPEED_FACTOR = 0.7  # Anti-humidity treatment reduces speed by 30%
+
+
+def linear_meters(quantity: int, box_length: float, output: int) -> float:
+    """
+    Calculate the linear meters needed to produce a quantity of boxes.
+
+    Args:
+        quantity: The number of boxes to produce.
+        box_length: The length of the box design in centimeters.
+        output: The number of outs across the roll.
+
+    Returns:
+        float: The linear meters of sheet consumed.
+    """
+    return ((quantity * box_length) / 100) / output
+
+
+def run_speed(sheet_speed: int, treatment: bool) -> int:
+    """
+    Get the corrugator speed for a run.
+
+    Args:
+        sheet_speed: The nominal speed of the sheet in meters per minute.
+        treatment: Whether the run has anti-humidity treatment.
+
+    Returns:
+        int: The effective speed in meters per minute.
+    """
+    if treatment:
+        return max(1, round(sheet_speed * TREATMENT_SPEED_FACTOR))
+    return max(1, sheet_speed)
+
+
+def production_minutes(meters: float, speed: int) -> int:
+    """
+    Calculate the production time of a run.
+
+    Args:
+        meters: The linear meters of the run.
+        speed: The effective speed in meters per minute.
+
+    Returns:
+        int: The production time in minutes, at least one.
+    """
+    return max(1, round(meters / speed))
+
+
+def run_end(run: ProductionRun) -> datetime:
+    """
+    Get the moment a run ends.
+
+    Args:
+        run: The production run.
+
+    Returns:
+        datetime: Its end time, on its end date when it runs past its scheduled date.
+    """
+    return datetime.combine(run.end_date or run.scheduled_date, run.end_time)
+
+
+def set_run_end(run: ProductionRun, end: datetime) -> None:
+    """
+    Set the moment a run ends, keeping the end date only past its scheduled date.
+
+    Args:
+        run: The production run, its end time and date are updated.
+        end: The end of the run.
+    """
+    run.end_time = end.time()
+    run.end_date = end.date() if end.date() != run.scheduled_date else None
+
+
+def _minutes(value: str) -> int:
+    """Get the minutes since midnight of a HH:MM time, 24:00 being the end of the day."""
+    hours, minutes = value.strip().split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_shifts(value: str) -> List[Tuple[int, int]]:
+    """
+    Parse the working shifts of a day.
+
+    Args:
+        value: Comma separated HH:MM-HH:MM windows, a window ending before it
+            starts runs through midnight.
+
+    Returns:
+        List[Tuple[int, int]]: The windows as minutes since midnight, sorted and
+        with adjacent shifts merged.
+    """
+    windows = []
+    for shift in filter(None, (part.strip() for part in value.split(","))):
+        start, end = (_minutes(bound) for bound in shift.split("-"))
+        if end <= start:
+            windows.extend([(start, DAY_MINUTES), (0, end)])
+        else:
+            windows.append((start, end))
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(window for window in windows if window[0] < window[1]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def parse_days(value: str) -> Set[int]:
+    """
+    Parse the working days of a week.
+
+    Args:
+        value: Comma separated weekdays, Monday being 0.
+
+    Returns:
+        Set[int]: The working weekdays.
+    """
+    return {int(day) for day in value.split(",") if day.strip()}
+
+
+class ShiftCalendar:
+    """
+    Working windows of the corrugator.
+
+    Every working day has the same shifts, non working weekdays and holidays
+    have none.
+    """
+
+    def __init__(
+        self,
+        shifts: Optional[List[Tuple[int, int]]] = None,
+        working_days: Optional[Iterable[int]] = None,
+        holidays: Optional[Iterable[date]] = None,
+    ):
+        """
+        Initialize the ShiftCalendar.
+
+        Args:
+            shifts: The windows of a working day as minutes since midnight.
+            working_days: The working weekdays, Monday being 0.
+            holidays: The days not worked.
+        """
+        self.shifts = shifts if shifts is not None else parse_shifts(PLANNING_SHIFTS)
+        self.working_days = set(
+            working_days
+            if working_days is not None
+            else parse_days(PLANNING_WORKING_DAYS)
+        )
+        self.holidays = set(holidays or [])
+        self.day_minutes = sum(end - start for start, end in self.shifts)
+
+    def windows(self, day: date) -> List[Tuple[int, int]]:
+        """
+        Get the working windows of a day.
+
+        Args:
+            day: The day.
+
+        Returns:
+            List[Tuple[int, int]]: The windows as minutes since midnight.
+        """
+        if day.weekday() not in self.working_days or day in self.holidays:
+            return []
+        return self.shifts
+
+    def week_minutes(self, week: IsoWeek, first_day: Optional[date] = None) -> int:
+        """
+        Get the working time of a week.
+
+        Args:
+            week: The ISO year and week.
+            first_day: The first day counted, the Monday of the week by default.
+
+        Returns:
+            int: The minutes of the windows of the week from the first day on.
+        """
+        start = monday(week)
+        return sum(
+            self.day_minutes
+            for offset in range(7)
+            if (day := start + timedelta(days=offset)) >= (first_day or start)
+            and self.windows(day)
+        )
+
+    def slot(self, cursor: datetime, minutes: int) -> Tuple[datetime, datetime]:
+        """
+        Get the first slot at or after a moment for some work.
+
+        Work fitting in a window starts in the first window with room for all of
+        it. Longer work starts at the first free moment and goes on through the
+        next windows, across days if needed.
+
+        Args:
+            cursor: The first moment the work may start at.
+            minutes: The working minutes of the work.
+
+        Returns:
+            Tuple[datetime, datetime]: The start and end of the slot.
+
+        Raises:
+            ValueError: If the calendar has no working window.
+        """
+        longest = max((end - start for start, end in self.shifts), default=0)
+        for begin, end in self._free(cursor):
+            if minutes > longest or begin + timedelta(minutes=minutes) <= end:
+                return begin, self.advance(begin, minutes)
+        raise ValueError("The shift calendar has no working window")
+
+    def advance(self, moment: datetime, minutes: int) -> datetime:
+        """
+        Get the moment some work started at another one ends.
+
+        Args:
+            moment: The moment the work starts at.
+            minutes: The working minutes of the work, only counted in the windows.
+
+        Returns:
+            datetime: The end of the work, the first free moment for no work.
+
+        Raises:
+            ValueError: If the calendar has no working window.
+        """
+        remaining = timedelta(minutes=minutes)
+        for begin, end in self._free(moment):
+            if begin + remaining <= end:
+                return begin + remaining
+            remaining -= end - begin
+        raise ValueError("The shift calendar has no working window")
+
+    def working_minutes(self, start: datetime, end: datetime) -> int:
+        """
+        Get the working time between two moments.
+
+        Args:
+            start: The first moment.
+            end: The last moment.
+
+        Returns:
+            int: The minutes of the windows between both moments.
+        """
+        worked = timedelta()
+        for begin, finish in self._free(start):
+            if begin >= end:
+                break
+            worked += min(finish, end) - begin
+        return int(worked.total_seconds() // 60)
+
+    def _free(self, cursor: datetime) -> Iterator[Tuple[datetime, datetime]]:
+        """Get the windows at or after a moment in order, the first one cut at it."""
+        day = cursor.date()
+        offset = cursor.hour * 60 + cursor.minute + (cursor.second > 0)
+        for _ in range(MAX_LOOKAHEAD_DAYS):
+            midnight = datetime.combine(day, time.min)
+            for start, end in self.windows(day):
+                if end > offset:
+                    yield (
+                        midnight + timedelta(minutes=max(start, offset)),
+                        midnight + timedelta(minutes=end),
+                    )
+            day += timedelta(days=1)
+            offset = 0
+
+
+class MachineScheduler:
+    """
+    Deterministic timeline of the production runs of the corrugator.
+
+    The linear meters of a run come from the quantity, outs and length of its
+    priority design, and its speed from the speed of its sheet, reduced by the
+    anti-humidity treatment. Runs are laid back to back in the windows of the
+    shift calendar, each one after the setup its sheet needs.
+    """
+
+    def __init__(
+        self,
+        calendar: Optional[ShiftCalendar] = None,
+        ect_minutes: int = PLANNING_CHANGEOVER_ECT_MINUTES,
+        treatment_minutes: int = PLANNING_CHANGEOVER_TREATMENT_MINUTES,
+        width_minutes: int = PLANNING_CHANGEOVER_WIDTH_MINUTES,
+    ):
+        """
+        Initialize the MachineScheduler.
+
+        Args:
+            calendar: The working windows of the corrugator.
+            ect_minutes: The setup between runs of different ECT.
+            treatment_minutes: The setup between runs with and without treatment.
+            width_minutes: The setup between runs of different roll width.
+        """
+        self.calendar = calendar or ShiftCalendar()
+        self.ect_minutes = ect_minutes
+        self.treatment_minutes = treatment_minutes
+        self.width_minutes = width_minutes
+
+    def changeover(self, previous: Optional[ProductionRun], run: ProductionRun) -> int:
+        """
+        Get the setup time between two consecutive runs.
+
+        Args:
+            previous: The run before, None for the first run of the timeline.
+            run: The run.
+
+        Returns:
+            int: The setup minutes.
+        """
+        if previous is None:
+            return 0
+        minutes = 0
+        if previous.sheet.ect != run.sheet.ect:
+            minutes += self.ect_minutes
+        if previous.treatment != run.treatment:
+            minutes += self.treatment_minutes
+        if previous.sheet.roll_width != run.sheet.roll_width:
+            minutes += self.width_minutes
+        return minutes
+
+    def production_minutes(
+        self,
+        run: ProductionRun,
+        boxes: Optional[Dict[str, Dict[str, Any]]] = None,
+        sheets: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> int:
+        """
+        Get the production time of a run, updating its linear meters and speed.
+
+        Args:
+            run: The production run.
+            boxes: The box data keyed by symbol, the run keeps its linear meters
+                when its priority design is missing.
+            sheets: The sheet data keyed by ID, the run keeps its speed when its
+                sheet is missing.
+
+        Returns:
+            int: The production minutes, at least one.
+        """
+        priority = run.processed_boxes[0] if run.processed_boxes else None
+        box = (boxes or {}).get(priority.symbol) if priority else None
+        if box and box.get("length") and priority.output:
+            run.linear_meters = math.ceil(
+                linear_meters(priority.quantity, box["length"], priority.output)
+            )
+        sheet = (sheets or {}).get(run.sheet.id)
+        if sheet and sheet.get("speed"):
+            run.speed = run_speed(sheet["speed"], run.treatment)
+        return production_minutes(run.linear_meters, max(1, run.speed))
+
+    def place(
+        self,
+        run: ProductionRun,
+        cursor: datetime,
+        previous: Optional[ProductionRun],
+        minutes: int,
+    ) -> datetime:
+        """
+        Lay a run on the timeline after its setup.
+
+        Args:
+            run: The production run, its date and times are updated.
+            cursor: The first free moment of the timeline.
+            previous: The run before, None for the first run of the timeline.
+            minutes: The production time of the run.
+
+        Returns:
+            datetime: The end of the run, the next free moment.
+        """
+        setup = self.changeover(previous, run)
+        start, end = self.calendar.slot(cursor, setup + minutes)
+        # Production starts in the first window with time left after the setup
+        start = min(self.calendar.advance(self.calendar.advance(start, setup), 0), end)
+        run.scheduled_date = start.date()
+        run.start_time = start.time()
+        set_run_end(run, end)
+        return end
+
+    def schedule(
+        self,
+        runs: List[ProductionRun],
+        start: datetime,
+        previous: Optional[ProductionRun] = None,
+        boxes: Optional[Dict[str, Dict[str, Any]]] = None,
+        sheets: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> datetime:
+        """
+        Lay runs back to back in their order.
+
+        Args:
+            runs: The production runs, their meters, speed, date and times are
+                updated in place.
+            start: The first moment the runs may start at.
+            previous: The run already on the timeline before them, if any.
+            boxes: The box data keyed by symbol.
+            sheets: The sheet data keyed by ID.
+
+        Returns:
+            datetime: The end of the last run, the next free moment.
+        """
+        cursor = start
+        for run in runs:
+            minutes = self.production_minutes(run, boxes, sheets)
+            cursor = self.place(run, cursor, previous, minutes)
+            previous = run
+        return cursor
+
+    @staticmethod
+    def overflow(runs: List[ProductionRun], week: IsoWeek) -> List[ProductionRun]:
+        """
+        Get the runs of a week laid past its Sunday.
+
+        The timeline is not bound to a week, so runs that do not fit in the
+        windows of their week end in the next one and must be reported or moved.
+
+        Args:
+            runs: The production runs of the week.
+            week: The ISO year and week.
+
+        Returns:
+            List[ProductionRun]: The runs ending after the end of the week.
+        """
+        end = datetime.combine(monday(week) + timedelta(weeks=1), time.min)
+        return [run for run in runs if run_end(run) > end]
@@ -0,0 +1,368 @@
+"""
+This module implements the RunSequencer class, which orders the production runs of
+a week to reduce the setup time between them without delaying their deliveries.
+"""
+
+import math
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from models.program_planning import ProductionRun
+from services.planning.scheduler import MachineScheduler, run_end
+
+# Improvement passes of the 2-opt search
+MAX_PASSES = 4
+
+
+class SequenceResult(BaseModel):
+    """Order chosen for the runs of a week."""
+
+    runs: List[ProductionRun] = []  # Runs in their new order, laid on the timeline
+    setup_before: int = 0  # Setup minutes of the original order
+    setup_after: int = 0  # Setup minutes of the new order
+    late_before: int = 0  # Runs ending after their delivery date originally
+    late_after: int = 0  # Runs ending after their delivery date in the new order
+    overflow: List[str] = []  # Arapack lots with runs ending after the week
+
+
+class _Instance:
+    """Runs of a sequencing problem reduced to their setup family and times."""
+
+    def __init__(
+        self,
+        scheduler: MachineScheduler,
+        runs: List[ProductionRun],
+        previous: Optional[ProductionRun],
+        durations: List[int],
+        limits: List[float],
+    ):
+        """
+        Initialize the _Instance.
+
+        Args:
+            scheduler: The timeline giving the setup between two runs.
+            runs: The runs to order.
+            previous: The run already on the timeline before them, if any.
+            durations: The production minutes of each run.
+            limits: The working minutes each run has to end by.
+        """
+        # Runs of the same ECT, treatment and roll width need no setup between them
+        ids: Dict[Tuple[Any, ...], int] = {}
+        members: List[ProductionRun] = []
+        for run in runs + ([previous] if previous else []):
+            key = (run.sheet.ect, run.treatment, run.sheet.roll_width)
+            if key not in ids:
+                ids[key] = len(members)
+                members.append(run)
+        self.families = [
+            ids[(run.sheet.ect, run.treatment, run.sheet.roll_width)] for run in runs
+        ]
+        self.setups = [
+            [scheduler.changeover(before, after) for after in members]
+            for before in members
+        ]
+        # Without a previous run the first run needs no setup
+        self.setups.append([0] * len(members))
+        self.start_family = (
+            ids[(previous.sheet.ect, previous.treatment, previous.sheet.roll_width)]
+            if previous
+            else len(members)
+        )
+        self.durations = durations
+        self.limits = limits
+
+    def setup(self, before: int, after: int) -> int:
+        """Get the setup between two runs, -1 being the previous run."""
+        family = self.start_family if before < 0 else self.families[before]
+        return self.setups[family][self.families[after]]
+
+    def ends(self, order: List[int]) -> List[int]:
+        """Get the end of each position of an order, in working minutes."""
+        ends = []
+        clock = 0
+        last = -1
+        for index in order:
+            clock += self.setup(last, index) + self.durations[index]
+            ends.append(clock)
+            last = index
+        return ends
+
+
+class RunSequencer:
+    """
+    Changeover-minimizing order of the runs of a week.
+
+    The setup between two runs only depends on their ECT, roll width and
+    treatment, so runs sharing them are chained at no cost. A greedy pass
+    walks the runs by earliest delivery date and stays on the sheet of the
+    last run while the slack of the most urgent runs allows it, otherwise it
+    takes the cheapest change. A 2-opt pass then reverses segments whose ends
+    lower the setup, as long as no run of the segment ends after its delivery
+    date. Times are measured in working minutes of the shift calendar. The
+    result is laid on the real timeline and kept only if it does not make
+    more runs late than the original order; otherwise the 2-opt pass is
+    applied to the original order instead.
+    """
+
+    def __init__(
+        self, scheduler: Optional[MachineScheduler] = None, max_passes: int = MAX_PASSES
+    ):
+        """
+        Initialize the RunSequencer.
+
+        Args:
+            scheduler: The timeline the runs are laid on, with its setup times.
+            max_passes: The improvement passes of the 2-opt search.
+        """
+        self.scheduler = scheduler or MachineScheduler()
+        self.max_passes = max_passes
+
+    def setup_minutes(
+        self, runs: List[ProductionRun], previous: Optional[ProductionRun] = None
+    ) -> int:
+        """
+        Get the total setup time of an order of runs.
+
+        Args:
+            runs: The runs in their order.
+            previous: The run already on the timeline before them, if any.
+
+        Returns:
+            int: The setup minutes.
+        """
+        total = 0
+        for run in runs:
+            total += self.scheduler.changeover(previous, run)
+            previous = run
+        return total
+
+    def sequence(
+        self,
+        runs: List[ProductionRun],
+        start: datetime,
+        due_dates: Optional[Dict[str, date]] = None,
+        previous: Optional[ProductionRun] = None,
+        boxes: Optional[Dict[str, Dict[str, Any]]] = None,
+        sheets: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> SequenceResult:
+        """
+        Order runs to reduce their setup time and lay them on the timeline.
+
+        Args:
+            runs: The runs in their current order.
+            start: The first moment the runs may start at.
+            due_dates: The delivery dates keyed by arapack lot.
+            previous: The run already on the timeline before them, if any.
+            boxes: The box data keyed by symbol.
+            sheets: The sheet data keyed by ID.
+
+        Returns:
+            SequenceResult: The runs in their new order, with their meters, speed,
+            date and times updated, and the setup and late runs before and after.
+        """
+        due_dates = due_dates or {}
+        deadlines = [self._deadline(run, due_dates) for run in runs]
+        durations = [
+            self.scheduler.production_minutes(run, boxes, sheets) for run in runs
+        ]
+        instance = _Instance(
+            self.scheduler,
+            runs,
+            previous,
+            durations,
+            self._working_limits(start, deadlines),
+        )
+
+        original = list(range(len(runs)))
+        late_before = self._late(runs, original, deadlines, start, previous)
+        order, late_after = original, late_before
+        for initial in (self._greedy(instance), original):
+            candidate = self._two_opt(instance, initial)
+            late = self._late(runs, candidate, deadlines, start, previous)
+            if late <= late_before:
+                order, late_after = candidate, late
+                break
+
+        sequenced = [runs[index] for index in order]
+        self.scheduler.schedule(sequenced, start, previous)
+        return SequenceResult(
+            runs=sequenced,
+            setup_before=self.setup_minutes(runs, previous),
+            setup_after=self.setup_minutes(sequenced, previous),
+            late_before=late_before,
+            late_after=late_after,
+        )
+
+    @staticmethod
+    def _greedy(instance: _Instance) -> List[int]:
+        """
+        Build an order keeping the sheet of the last run while deadlines allow it.
+
+        Runs that would end after their deadline even if laid next are left for
+        the end, grouped by sheet, so they do not delay the runs still on time.
+
+        Returns:
+            List[int]: The positions of the runs in their new order.
+        """
+        durations, limits = instance.durations, instance.limits
+        remaining = sorted(
+            range(len(durations)), key=lambda index: (limits[index], index)
+        )
+        order: List[int] = []
+        deferred: List[int] = []
+        clock = 0
+        last = -1
+        while remaining:
+            head = remaining[0]
+            if clock + instance.setup(last, head) + durations[head] > limits[head]:
+                deferred.append(remaining.pop(0))
+                continue
+
+            # Slack of the most urgent runs if they were laid next by delivery date
+            slack = math.inf
+            elapsed = clock
+            for index in remaining:
+                elapsed += durations[index]
+                slack = min(slack, limits[index] - elapsed)
+
+            choice = head
+            best_setup = instance.setup(last, choice)
+            if best_setup > 0:
+                for index in remaining[1:]:
+                    setup = instance.setup(last, index)
+                    if (
+                        setup < best_setup
+                        and setup + durations[index] <= slack
+                        and clock + setup + durations[index] <= limits[index]
+                    ):
+                        choice, best_setup = index, setup
+                        if setup == 0:
+                            break
+
+            remaining.remove(choice)
+            order.append(choice)
+            clock += best_setup + durations[choice]
+            last = choice
+
+        last_family = instance.families[last] if last >= 0 else None
+        deferred.sort(
+            key=lambda index: (
+                instance.families[index] != last_family,
+                instance.families[index],
+                limits[index],
+            )
+        )
+        return order + deferred
+
+    def _two_opt(self, instance: _Instance, order: List[int]) -> List[int]:
+        """
+        Reverse segments of an order while that lowers the setup time.
+
+        The setup is symmetric, so reversing a segment only changes the setup at
+        its ends and, when it decreases, moves the runs after the segment
+        earlier. Only the runs of the segment need their deadline checked.
+
+        Returns:
+            List[int]: The positions of the runs in their improved order.
+        """
+        order = list(order)
+        count = len(order)
+        setup = instance.setup
+        for _ in range(self.max_passes):
+            improved = False
+            ends = instance.ends(order)
+            for i in range(count - 1):
+                before = order[i - 1] if i > 0 else -1
+                for k in range(i + 1, count):
+                    first, last = order[i], order[k]
+                    delta = setup(before, last) - setup(before, first)
+                    if k + 1 < count:
+                        after = order[k + 1]
+                        delta += setup(first, after) - setup(last, after)
+                    if delta < 0 and self._reversal_on_time(
+                        instance, order, ends, i, k
+                    ):
+                        order[i : k + 1] = order[i : k + 1][::-1]
+                        ends = instance.ends(order)
+                        improved = True
+            if not improved:
+                break
+        return order
+
+    @staticmethod
+    def _reversal_on_time(
+        instance: _Instance, order: List[int], ends: List[int], i: int, k: int
+    ) -> bool:
+        """
+        Check that the runs of a segment still end by their deadline once it is
+        reversed, or no later than before when they already were late.
+        """
+        last = order[i - 1] if i > 0 else -1
+        # The first run of the segment moves the most, it ends where the segment ends
+        first = order[i]
+        moved = ends[k] - instance.setup(last, first) + instance.setup(last, order[k])
+        if moved > max(instance.limits[first], ends[i]):
+            return False
+
+        clock = ends[i - 1] if i > 0 else 0
+        for position in range(k, i, -1):
+            index = order[position]
+            clock += instance.setup(last, index) + instance.durations[index]
+            if clock > max(instance.limits[index], ends[position]):
+                return False
+            last = index
+        return True
+
+    def _late(
+        self,
+        runs: List[ProductionRun],
+        order: List[int],
+        deadlines: List[Optional[date]],
+        start: datetime,
+        previous: Optional[ProductionRun],
+    ) -> int:
+        """Count the runs of an order ending after their delivery date."""
+        laid = [runs[index].model_copy() for index in order]
+        self.scheduler.schedule(laid, start, previous)
+        return sum(
+            1
+            for index, run in zip(order, laid)
+            if deadlines[index] is not None and run_end(run).date() > deadlines[index]
+        )
+
+    def _working_limits(
+        self, start: datetime, deadlines: List[Optional[date]]
+    ) -> List[float]:
+        """Get the working minutes from the start to the end of each deadline day."""
+        calendar = self.scheduler.calendar
+        last_day = max((deadline for deadline in deadlines if deadline), default=None)
+        limits_by_day: Dict[date, float] = {}
+        if last_day is not None:
+            offset = start.hour * 60 + start.minute
+            total = 0
+            day = start.date()
+            while day <= last_day:
+                total += sum(
+                    max(0, end - max(begin, offset))
+                    for begin, end in calendar.windows(day)
+                )
+                limits_by_day[day] = total
+                day += timedelta(days=1)
+                offset = 0
+        # Deadlines before the start are already missed
+        return [
+            math.inf if deadline is None else limits_by_day.get(deadline, 0)
+            for deadline in deadlines
+        ]
+
+    @staticmethod
+    def _deadline(run: ProductionRun, due_dates: Dict[str, date]) -> Optional[date]:
+        """Get the earliest delivery day of the purchases of a run."""
+        days = [
+            due.date() if isinstance(due, datetime) else due
+            for due in (due_dates.get(box.arapack_lot) for box in run.processed_boxes)
+            if due
+        ]
+        return min(days) if days else None
@@ -0,0 +1,65 @@
+"""
+This module contains the PlanningJobService class, which exposes the status of the
+queued production plan updates.
+"""
+
+from typing import Dict, List, Optional
+
+from beanie import PydanticObjectId
+from fastapi import HTTPException
+
+from models.planning_job import PlanningJob
+from repositories.planning_job_repository import PlanningJobRepository
+
+# Statuses a planning job goes through
+PLANNING_JOB_STATUSES = ["PENDING", "RUNNING", "DONE", "FAILED"]
+
+
+class PlanningJobService:
+    """Class for PlanningJob service."""
+
+    @staticmethod
+    async def get_job_by_id(job_id: PydanticObjectId) -> Optional[PlanningJob]:
+        """
+        Get a planning job by its ID.
+
+        Args:
+            job_id (PydanticObjectId): The ID of the job.
+
+        Returns:
+            Optional[PlanningJob]: The planning job.
+
+        Raises:
+            HTTPException: If the job is not found.
+        """
+        job = await PlanningJobRepository.get_by_id(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Planning job not found")
+        return job
+
+    @staticmethod
+    async def get_jobs_by_arapack_lot(arapack_lot: str) -> List[PlanningJob]:
+        """
+        Get the planning jobs of a purchase, newest first.
+
+        Args:
+            arapack_lot (str): The arapack lot of the purchase.
+
+        Returns:
+            List[PlanningJob]: The planning jobs of the purchase.
+        """
+        return await PlanningJobRepository.get_by_arapack_lot(arapack_lot)
+
+    @staticmethod
+    async def get_queue_stats() -> Dict[str, int]:
+        """
+        Get the depth of the planning queue.
+
+        Returns:
+            Dict[str, int]: The number of jobs of each status, with the pending
+            and running jobs summed as the queue depth.
+        """
+        counts = await PlanningJobRepository.count_by_status()
+        stats = {status: counts.get(status, 0) for status in PLANNING_JOB_STATUSES}
+        stats["depth"] = stats["PENDING"] + stats["RUNNING"]
+        return stats
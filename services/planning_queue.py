@@ -0,0 +1,351 @@
+"""
+This module implements the PlanningQueue class, a durable queue of production plan
+updates processed by a pool of workers, one week at a time.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from beanie import PydanticObjectId
+
+from config.logging import logger
+from config.planning import (
+    PLANNING_BATCH_MAX_SIZE,
+    PLANNING_BATCH_WINDOW_MS,
+    PLANNING_JOB_MAX_ATTEMPTS,
+    PLANNING_LOCK_SECONDS,
+    PLANNING_POLL_SECONDS,
+    PLANNING_REAP_SECONDS,
+    PLANNING_WORKERS,
+)
+from models.planning_job import PlanningJob
+from repositories.planning_job_repository import PlanningJobRepository
+from utils.iso_week import IsoWeek, WeekRef, resolve_week
+
+# Processes the jobs of a week and returns the result of each job by ID.
+# A result with an "error" key marks the job as failed.
+PlanningHandler = Callable[
+    [IsoWeek, List[PlanningJob]], Awaitable[Dict[PydanticObjectId, Dict[str, Any]]]
+]
+
+
+def job_weeks(job: PlanningJob) -> List[IsoWeek]:
+    """
+    Get the weeks whose plan is modified by a job.
+
+    Args:
+        job: The planning job.
+
+    Returns:
+        List[IsoWeek]: The ISO week of the job, the week the purchase is moved
+        from, and every week of a horizon plan.
+    """
+    weeks = [PlanningJobRepository.week_of_job(job)]
+    original_week = job.payload.get("original_week")
+    if original_week:
+        weeks.append(
+            PlanningJobRepository.job_week(
+                job.payload.get("original_iso_year"), original_week
+            )
+        )
+    weeks.extend(tuple(week) for week in job.payload.get("weeks") or [])
+    return list(dict.fromkeys(weeks))
+
+
+def coalesce(jobs: List[PlanningJob]) -> Dict[PydanticObjectId, Optional[PlanningJob]]:
+    """
+    Collapse the jobs of a week that target the same purchase.
+
+    A cancellation supersedes every other job of the purchase. Otherwise only the
+    latest job of each action is kept, and a delivery date update keeps the week
+    the purchase was originally planned in. Jobs without a purchase, such as a
+    pairing optimization, are never collapsed.
+
+    Args:
+        jobs: The jobs of a week in creation order.
+
+    Returns:
+        Dict[PydanticObjectId, Optional[PlanningJob]]: For each job, the job that
+        will run in its place, or None if the job runs itself.
+    """
+    replaced: Dict[PydanticObjectId, Optional[PlanningJob]] = {}
+    by_lot: Dict[str, List[PlanningJob]] = {}
+    for job in jobs:
+        lot = job.payload.get("arapack_lot")
+        if lot:
+            by_lot.setdefault(lot, []).append(job)
+        else:
+            replaced[job.id] = None
+
+    for lot_jobs in by_lot.values():
+        cancels = [job for job in lot_jobs if job.action == "cancel"]
+        if cancels:
+            keep = {cancels[-1].id: cancels[-1]}
+        else:
+            keep = {}
+            for job in lot_jobs:
+                previous = keep.get(job.action)
+                if previous and job.action == "update_delivery_date":
+                    for key in ("original_week", "original_iso_year"):
+                        job.payload[key] = previous.payload.get(key)
+                keep[job.action] = job
+            keep = {job.id: job for job in keep.values()}
+
+        for job in lot_jobs:
+            if job.id in keep:
+                replaced[job.id] = None
+            else:
+                replaced[job.id] = next(
+                    kept
+                    for kept in keep.values()
+                    if kept.action == job.action or kept.action == "cancel"
+                )
+    return replaced
+
+
+class PlanningQueue:
+    """
+    Durable queue of production plan updates.
+
+    Jobs are stored in MongoDB so they survive restarts. Workers take every
+    pending job of a week under a lock, so two updates of the same week never
+    run concurrently, and process them in a single pass after collapsing the
+    jobs that target the same purchase.
+
+    A week is only taken once its oldest pending job has waited the batching
+    window, or once it has enough pending jobs, so a burst of registrations is
+    planned together.
+
+    A worker renews its week locks and the lease of its jobs while it plans.
+    The workers regularly return to the queue the running jobs whose lease
+    expired, so the jobs of a dead worker run again without a restart.
+    """
+
+    def __init__(
+        self,
+        workers: int = PLANNING_WORKERS,
+        batch_window_ms: int = PLANNING_BATCH_WINDOW_MS,
+        batch_max_size: int = PLANNING_BATCH_MAX_SIZE,
+    ):
+        """
+        Initialize the PlanningQueue.
+
+        Args:
+            workers: The number of workers processing jobs.
+            batch_window_ms: Milliseconds a week waits after its first pending job.
+            batch_max_size: Pending jobs that trigger a week before the window ends.
+        """
+        self.workers = workers
+        self.batch_window = timedelta(milliseconds=batch_window_ms)
+        self.batch_max_size = batch_max_size
+        self._next_due: Optional[datetime] = None
+        self._next_reap: Optional[datetime] = None
+        self._handler: Optional[PlanningHandler] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def enqueue(
+        self, action: str, week: Optional[WeekRef], payload: Dict[str, Any]
+    ) -> Optional[PlanningJob]:
+        """
+        Add a job to the queue.
+
+        Args:
+            action: The updater to run: register, update_delivery_date, cancel,
+                optimize_pairing, plan_horizon, retime_week or sequence_week.
+            week: The ISO (year, week) whose plan is updated, a bare week number
+                is placed in the nearest year.
+            payload: The data needed by the updater.
+
+        Returns:
+            Optional[PlanningJob]: The created job, or None if there is no week to plan.
+        """
+        if not week:
+            return None
+        year, number = resolve_week(week)
+        job = await PlanningJobRepository.create(
+            PlanningJob(action=action, iso_year=year, iso_week=number, payload=payload)
+        )
+        if self._wakeup:
+            self._wakeup.set()
+        return job
+
+    async def start(self, handler: PlanningHandler) -> None:
+        """
+        Start the workers.
+
+        Args:
+            handler: The coroutine processing the jobs of a week.
+        """
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        await self.reap()
+        self._tasks = [
+            asyncio.create_task(self._work(f"{uuid.uuid4().hex}-{index}"))
+            for index in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """Stop the workers, their jobs are requeued once their lease expires."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def reap(self) -> int:
+        """
+        Return to the queue the running jobs whose worker stopped renewing them.
+
+        Returns:
+            int: The number of jobs requeued.
+        """
+        self._next_reap = datetime.now() + timedelta(seconds=PLANNING_REAP_SECONDS)
+        requeued = await PlanningJobRepository.requeue_stale(PLANNING_LOCK_SECONDS)
+        if requeued:
+            logger.info(f"Requeued {requeued} abandoned planning jobs")
+        return requeued
+
+    async def _work(self, owner: str) -> None:
+        """Process jobs until the worker is cancelled."""
+        while True:
+            try:
+                if self._next_reap is None or datetime.now() >= self._next_reap:
+                    await self.reap()
+                if await self.run_once(owner):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Planning worker {owner} failed: {str(e)}")
+
+            self._wakeup.clear()
+            timeout = PLANNING_POLL_SECONDS
+            if self._next_due:
+                # Wake up when the batching window of a waiting week ends
+                remaining = (self._next_due - datetime.now()).total_seconds()
+                timeout = min(timeout, max(remaining, 0.01))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self, owner: str) -> bool:
+        """
+        Process the pending jobs of the first week that is not locked.
+
+        Args:
+            owner: The identifier of the worker.
+
+        Returns:
+            bool: True if a week was processed.
+        """
+        now = datetime.now()
+        self._next_due = None
+        for pending in await PlanningJobRepository.get_pending_weeks():
+            week = pending["week"]
+            due = pending["oldest"] + self.batch_window
+            if due > now and pending["count"] < self.batch_max_size:
+                # Leave the window open for more jobs of the same week
+                self._next_due = min(self._next_due or due, due)
+                continue
+
+            jobs = await PlanningJobRepository.get_pending_by_week(
+                week, self.batch_max_size
+            )
+            weeks = sorted({w for job in jobs for w in job_weeks(job)})
+            if not await PlanningJobRepository.acquire_week_locks(
+                weeks, owner, PLANNING_LOCK_SECONDS
+            ):
+                continue
+            heartbeat = None
+            try:
+                jobs = await PlanningJobRepository.mark_running(jobs, owner)
+                if jobs:
+                    planning = asyncio.create_task(self._process(week, jobs))
+                    heartbeat = asyncio.create_task(
+                        self._heartbeat(weeks, jobs, owner, planning)
+                    )
+                    try:
+                        await planning
+                    except asyncio.CancelledError:
+                        # Only a lost lock ends the heartbeat before the pass
+                        if not heartbeat.done() or heartbeat.cancelled():
+                            raise
+                        await self._requeue(jobs, "Lost the lock of the week")
+            finally:
+                if heartbeat:
+                    heartbeat.cancel()
+                    await asyncio.gather(heartbeat, return_exceptions=True)
+                await PlanningJobRepository.release_week_locks(weeks, owner)
+            return True
+        return False
+
+    @staticmethod
+    async def _heartbeat(
+        weeks: List[IsoWeek],
+        jobs: List[PlanningJob],
+        owner: str,
+        planning: asyncio.Task,
+    ) -> None:
+        """
+        Renew the week locks and the job leases until the pass is cancelled.
+
+        When another worker took one of the locks after it expired, the pass is
+        cancelled so it stops writing the weeks, and the heartbeat ends.
+        """
+        while True:
+            await asyncio.sleep(PLANNING_LOCK_SECONDS / 3)
+            try:
+                held = await PlanningJobRepository.renew_week_locks(
+                    weeks, owner, PLANNING_LOCK_SECONDS
+                )
+                if held:
+                    await PlanningJobRepository.renew(jobs, owner)
+            except Exception as e:
+                logger.error(f"Planning worker {owner} failed to renew: {str(e)}")
+                continue
+            if not held:
+                logger.error(f"Planning worker {owner} lost the lock of {weeks}")
+                planning.cancel()
+                return
+
+    @staticmethod
+    async def _requeue(jobs: List[PlanningJob], error: str) -> None:
+        """Return to the queue the jobs of a pass whose outcome was not recorded."""
+        for job in jobs:
+            await PlanningJobRepository.finish(job, "PENDING", None, error)
+
+    async def _process(self, week: IsoWeek, jobs: List[PlanningJob]) -> None:
+        """Run a planning pass over the jobs of a week and record their outcome."""
+        replaced = coalesce(jobs)
+        runnable = [job for job in jobs if replaced[job.id] is None]
+
+        try:
+            results = await self._handler(week, runnable)
+        except Exception as e:
+            logger.error(f"Planning pass of week {week} failed: {str(e)}")
+            results = {job.id: {"error": str(e)} for job in runnable}
+
+        for job in jobs:
+            target = replaced[job.id]
+            if target is not None:
+                await PlanningJobRepository.finish(
+                    job, "DONE", {"coalesced_into": str(target.id)}
+                )
+                continue
+
+            result = results.get(job.id) or {}
+            if "error" not in result:
+                await PlanningJobRepository.finish(job, "DONE", result)
+            elif job.attempts < PLANNING_JOB_MAX_ATTEMPTS:
+                await PlanningJobRepository.finish(
+                    job, "PENDING", None, result["error"]
+                )
+            else:
+                await PlanningJobRepository.finish(job, "FAILED", None, result["error"])
+
+
+# Queue shared by the services and started with the application
+planning_queue = PlanningQueue()
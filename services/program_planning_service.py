@@ -1,17 +1,76 @@
-from typing import List
+from typing import List, Optional
 
+from models.planning_job import PlanningJob
 from models.program_planning import ProgramPlanning
+from repositories.planning_job_repository import PlanningJobRepository
 from repositories.program_planning_repository import ProgramPlanningRepository
+from repositories.purchase_repository import PurchaseRepository
+from services.planning_queue import planning_queue
+from utils.iso_week import IsoWeek, WeekRef
 
 
 class ProgramPlanningService:
     @staticmethod
-    async def get_by_week(week: int) -> ProgramPlanning:
+    async def get_by_week(week: WeekRef) -> ProgramPlanning:
         """
         Get all production runs for a specific week.
-        :param week: The week number to filter by.
-        :type week: int
+        :param week: The ISO (year, week) to filter by, or a week number of the
+            nearest year.
+        :type week: WeekRef
         :return: List of ProgramPlanning documents for the specified week.
         :rtype: List[ProgramPlanning]
         """
         return await ProgramPlanningRepository.get_by_week(week)
+
+    @staticmethod
+    async def get_range(start: IsoWeek, weeks: int) -> List[ProgramPlanning]:
+        """
+        Get the program plannings of consecutive weeks.
+        :param start: The ISO (year, week) of the first week.
+        :type start: IsoWeek
+        :param weeks: The number of weeks.
+        :type weeks: int
+        :return: The program plannings that exist, ordered by week.
+        :rtype: List[ProgramPlanning]
+        """
+        return await ProgramPlanningRepository.get_range(start, weeks)
+
+    @staticmethod
+    async def retime_week(week: WeekRef) -> Optional[PlanningJob]:
+        """
+        Queue laying the runs of a week again with the machine scheduler.
+        The runs are rewritten by a planning job holding the lock of the week.
+        :param week: The ISO (year, week) of the program planning.
+        :type week: WeekRef
+        :return: The queued job, its result holds the runs laid again, those of
+            past days are kept.
+        :rtype: Optional[PlanningJob]
+        """
+        return await planning_queue.enqueue("retime_week", week, {})
+
+    @staticmethod
+    async def sequence_week(week: WeekRef) -> Optional[PlanningJob]:
+        """
+        Queue reordering the runs of a week to reduce the setup between them.
+        The runs are rewritten by a planning job holding the lock of the week.
+        :param week: The ISO (year, week) of the program planning.
+        :type week: WeekRef
+        :return: The queued job, its result holds the reordered runs, and their
+            setup minutes and late runs before and after, those of past days are
+            kept.
+        :rtype: Optional[PlanningJob]
+        """
+        return await planning_queue.enqueue("sequence_week", week, {})
+
+    @staticmethod
+    async def migrate_iso_weeks() -> int:
+        """
+        Key the program plannings, purchases and planning jobs stored before the
+        ISO year existed or with their week under an older field.
+        :return: The number of program plannings, purchases and jobs updated.
+        :rtype: int
+        """
+        plannings = await ProgramPlanningRepository.backfill_iso_weeks()
+        purchases = await PurchaseRepository.backfill_iso_years()
+        jobs = await PlanningJobRepository.rename_week_fields()
+        return plannings + purchases + jobs
@@ -2,19 +2,41 @@
 This module contains the PurchaseService class, which is responsible for interacting with the purchase repository.
 """
 
-from datetime import datetime
-from typing import List
-from fastapi import HTTPException, BackgroundTasks
+import asyncio
+import functools
+from datetime import date, datetime, time, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from beanie import PydanticObjectId
+from fastapi import HTTPException
 from pymongo.errors import DuplicateKeyError
+from config.logging import logger
+from config.planning import PLANNING_EXACT_BUDGET_SECONDS, PLANNING_HORIZON_WEEKS
+from models.planning_job import PlanningJob
 from models.purchase import Purchase, DeliveryDate
 from repositories.purchase_repository import PurchaseRepository
 from repositories.box_repository import BoxRepository
 from repositories.sheet_repository import SheetRepository
 from repositories.program_planning_repository import ProgramPlanningRepository
+from repositories.selection_repository import SheetsSelectionRepository
 from services.ia_service import IAService
+from services.kpi_rollup_service import KpiRollupService
+from services.planning.candidates import CandidateFilter
+from services.planning.exact_packer import ExactPacker
+from services.planning.horizon import HorizonPlanner
+from services.planning.plan_editor import PlanEditor, serialize_run
+from services.planning_queue import planning_queue
 from services.updaters.cancel_updater import CancelUpdater
 from services.updaters.register_updater import RegisterUpdater
 from services.updaters.delivery_date_updater import DeliveryDateUpdater
+from utils.iso_week import (
+    IsoWeek,
+    WeekRef,
+    iso_week,
+    monday,
+    resolve_week,
+    week_of,
+    week_range,
+)
 
 
 class PurchaseService:
@@ -28,6 +50,16 @@ class PurchaseService:
     _delivery_date_updater = DeliveryDateUpdater(_ia_service)
     _cancel_updater = CancelUpdater(_ia_service)
 
+    # Initialize the pre-filter of the sheets sent to the planner
+    _candidate_filter = CandidateFilter()
+
+    # Initialize the planner of several weeks and the editor applying its runs
+    _horizon_planner = HorizonPlanner()
+    _plan_editor = PlanEditor()
+
+    # Initialize the exact packer of the end-of-week pairing replans
+    _exact_packer = ExactPacker()
+
     @staticmethod
     async def get_all_purchases():
         """Get all purchases from the database."""
@@ -62,6 +94,37 @@ class PurchaseService:
         total_pages = (total_items + items_per_page - 1) // items_per_page
         return total_pages
 
+    @staticmethod
+    async def backfill_search_terms() -> int:
+        """
+        Index the purchases stored before the search terms existed.
+
+        Returns:
+            int: The number of purchases indexed.
+        """
+        return await PurchaseRepository.backfill_search_terms()
+
+    @staticmethod
+    async def search_purchases(
+        query: str, page: int, items_per_page: int
+    ) -> Dict[str, Any]:
+        """Obtiene una página de compras con el total, las páginas y los conteos por faceta"""
+        offset = (page - 1) * items_per_page
+        result = await PurchaseRepository.search(query, offset, items_per_page)
+        result["items"] = [Purchase.model_validate(item) for item in result["items"]]
+        return result
+
+    @staticmethod
+    async def get_purchases_by_cursor(
+        query: str, items_per_page: int, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Obtiene una página de compras a partir de un cursor, con los cursores siguiente y anterior"""
+        page = await PurchaseRepository.get_page_by_cursor(
+            query, items_per_page, cursor
+        )
+        page["items"] = [Purchase.model_validate(item) for item in page["items"]]
+        return page
+
     @staticmethod
     async def create_purchase(purchase: Purchase):
         """Create a new purchase in the database."""
@@ -77,28 +140,30 @@ class PurchaseService:
 
         # Calculate the week of the year using delivery date
         if purchase.estimated_delivery_date:
-            purchase.week_of_year = purchase.estimated_delivery_date.isocalendar()[1]
+            purchase.iso_year, purchase.week_of_year = iso_week(
+                purchase.estimated_delivery_date
+            )
 
         purchase.missing_quantity = purchase.quantity
 
         try:
-            return await PurchaseRepository.create(purchase)
+            created_purchase = await PurchaseRepository.create(purchase)
         except DuplicateKeyError:
             raise HTTPException(
                 status_code=400,
                 detail="A purchase with the same 'arapack_lot' already exists.",
             )
 
+        await KpiRollupService.record({}, created_purchase)
+        return created_purchase
+
     @staticmethod
-    async def create_purchase_with_ai(
-        purchase: Purchase, background_tasks: BackgroundTasks
-    ):
+    async def create_purchase_with_ai(purchase: Purchase):
         """
-        Create a new purchase and trigger AI processing in the background.
+        Create a new purchase and queue the update of its production plan.
 
         Args:
             purchase: The purchase to create.
-            background_tasks: FastAPI background tasks for asynchronous processing.
 
         Returns:
             Purchase: The created purchase.
@@ -106,60 +171,406 @@ class PurchaseService:
         # First, create the purchase normally
         created_purchase = await PurchaseService.create_purchase(purchase)
 
-        # Then, trigger AI processing in the background
-        background_tasks.add_task(
-            PurchaseService._process_new_purchase_with_ai, created_purchase
+        # Then, queue the planning of the new purchase
+        await planning_queue.enqueue(
+            "register",
+            week_of(created_purchase),
+            {"arapack_lot": created_purchase.arapack_lot},
         )
 
         return created_purchase
 
     @staticmethod
-    async def _process_new_purchase_with_ai(purchase: Purchase):
+    async def process_planning_jobs(
+        week: IsoWeek, jobs: List[PlanningJob]
+    ) -> Dict[PydanticObjectId, Dict[str, Any]]:
         """
-        Process a new purchase with AI in the background.
+        Process the queued planning jobs of a week in a single pass.
 
         Args:
-            purchase: The purchase to process.
+            week: The ISO (year, week) being planned.
+            jobs: The jobs of the week, already coalesced.
+
+        Returns:
+            Dict[PydanticObjectId, Dict[str, Any]]: The result of each job by ID.
         """
-        # Get the box associated with the purchase
-        box = await BoxRepository.get_by_symbol(purchase.symbol)
-        if not box:
+        results = {}
+        registers = []
+        for job in jobs:
+            try:
+                if job.action == "optimize_pairing":
+                    results[job.id] = await PurchaseService._optimize_pairing(
+                        week,
+                        job.payload.get("apply", False),
+                        job.payload.get(
+                            "budget_seconds", PLANNING_EXACT_BUDGET_SECONDS
+                        ),
+                    )
+                    continue
+                if job.action == "plan_horizon":
+                    results[job.id] = await PurchaseService._plan_horizon(
+                        [tuple(week) for week in job.payload["weeks"]], apply=True
+                    )
+                    continue
+                if job.action == "retime_week":
+                    runs = await PurchaseService._plan_editor.retime_week(week)
+                    results[job.id] = {
+                        "iso_week": week[1],
+                        "iso_year": week[0],
+                        "production_runs": [serialize_run(run) for run in runs],
+                    }
+                    continue
+                if job.action == "sequence_week":
+                    sequenced = await PurchaseService._plan_editor.sequence_week(week)
+                    results[job.id] = sequenced.model_dump(mode="json")
+                    continue
+
+                purchase = await PurchaseRepository.get_by_arapack_lot(
+                    job.payload.get("arapack_lot")
+                )
+                if not purchase:
+                    results[job.id] = {"skipped": "Purchase not found"}
+                    continue
+
+                if job.action == "register":
+                    # New purchases are planned together after the other jobs
+                    registers.append((job, purchase))
+                    continue
+                elif job.action == "update_delivery_date":
+                    original_week = job.payload.get("original_week")
+                    if job.payload.get("original_iso_year"):
+                        original_week = (
+                            job.payload["original_iso_year"],
+                            original_week,
+                        )
+                    await PurchaseService._process_delivery_date_update_with_ai(
+                        purchase, original_week
+                    )
+                elif job.action == "cancel":
+                    await PurchaseService._delete_process_with_ai(purchase)
+
+                results[job.id] = {
+                    "iso_week": week[1],
+                    "iso_year": week[0],
+                    "batch_size": 1,
+                }
+            except Exception as e:
+                logger.error(f"Planning job {job.id} failed: {str(e)}")
+                results[job.id] = {"error": str(e)}
+
+        # Retries, and the horizon planner, may have placed a purchase in any week
+        planned = await ProgramPlanningRepository.get_planned_lots(
+            [purchase.arapack_lot for _, purchase in registers]
+        )
+
+        # Plan every new purchase of the week in a single call
+        batch: List[Tuple[PlanningJob, Purchase]] = []
+        for job, purchase in registers:
+            purchase_week = week_of(purchase)
+            if purchase.arapack_lot in planned:
+                results[job.id] = {"skipped": "Purchase already planned"}
+                continue
+            if not purchase_week or resolve_week(purchase_week) != week:
+                # The purchase was moved to another week before being planned
+                results[job.id] = {"skipped": "Purchase moved to another week"}
+                continue
+            batch.append((job, purchase))
+        if batch:
+            try:
+                await PurchaseService._process_new_purchases_with_ai(
+                    [purchase for _, purchase in batch]
+                )
+                outcome = {
+                    "iso_week": week[1],
+                    "iso_year": week[0],
+                    "batch_size": len(batch),
+                }
+            except Exception as e:
+                logger.error(f"Planning batch of week {week} failed: {str(e)}")
+                outcome = {"error": str(e)}
+            for job, _ in batch:
+                results[job.id] = outcome
+        return results
+
+    @staticmethod
+    async def _process_new_purchases_with_ai(purchases: List[Purchase]):
+        """
+        Process a batch of new purchases of the same week from the planning queue.
+
+        Args:
+            purchases: The purchases to process.
+        """
+        # Get the boxes associated with the purchases
+        boxes = await BoxRepository.get_by_symbols(
+            {purchase.symbol for purchase in purchases}
+        )
+        boxes_by_symbol = {box.symbol: box for box in boxes}
+        purchases = [
+            purchase for purchase in purchases if purchase.symbol in boxes_by_symbol
+        ]
+        if not purchases:
             return
 
-        # Get available sheets
-        sheets = await SheetRepository.get_all()
+        # Get the candidate sheets of the boxes
+        sheets = await PurchaseService._get_candidate_sheets(
+            [box.model_dump() for box in boxes]
+        )
 
-        # Get the program planning for the purchase's week
+        # Get the program planning for the purchases' week
         program_planning = await ProgramPlanningRepository.get_by_week(
-            purchase.week_of_year
+            week_of(purchases[0])
         )
 
         # Prepare input data for the updater
         input_data = {
-            "purchase": purchase.dict(),
-            "box": box.dict(),
-            "sheets": [sheet.dict() for sheet in sheets],
+            "purchases": [purchase.dict() for purchase in purchases],
+            "boxes": [boxes_by_symbol[purchase.symbol].dict() for purchase in purchases],
+            "sheets": sheets,
             "program_planning": program_planning.dict() if program_planning else {},
         }
 
         # Call the register updater
         await PurchaseService._register_updater.update(input_data)
 
+    @staticmethod
+    async def _get_candidate_sheets(boxes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Get the feasible sheets of some boxes, honoring the current sheet selection.
+
+        Args:
+            boxes: The box data of the purchases to plan.
+
+        Returns:
+            List[Dict[str, Any]]: The top sheets of each box ranked by refile.
+        """
+        sheets = await SheetRepository.get_all()
+        selection = await SheetsSelectionRepository.get_current_selection()
+        return PurchaseService._candidate_filter.select(
+            boxes,
+            [sheet.model_dump() for sheet in sheets],
+            selection.sheet_ids if selection else None,
+        )
+
+    @staticmethod
+    async def plan_horizon(weeks: int = PLANNING_HORIZON_WEEKS) -> Dict[str, Any]:
+        """
+        Propose the runs of the open purchases without runs over the next weeks.
+
+        Nothing is written, queue_horizon_plan applies the proposal.
+
+        Args:
+            weeks: The number of weeks of the horizon, from the current one.
+
+        Returns:
+            Dict[str, Any]: The new runs and machine time of each week, and the
+            lots that could not be placed.
+        """
+        return await PurchaseService._plan_horizon(
+            week_range(iso_week(date.today()), weeks), apply=False
+        )
+
+    @staticmethod
+    async def queue_horizon_plan(
+        weeks: int = PLANNING_HORIZON_WEEKS,
+    ) -> Optional[PlanningJob]:
+        """
+        Queue the placement of the open purchases without runs over the next weeks.
+
+        The job holds the locks of every week of the horizon, so no other update
+        of those weeks runs while its runs are appended.
+
+        Args:
+            weeks: The number of weeks of the horizon, from the current one.
+
+        Returns:
+            Optional[PlanningJob]: The queued job, its result holds the new runs.
+        """
+        horizon = week_range(iso_week(date.today()), weeks)
+        return await planning_queue.enqueue(
+            "plan_horizon", horizon[0], {"weeks": [list(week) for week in horizon]}
+        )
+
+    @staticmethod
+    async def _plan_horizon(horizon: List[IsoWeek], apply: bool) -> Dict[str, Any]:
+        """
+        Place the open purchases without runs over some weeks.
+
+        The program plannings of the horizon and the purchases due in it are read
+        at once, the new runs of every week are proposed in a single pass and only
+        appended to the program plannings when applied.
+
+        Args:
+            horizon: The consecutive ISO (year, week) pairs of the horizon.
+            apply: Whether to append the new runs to the program plannings, only
+                from a planning job holding the locks of the horizon.
+
+        Returns:
+            Dict[str, Any]: The new runs and machine time of each week, the lots
+            that could not be placed or have no machine time left in the horizon,
+            and whether the runs were applied.
+        """
+        plannings = await ProgramPlanningRepository.get_range(horizon[0], len(horizon))
+        existing_runs = {
+            (planning.iso_year, planning.iso_week): planning.production_runs or []
+            for planning in plannings
+        }
+
+        # Get the purchases due in the horizon that are not planned in any week
+        purchases = await PurchaseRepository.get_open_by_delivery(
+            datetime.combine(monday(horizon[0]), time.min),
+            datetime.combine(monday(horizon[-1]) + timedelta(weeks=1), time.min),
+        )
+        planned = await ProgramPlanningRepository.get_planned_lots(
+            [purchase.arapack_lot for purchase in purchases]
+        )
+        purchases = [
+            purchase for purchase in purchases if purchase.arapack_lot not in planned
+        ]
+
+        # Get the boxes and candidate sheets of the purchases
+        boxes = await BoxRepository.get_by_symbols(
+            {purchase.symbol for purchase in purchases}
+        )
+        boxes_by_symbol = {box.symbol: box.model_dump() for box in boxes}
+        sheets = (
+            await PurchaseService._get_candidate_sheets(list(boxes_by_symbol.values()))
+            if boxes_by_symbol
+            else []
+        )
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None,
+            functools.partial(
+                PurchaseService._horizon_planner.plan,
+                horizon,
+                existing_runs,
+                [
+                    {
+                        "purchase": purchase.model_dump(),
+                        "box": boxes_by_symbol.get(purchase.symbol),
+                    }
+                    for purchase in purchases
+                ],
+                sheets,
+            ),
+        )
+        if apply:
+            for week in result.weeks:
+                await PurchaseService._plan_editor.insert_runs(
+                    (week.iso_year, week.iso_week), week.runs
+                )
+        return {**result.model_dump(mode="json"), "applied": apply}
+
+    @staticmethod
+    async def queue_pairing_optimization(
+        week: IsoWeek,
+        apply: bool = False,
+        budget_seconds: float = PLANNING_EXACT_BUDGET_SECONDS,
+    ) -> Optional[PlanningJob]:
+        """
+        Queue the search of the pairing with the minimum refile of a week.
+
+        Args:
+            week: The ISO (year, week) whose open purchases are paired again.
+            apply: Whether to replace the runs of the week with the new pairing.
+            budget_seconds: The wall-clock time the search may take.
+
+        Returns:
+            Optional[PlanningJob]: The queued job, its result holds the pairing.
+        """
+        return await planning_queue.enqueue(
+            "optimize_pairing",
+            week,
+            {"apply": apply, "budget_seconds": budget_seconds},
+        )
+
+    @staticmethod
+    async def _optimize_pairing(
+        week: IsoWeek, apply: bool, budget_seconds: float
+    ) -> Dict[str, Any]:
+        """
+        Pair the open purchases of a week with the exact packer.
+
+        Only the purchases that are not planned, or whose runs may all move, are
+        paired again; the new runs are laid after the runs that keep their place.
+        The search runs in a thread so it does not block the event loop.
+
+        Args:
+            week: The ISO (year, week) of the purchases.
+            apply: Whether to replace the runs of the purchases with the new ones.
+            budget_seconds: The wall-clock time the search may take.
+
+        Returns:
+            Dict[str, Any]: The new runs, their refile area against the greedy
+            planner, the lower bound and optimality of the pairing, and whether
+            it was applied.
+        """
+        first_day = monday(week)
+        purchases = await PurchaseRepository.get_open_by_delivery(
+            datetime.combine(first_day, time.min),
+            datetime.combine(first_day + timedelta(weeks=1), time.min),
+        )
+        lots = [purchase.arapack_lot for purchase in purchases]
+        movable, kept_runs = await PurchaseService._plan_editor.movable_lots(week, lots)
+        planned = await ProgramPlanningRepository.get_planned_lots(lots)
+        purchases = [
+            purchase
+            for purchase in purchases
+            if purchase.arapack_lot in movable or purchase.arapack_lot not in planned
+        ]
+
+        boxes = await BoxRepository.get_by_symbols(
+            {purchase.symbol for purchase in purchases}
+        )
+        boxes_by_symbol = {box.symbol: box.model_dump() for box in boxes}
+        sheets = (
+            await PurchaseService._get_candidate_sheets(list(boxes_by_symbol.values()))
+            if boxes_by_symbol
+            else []
+        )
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None,
+            functools.partial(
+                PurchaseService._exact_packer.plan,
+                [
+                    {
+                        "purchase": purchase.model_dump(),
+                        "box": boxes_by_symbol.get(purchase.symbol),
+                    }
+                    for purchase in purchases
+                ],
+                sheets,
+                kept_runs,
+                max(first_day, date.today()),
+                budget_seconds,
+            ),
+        )
+        if apply:
+            await PurchaseService._plan_editor.replace_runs(week, movable, result.runs)
+        return {
+            "iso_week": week[1],
+            "iso_year": week[0],
+            "batch_size": len(purchases),
+            **result.model_dump(mode="json"),
+            "applied": apply,
+        }
+
     @staticmethod
     async def update_delivery_date(
         arapack_lot: str,
         new_delivery_date: datetime,
         new_quantity: int,
-        background_tasks: BackgroundTasks,
     ) -> Purchase:
         """
-        Update the delivery date of a purchase and trigger AI processing in the background.
+        Update the delivery date of a purchase and queue the update of its production plan.
 
         Args:
             arapack_lot: The arapack lot of the purchase to update.
             new_delivery_date: The new delivery date.
             new_quantity: The new quantity.
-            background_tasks: FastAPI background tasks for asynchronous processing.
 
         Returns:
             Purchase: The updated purchase.
@@ -169,8 +580,10 @@ class PurchaseService:
         if not purchase:
             raise HTTPException(status_code=404, detail="Purchase not found")
 
-        # Store the original week
+        # Store the original week and KPI contributions
         original_week = purchase.week_of_year
+        original_iso_year = purchase.iso_year
+        original_kpis = KpiRollupService.contributions(purchase)
 
         # Update the delivery date if provided
         if new_delivery_date:
@@ -192,30 +605,35 @@ class PurchaseService:
             purchase.total_kilograms = purchase.weight * new_quantity
 
         # Calculate the new week of the year
-        purchase.week_of_year = new_delivery_date.isocalendar()[1]
+        purchase.iso_year, purchase.week_of_year = iso_week(new_delivery_date)
 
         # Save the updated purchase
         await purchase.save()
-
-        # Trigger AI processing in the background
-        background_tasks.add_task(
-            PurchaseService._process_delivery_date_update_with_ai,
-            purchase,
-            original_week,
+        await KpiRollupService.record(original_kpis, purchase)
+
+        # Queue the update of the production plan
+        await planning_queue.enqueue(
+            "update_delivery_date",
+            week_of(purchase),
+            {
+                "arapack_lot": purchase.arapack_lot,
+                "original_week": original_week,
+                "original_iso_year": original_iso_year,
+            },
         )
 
         return purchase
 
     @staticmethod
     async def _process_delivery_date_update_with_ai(
-        purchase: Purchase, original_week: int
+        purchase: Purchase, original_week: WeekRef
     ):
         """
-        Process a delivery date update with AI in the background.
+        Process a delivery date update from the planning queue.
 
         Args:
             purchase: The purchase with an updated delivery date.
-            original_week: The original week of the year.
+            original_week: The original ISO (year, week), or week of the year.
         """
         # Get the original program planning
         original_program = await ProgramPlanningRepository.get_by_week(original_week)
@@ -224,14 +642,22 @@ class PurchaseService:
 
         # Get the new program planning if the week changed
         new_program = None
-        if purchase.week_of_year != original_week:
-            new_program = await ProgramPlanningRepository.get_by_week(
-                purchase.week_of_year
-            )
+        if (original_program.iso_year, original_program.iso_week) != resolve_week(
+            week_of(purchase)
+        ):
+            new_program = await ProgramPlanningRepository.get_by_week(week_of(purchase))
+
+        # Get the box and its candidate sheets to replan the purchase
+        box = await BoxRepository.get_by_symbol(purchase.symbol)
+        sheets = (
+            await PurchaseService._get_candidate_sheets([box.model_dump()]) if box else []
+        )
 
         # Prepare input data for the updater
         input_data = {
             "purchase": purchase.model_dump(),
+            "box": box.model_dump() if box else {},
+            "sheets": sheets,
             "programs": {
                 "original_program_planning": original_program.model_dump(),
                 "new_program_planning": new_program.model_dump() if new_program else {},
@@ -280,6 +706,7 @@ class PurchaseService:
             finish_shipping_date=finish_shipping_date,
         )
 
+        original_kpis = KpiRollupService.contributions(purchase)
         purchase.missing_quantity = purchase.missing_quantity - quantity
 
         # Add the new delivery date to the purchase
@@ -289,6 +716,7 @@ class PurchaseService:
 
         # Save the updated purchase
         await purchase.save()
+        await KpiRollupService.record(original_kpis, purchase)
 
         return purchase
 
@@ -313,122 +741,143 @@ class PurchaseService:
         if index < 0 or index >= len(purchase.delivery_dates):
             raise HTTPException(status_code=400, detail="Invalid delivery date index")
 
+        original_kpis = KpiRollupService.contributions(purchase)
+
         # Complete the shipping
         purchase.delivery_dates[index].finish_shipping_date = datetime.now()
 
         # Save the updated purchase
         await purchase.save()
+        await KpiRollupService.record(original_kpis, purchase)
         return purchase
 
     @staticmethod
     async def get_monthly_invoice():
         """
-        Get the monthly invoice for purchases.
+        Get the invoice total of the purchases received in the current month,
+        summed from the daily KPI rollups.
 
         Returns:
-            List[Dict[str, Any]]: A list of dictionaries containing the monthly invoice data.
+            float: The invoice total of the current month.
         """
-        # Get all purchases
-        purchases = await PurchaseRepository.get_all()
+        start, end = PurchaseService._current_month()
+        totals = await KpiRollupService.get_totals(start.date(), end.date())
+        return totals["invoice"]
 
-        # Get the current month
-        current_month = datetime.now().month
+    @staticmethod
+    async def get_kpis(
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        group_by: str = "month",
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the invoice, kilograms and count of the purchases received in a range.
 
-        # Initialize the invoice data
-        total_monthly_invoice = 0
+        Args:
+            start: The first receipt date included, unbounded if None.
+            end: The first receipt date excluded, unbounded if None.
+            group_by: "month", "week" (ISO) or "client".
 
-        # Iterate through each purchase and extract relevant data
-        for purchase in purchases:
-            if purchase.total_invoice and purchase.receipt_date.month == current_month:
-                total_monthly_invoice += purchase.total_invoice
+        Returns:
+            List[Dict[str, Any]]: The fields of each bucket with its invoice,
+            kilograms and count, sorted by bucket.
+        """
+        return await PurchaseRepository.get_kpis(start, end, group_by)
 
-        # Return the monthly invoice data
-        return total_monthly_invoice
+    @staticmethod
+    def _current_month() -> Tuple[datetime, datetime]:
+        """Get the first instant of the current month and of the next one."""
+        start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if start.month == 12:
+            return start, start.replace(year=start.year + 1, month=1)
+        return start, start.replace(month=start.month + 1)
 
     @staticmethod
-    async def get_backorders():
+    async def stream_backorders(order: str = "desc") -> AsyncIterator[Dict[str, Any]]:
         """
-        Get the backorders for purchases.
+        Get the backorders of the purchases, computed by the database.
+
+        A backorder is a purchase that is not canceled, is past its estimated
+        delivery date, and has no deliveries or an unfinished one.
+
+        Args:
+            order: "desc" for the most delayed first, "asc" for the least delayed.
 
         Returns:
-            List[Dict[str, Any]]: A list of dictionaries containing the backorder data.
-        """
-        # Get all purchases
-        purchases = await PurchaseRepository.get_all()
-
-        # Initialize the backorder data
-        backorders = []
-
-        # Iterate through each purchase and extract relevant data
-        for purchase in purchases:
-            if purchase.estimated_delivery_date < datetime.now():
-                if purchase.delivery_dates:
-                    for delivery_date in purchase.delivery_dates:
-                        if delivery_date.finish_shipping_date is None:
-                            backorder_data = {
-                                "arapack_lot": purchase.arapack_lot,
-                                "estimated_delivery_date": purchase.estimated_delivery_date,
-                                "quantity": purchase.quantity,
-                                "missing_quantity": purchase.missing_quantity,
-                                "delivery_delay_days": (
-                                    datetime.now() - purchase.estimated_delivery_date
-                                ).days,
-                            }
-                            backorders.append(backorder_data)
-                else:
-                    backorder_data = {
-                        "arapack_lot": purchase.arapack_lot,
-                        "estimated_delivery_date": purchase.estimated_delivery_date,
-                        "quantity": purchase.quantity,
-                        "missing_quantity": purchase.missing_quantity,
-                        "delivery_delay_days": (
-                            datetime.now() - purchase.estimated_delivery_date
-                        ).days,
-                    }
-                    backorders.append(backorder_data)
+            AsyncIterator[Dict[str, Any]]: The lot, estimated delivery date,
+            quantity, missing quantity and delay in days of each backorder.
+        """
+        async for backorder in PurchaseRepository.iter_backorders(order):
+            backorder.pop("_id", None)
+            yield backorder
 
-        # Return the backorder data
-        return backorders
+    @staticmethod
+    async def get_backorders_page(
+        items_per_page: int, cursor: Optional[str] = None, order: str = "desc"
+    ) -> Dict[str, Any]:
+        """
+        Get a page of backorders after or before a cursor.
+
+        Args:
+            items_per_page: The number of items per page.
+            cursor: A cursor returned with a previous page, None for the first page.
+            order: "desc" for the most delayed first, "asc" for the least delayed.
+
+        Returns:
+            Dict[str, Any]: The backorders as items, and the next and previous cursors.
+
+        Raises:
+            ValueError: If the cursor is not valid.
+        """
+        page = await PurchaseRepository.get_backorders_page(
+            items_per_page, cursor, order
+        )
+        for backorder in page["items"]:
+            backorder.pop("_id", None)
+        return page
 
     @staticmethod
     async def get_monthly_kilograms():
         """
-        Get the monthly kilograms for purchases.
+        Get the kilograms of the purchases received in the current month, summed
+        from the daily KPI rollups.
 
         Returns:
-            List[Dict[str, Any]]: A list of dictionaries containing the monthly kilograms data.
+            float: The kilograms of the current month.
         """
-        # Get all purchases
-        purchases = await PurchaseRepository.get_all()
+        start, end = PurchaseService._current_month()
+        totals = await KpiRollupService.get_totals(start.date(), end.date())
+        return totals["kilograms"]
 
-        # Get the current month
-        current_month = datetime.now().month
+    @staticmethod
+    async def get_backorder_summary() -> Dict[str, Any]:
+        """
+        Get the number and missing quantity of the backorders, summed from the KPI
+        rollups.
 
-        # Initialize the invoice data
-        total_monthly_kilograms = 0
+        Returns:
+            Dict[str, Any]: The count and missing quantity of the backorders.
+        """
+        return await KpiRollupService.get_backorder_summary()
 
-        # Iterate through each purchase and extract relevant data
-        for purchase in purchases:
-            if (
-                purchase.total_kilograms
-                and purchase.receipt_date.month == current_month
-            ):
-                total_monthly_kilograms += purchase.total_kilograms
+    @staticmethod
+    async def rebuild_kpi_rollups() -> int:
+        """
+        Rebuild the KPI rollups from every purchase.
 
-        # Return the monthly invoice data
-        return total_monthly_kilograms
+        Returns:
+            int: The number of buckets written.
+        """
+        return await KpiRollupService.rebuild()
 
     @staticmethod
-    async def change_status(
-        arapack_lot: str, new_status: str, background_tasks: BackgroundTasks
-    ):
+    async def change_status(arapack_lot: str, new_status: str):
         """
         Change the status of a purchase.
 
         Args:
             arapack_lot (str): The arapack lot of the purchase to update.
             new_status (str): The new status to set.
-            background_tasks: FastAPI background tasks for asynchronous processing.
 
         Returns:
             Purchase: The updated purchase.
@@ -438,28 +887,33 @@ class PurchaseService:
         if not purchase:
             raise HTTPException(status_code=404, detail="Purchase not found")
 
+        original_kpis = KpiRollupService.contributions(purchase)
+
         # Toggle the status
         purchase.status = new_status
 
-        if purchase.status == "CANCELED":
-            background_tasks.add_task(PurchaseService._delete_process_with_ai, purchase)
-
         # Save the updated purchase
         await purchase.save()
+        await KpiRollupService.record(original_kpis, purchase)
+
+        if purchase.status == "CANCELED":
+            await planning_queue.enqueue(
+                "cancel", week_of(purchase), {"arapack_lot": purchase.arapack_lot}
+            )
 
         return purchase
 
     @staticmethod
     async def _delete_process_with_ai(purchase: Purchase):
         """
-        Process a purchase deletion with AI in the background.
+        Process a purchase deletion from the planning queue.
 
         Args:
             purchase: The purchase to be deleted.
         """
         # Get the original program planning
         original_program = await ProgramPlanningRepository.get_by_week(
-            purchase.week_of_year
+            week_of(purchase)
         )
         if not original_program:
             return
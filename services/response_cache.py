@@ -0,0 +1,182 @@
+"""
+This module implements the ResponseCache class, a two-tier cache of AI responses
+keyed by the normalized input of the prompt.
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from config.ia_cache import AI_CACHE_ENABLED, AI_CACHE_MAX_ENTRIES, AI_CACHE_TTL_SECONDS
+from config.logging import logger
+from repositories.ai_response_repository import AIResponseRepository
+
+# Fields that change between identical inputs and do not affect the plan
+VOLATILE_FIELDS = {"created_at", "updated_at"}
+
+
+def normalize(value: Any) -> Any:
+    """
+    Normalize input data so semantically identical inputs serialize the same.
+
+    Volatile timestamps are dropped and integral floats become integers.
+
+    Args:
+        value: The data to normalize.
+
+    Returns:
+        Any: The normalized data.
+    """
+    if isinstance(value, dict):
+        return {
+            str(key): normalize(item)
+            for key, item in value.items()
+            if key not in VOLATILE_FIELDS
+        }
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def cache_key(action_type: str, data: Dict[str, Any], variant: str = "") -> str:
+    """
+    Build the cache key of a prompt.
+
+    Args:
+        action_type: The type of action the prompt is built for.
+        data: The domain data of the prompt.
+        variant: Anything else shaping the prompt, such as the template version.
+
+    Returns:
+        str: The SHA-256 hex digest of the normalized input.
+    """
+    payload = json.dumps(
+        [action_type, variant, normalize(data)],
+        sort_keys=True,
+        default=str,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache of AI responses with an in-process LRU tier and a MongoDB tier.
+
+    Entries expire after the TTL in both tiers. The in-process tier keeps the
+    most recently used responses and is refilled from MongoDB on a miss, so
+    responses survive restarts and are shared between instances.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = AI_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = AI_CACHE_TTL_SECONDS,
+        enabled: bool = AI_CACHE_ENABLED,
+    ):
+        """
+        Initialize the ResponseCache.
+
+        Args:
+            max_entries: The number of responses kept in memory.
+            ttl_seconds: Seconds a response stays valid.
+            enabled: Whether responses are cached at all.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._counters = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "stores": 0}
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Get a cached response.
+
+        Args:
+            key: The cache key of the prompt.
+
+        Returns:
+            Optional[str]: The response, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self._counters["memory_hits"] += 1
+            return entry[1]
+        self._entries.pop(key, None)
+
+        try:
+            document = await AIResponseRepository.get_by_key(key)
+        except Exception as e:
+            logger.warning(f"AI response cache lookup failed: {str(e)}")
+            document = None
+        if document:
+            remaining = (document.expires_at - datetime.now()).total_seconds()
+            self._remember(key, document.response, remaining)
+            self._counters["mongo_hits"] += 1
+            return document.response
+
+        self._counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, action_type: str, response: str) -> None:
+        """
+        Store a response in both tiers.
+
+        Args:
+            key: The cache key of the prompt.
+            action_type: The type of action the prompt was built for.
+            response: The response of the AI model.
+        """
+        if not self.enabled:
+            return
+
+        self._remember(key, response, self.ttl_seconds)
+        self._counters["stores"] += 1
+        try:
+            await AIResponseRepository.save(
+                key, action_type, response, self.ttl_seconds
+            )
+        except Exception as e:
+            logger.warning(f"AI response cache store failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the hit and miss counters of the cache.
+
+        Returns:
+            Dict[str, Any]: The counters, the hit rate and the entries in memory.
+        """
+        hits = self._counters["memory_hits"] + self._counters["mongo_hits"]
+        lookups = hits + self._counters["misses"]
+        return {
+            **self._counters,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "enabled": self.enabled,
+        }
+
+    def clear(self) -> None:
+        """Drop the in-process tier and reset the counters."""
+        self._entries.clear()
+        self._counters = dict.fromkeys(self._counters, 0)
+
+    def _remember(self, key: str, response: str, ttl_seconds: float) -> None:
+        """Store a response in memory, evicting the least recently used ones."""
+        self._entries[key] = (time.monotonic() + ttl_seconds, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Cache shared by the AI services
+response_cache = ResponseCache()
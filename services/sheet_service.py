@@ -1,6 +1,6 @@
 """Sheet service module for interacting with the sheets' repository."""
 
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 
 from beanie import PydanticObjectId
 from fastapi import HTTPException
@@ -45,6 +45,25 @@ class SheetService:
         total_pages = (total_items + items_per_page - 1) // items_per_page
         return total_pages
 
+    @staticmethod
+    async def search_sheets(
+        query: str, page: int, items_per_page: int
+    ) -> Dict[str, Any]:
+        """Get a page of sheets with the total, the pages and the facet counts."""
+        offset = (page - 1) * items_per_page
+        result = await SheetRepository.search(query, offset, items_per_page)
+        result["items"] = [Sheet.model_validate(item) for item in result["items"]]
+        return result
+
+    @staticmethod
+    async def get_sheets_by_cursor(
+        query: str, items_per_page: int, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get a page of sheets after or before a cursor, with the next and previous cursors."""
+        page = await SheetRepository.get_page_by_cursor(query, items_per_page, cursor)
+        page["items"] = [Sheet.model_validate(item) for item in page["items"]]
+        return page
+
     @staticmethod
     async def update_sheet(
         sheet_id: PydanticObjectId, update_data: dict
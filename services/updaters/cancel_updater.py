@@ -2,11 +2,13 @@
 This module implements the CancelUpdater class.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from services.updaters.base_updater import ProductionPlanUpdater
 from services.ia_service import IAService
+from services.planning.plan_editor import PlanEditor
 from repositories.program_planning_repository import ProgramPlanningRepository
+from utils.iso_week import week_of
 
 
 class CancelUpdater(ProductionPlanUpdater):
@@ -18,16 +20,21 @@ class CancelUpdater(ProductionPlanUpdater):
         - program_planning: dict (the program planning containing the purchase)
     Output:
         - program_planning: updated dict with the purchase removed
+
+    The purchase is removed in place with the PlanEditor. The AI model is only
+    used when an affected run cannot be recomputed.
     """
 
-    def __init__(self, ia_service: IAService):
+    def __init__(self, ia_service: IAService, editor: Optional[PlanEditor] = None):
         """
         Initialize the CancelUpdater with an IAService instance.
 
         Args:
             ia_service: The IAService instance to use for AI interactions.
+            editor: The editor used to remove the purchase from the week.
         """
         self.ia_service = ia_service
+        self.editor = editor or PlanEditor()
 
     async def update(self, input_data: Dict[str, Any]) -> None:
         """
@@ -40,25 +47,25 @@ class CancelUpdater(ProductionPlanUpdater):
         """
         # Extract data from input
         purchase = input_data.get("purchase", {})
-        program_planning = input_data.get("program_planning", {})
+        program_planning = input_data.get("program_planning") or input_data.get(
+            "programs", {}
+        ).get("original_program_planning", {})
 
         # Get the week of the year from the purchase
-        week_of_year = purchase.get("week_of_year")
+        week_of_year = week_of(purchase)
         if not week_of_year:
             return
 
-        # Generate prompt for AI
-        prompt = self.ia_service.build_prompt(
+        # Remove the purchase only from the runs that contain it
+        if await self.editor.remove_box(week_of_year, purchase.get("arapack_lot")):
+            return
+
+        # Call AI service
+        updated_program = await self.ia_service.request(
             action_type="delete",
             data={"purchase": purchase, "program_planning": program_planning},
         )
 
-        # Call AI service
-        ai_response = await self.ia_service.call(prompt)
-
-        # Parse the response
-        updated_program = self.ia_service.parse_response(ai_response)
-
         if not updated_program:
             return
 
@@ -68,9 +75,11 @@ class CancelUpdater(ProductionPlanUpdater):
             return
 
         # Update program planning with AI response
-        program_planning_obj.production_runs = updated_program.get(
-            "production_runs", []
+        program_planning_obj.production_runs = self.ia_service.merge_production_runs(
+            program_planning.get("production_runs") or [],
+            updated_program.get("production_runs", []),
         )
 
-        # Save the updated program planning
+        # Save the updated program planning, with the times of the machine scheduler
         await program_planning_obj.save()
+        await self.editor.retime_week(week_of_year)
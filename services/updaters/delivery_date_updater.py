@@ -2,11 +2,14 @@
 This module implements the DeliveryDateUpdater class.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from services.updaters.base_updater import ProductionPlanUpdater
 from services.ia_service import IAService
+from services.planning.packer import BinPacker, week_start
+from services.planning.plan_editor import PlanEditor
 from repositories.program_planning_repository import ProgramPlanningRepository
+from utils.iso_week import resolve_week, week_fields, week_of
 
 
 class DeliveryDateUpdater(ProductionPlanUpdater):
@@ -15,6 +18,8 @@ class DeliveryDateUpdater(ProductionPlanUpdater):
 
     Input:
         - purchase: dict
+        - box: dict (optional, enables the planning engine)
+        - sheets: list[dict] (optional, enables the planning engine)
         - programs: {
             - original_program_planning: dict,
             - new_program_planning: dict (may be empty if no week change)
@@ -24,16 +29,29 @@ class DeliveryDateUpdater(ProductionPlanUpdater):
             - original_program_planning: updated dict,
             - new_program_planning: updated dict (if used)
           }
+
+    When the box and sheets are provided, the purchase is removed from its runs
+    and replanned by the BinPacker with targeted updates. The AI model is used
+    when the engine cannot place the purchase.
     """
 
-    def __init__(self, ia_service: IAService):
+    def __init__(
+        self,
+        ia_service: IAService,
+        packer: Optional[BinPacker] = None,
+        editor: Optional[PlanEditor] = None,
+    ):
         """
         Initialize the DeliveryDateUpdater with an IAService instance.
 
         Args:
             ia_service: The IAService instance to use for AI interactions.
+            packer: The planning engine used to replan the purchase.
+            editor: The editor used to move the purchase between runs.
         """
         self.ia_service = ia_service
+        self.packer = packer or BinPacker()
+        self.editor = editor or PlanEditor()
 
     async def update(self, input_data: Dict[str, Any]) -> None:
         """
@@ -52,19 +70,25 @@ class DeliveryDateUpdater(ProductionPlanUpdater):
         new_program = programs.get("new_program_planning", {})
 
         # Get the original and new week of the year
-        original_week = original_program.get("week_of_year")
-        new_week = purchase.get("week_of_year")
+        original_week = week_of(original_program)
+        new_week = week_of(purchase)
 
         if not original_week:
             return
+        week_changed = bool(new_week) and resolve_week(new_week) != resolve_week(
+            original_week
+        )
 
         # If the week has changed and new_program is empty, create a new program planning
-        if new_week and new_week != original_week and not new_program:
-            new_program = {"week_of_year": new_week, "production_runs": []}
+        if week_changed and not new_program:
+            new_program = {**week_fields(new_week), "production_runs": []}
             programs["new_program_planning"] = new_program
 
-        # Generate prompt for AI
-        prompt = self.ia_service.build_prompt(
+        if await self._replan(input_data, original_program, new_program):
+            return
+
+        # Call AI service
+        updated_programs = await self.ia_service.request(
             action_type="update_info",
             data={
                 "purchase": purchase,
@@ -73,11 +97,6 @@ class DeliveryDateUpdater(ProductionPlanUpdater):
             },
         )
 
-        # Call AI service
-        ai_response = await self.ia_service.call(prompt)
-        # Parse the response
-        updated_programs = self.ia_service.parse_response(ai_response)
-
         if not updated_programs:
             return
 
@@ -90,24 +109,83 @@ class DeliveryDateUpdater(ProductionPlanUpdater):
         )
 
         if original_program_planning and "original_program_planning" in programs_data:
-            original_program_planning.production_runs = programs_data[
-                "original_program_planning"
-            ].get("production_runs", [])
+            original_program_planning.production_runs = (
+                self.ia_service.merge_production_runs(
+                    original_program.get("production_runs") or [],
+                    programs_data["original_program_planning"].get(
+                        "production_runs", []
+                    ),
+                )
+            )
             await original_program_planning.save()
+            await self.editor.retime_week(original_week)
 
         # Update new program planning if week changed
-        if (
-            new_week
-            and new_week != original_week
-            and "new_program_planning" in programs_data
-        ):
+        if week_changed and "new_program_planning" in programs_data:
             new_program_planning = await ProgramPlanningRepository.get_by_week(new_week)
             if not new_program_planning:
                 from models.program_planning import ProgramPlanning
 
-                new_program_planning = ProgramPlanning(week_of_year=new_week)
+                new_program_planning = ProgramPlanning(**week_fields(new_week))
 
-            new_program_planning.production_runs = programs_data[
-                "new_program_planning"
-            ].get("production_runs", [])
+            new_program_planning.production_runs = (
+                self.ia_service.merge_production_runs(
+                    new_program.get("production_runs") or [],
+                    programs_data["new_program_planning"].get("production_runs", []),
+                )
+            )
             await new_program_planning.save()
+            await self.editor.retime_week(new_week)
+
+    async def _replan(
+        self,
+        input_data: Dict[str, Any],
+        original_program: Dict[str, Any],
+        new_program: Dict[str, Any],
+    ) -> bool:
+        """
+        Move the purchase to its new runs with the planning engine.
+
+        Args:
+            input_data: The updater input data.
+            original_program: The program planning currently holding the purchase.
+            new_program: The program planning of the new week, empty if unchanged.
+
+        Returns:
+            bool: True if the plan was updated, False if the AI model is needed.
+        """
+        purchase = input_data.get("purchase", {})
+        box = input_data.get("box")
+        sheets = input_data.get("sheets")
+        if not box or not sheets:
+            return False
+
+        original_week = week_of(original_program)
+        new_week = week_of(purchase) or original_week
+        target_program = (
+            new_program
+            if resolve_week(new_week) != resolve_week(original_week)
+            else original_program
+        )
+        existing_runs = [
+            run
+            for run in target_program.get("production_runs") or []
+            if not any(
+                processed_box.get("arapack_lot") == purchase.get("arapack_lot")
+                for processed_box in run.get("processed_boxes", [])
+            )
+        ]
+
+        result = self.packer.plan(
+            [{"purchase": purchase, "box": box}],
+            sheets,
+            existing_runs,
+            week_start(purchase, new_week),
+        )
+        if not result.runs:
+            return False
+
+        if not await self.editor.remove_box(original_week, purchase.get("arapack_lot")):
+            return False
+        await self.editor.insert_runs(new_week, result.runs)
+        return True
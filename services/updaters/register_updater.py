@@ -2,86 +2,158 @@
 This module implements the RegisterUpdater class.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from config import logging
+from config.planning import PLANNING_AI_REFINEMENT
 from services.updaters.base_updater import ProductionPlanUpdater
 from services.ia_service import IAService
+from services.planning.packer import BinPacker, week_start
+from services.planning.plan_editor import PlanEditor, serialize_run
 from repositories.program_planning_repository import ProgramPlanningRepository
 from models.program_planning import ProgramPlanning
+from utils.iso_week import week_fields, week_of
 
 
 class RegisterUpdater(ProductionPlanUpdater):
     """
-    Implementation of ProductionPlanUpdater for registering a new purchase.
+    Implementation of ProductionPlanUpdater for registering new purchases.
 
     Input:
-        - purchase: dict
-        - box: dict
+        - purchase: dict, or purchases: list[dict] for a batch of the same week
+        - box: dict, or boxes: list[dict] matching each purchase
         - sheets: list[dict]
         - program_planning: dict (initially empty)
     Output:
         - program_planning: updated dict
+
+    The new runs are computed by the deterministic BinPacker and appended to the
+    week with the PlanEditor. The AI model is only called to refine that proposal
+    when refinement is enabled, or as a fallback when the engine cannot place a
+    purchase on any sheet. A batch is always planned in a single call.
     """
 
-    def __init__(self, ia_service: IAService):
+    def __init__(
+        self,
+        ia_service: IAService,
+        packer: Optional[BinPacker] = None,
+        editor: Optional[PlanEditor] = None,
+        refine_with_ai: bool = PLANNING_AI_REFINEMENT,
+    ):
         """
         Initialize the RegisterUpdater with an IAService instance.
 
         Args:
             ia_service: The IAService instance to use for AI interactions.
+            packer: The planning engine used to build the new runs.
+            editor: The editor used to append the new runs to the week.
+            refine_with_ai: Whether to send the engine proposal to the AI model.
         """
         self.ia_service = ia_service
+        self.packer = packer or BinPacker()
+        self.editor = editor or PlanEditor()
+        self.refine_with_ai = refine_with_ai
 
     async def update(self, input_data: Dict[str, Any]) -> None:
         """
-        Update the production plan based on the input data for a new purchase registration.
+        Update the production plan based on the input data for new purchase registrations.
 
         Args:
             input_data: A dictionary containing:
-                - purchase: Purchase data
-                - box: Box data
+                - purchase or purchases: Purchase data
+                - box or boxes: Box data of each purchase
                 - sheets: List of available sheets
                 - program_planning: Empty or initial program planning data
         """
         # Extract data from input
-        purchase = input_data.get("purchase", {})
-        box = input_data.get("box", {})
+        purchases = input_data.get("purchases") or [input_data.get("purchase", {})]
+        boxes = input_data.get("boxes") or [input_data.get("box", {})]
         sheets = input_data.get("sheets", [])
         program_planning = input_data.get("program_planning", {})
 
-        # Get the week of the year from the purchase
-        week_of_year = purchase.get("week_of_year")
+        # Get the week of the year from the purchases, a batch shares its week
+        week_of_year = week_of(purchases[0])
         if not week_of_year:
             return
 
-        # Generate prompt for AI
-        prompt = self.ia_service.build_prompt(
-            action_type="register",
-            data={
-                "purchase": purchase,
-                "box": box,
-                "sheets": sheets,
-                "program_planning": program_planning,
-            },
+        existing_runs = program_planning.get("production_runs") or []
+
+        # Compute the new runs with the planning engine
+        result = self.packer.plan(
+            [
+                {"purchase": purchase, "box": box}
+                for purchase, box in zip(purchases, boxes)
+            ],
+            sheets,
+            existing_runs,
+            min(week_start(purchase, week_of_year) for purchase in purchases),
         )
-        print("Prompt for AI:", prompt)
-        # Call AI service
-        ai_response = await self.ia_service.call(prompt)
-        print("AI response:", ai_response)
-        # Parse the response
-        updated_program = self.ia_service.parse_response(ai_response)
 
-        if not updated_program:
+        if result.runs and not result.unplaced and not self.refine_with_ai:
+            # Only the new runs are written, the rest of the week is untouched
+            await self.editor.insert_runs(week_of_year, result.runs)
+            self.editor.overflow_lots(week_of_year, result.runs)
+            return
+
+        production_runs = await self._refine_with_ai(
+            purchases,
+            boxes,
+            sheets,
+            program_planning,
+            [serialize_run(run) for run in result.runs],
+        )
+        if production_runs is None:
             return
 
         # Get existing program planning or create a new one
         program_planning = await ProgramPlanningRepository.get_by_week(week_of_year)
         if not program_planning:
-            program_planning = ProgramPlanning(week_of_year=week_of_year)
+            program_planning = ProgramPlanning(**week_fields(week_of_year))
 
-        # Update program planning with AI response
-        program_planning.production_runs = updated_program.get("production_runs", [])
+        # Update program planning with the new runs
+        program_planning.production_runs = production_runs
 
-        # Save the updated program planning
+        # Save the updated program planning, with the times of the machine scheduler
         await program_planning.save()
+        await self.editor.retime_week(week_of_year)
+
+    async def _refine_with_ai(
+        self,
+        purchases: List[Dict[str, Any]],
+        boxes: List[Dict[str, Any]],
+        sheets: List[Dict[str, Any]],
+        program_planning: Dict[str, Any],
+        proposed_runs: List[Dict[str, Any]],
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Ask the AI model for the production runs, starting from the engine proposal.
+
+        Nothing is written while the response is streamed, repaired or retried.
+        The caller writes the week once a valid response has been returned.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: The production runs of the week.
+
+        Raises:
+            InvalidOutputError: If the AI response stays invalid after its repairs.
+        """
+        if len(purchases) == 1:
+            data = {"purchase": purchases[0], "box": boxes[0]}
+        else:
+            data = {"purchases": purchases, "boxes": boxes}
+        data["sheets"] = sheets
+        data["program_planning"] = program_planning
+        if proposed_runs:
+            data["proposed_production_runs"] = proposed_runs
+
+        # Call AI service
+        updated_program = await self.ia_service.request(
+            action_type="register", data=data
+        )
+
+        if not updated_program:
+            return None
+        return self.ia_service.merge_production_runs(
+            program_planning.get("production_runs") or [],
+            updated_program.get("production_runs", []),
+        )
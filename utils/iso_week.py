@@ -0,0 +1,145 @@
+"""
+ISO (year, week) keys of the program plannings.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+# ISO year and ISO week number
+IsoWeek = Tuple[int, int]
+
+# A week given as an ISO (year, week) pair, or as a bare week number
+WeekRef = Union[int, IsoWeek]
+
+
+def iso_week(value: Union[date, datetime, str, None]) -> Optional[IsoWeek]:
+    """
+    Get the ISO week of a date.
+
+    :param value: The date, as a date, datetime or ISO string.
+    :type value: Union[date, datetime, str, None]
+    :return: The ISO year and week, or None if there is no date.
+    :rtype: Optional[IsoWeek]
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    year, week, _ = value.isocalendar()
+    return year, week
+
+
+def resolve_week(week: WeekRef, today: Optional[date] = None) -> IsoWeek:
+    """
+    Get the ISO week of a week reference.
+
+    A bare week number is placed in the ISO year that puts it closest to today.
+
+    :param week: The ISO (year, week) pair, or a bare week number.
+    :type week: WeekRef
+    :param today: The reference day, today by default.
+    :type today: Optional[date]
+    :return: The ISO year and week.
+    :rtype: IsoWeek
+    """
+    if isinstance(week, tuple):
+        return week
+    today = today or date.today()
+    year = today.isocalendar()[0]
+    candidates = [
+        (candidate, week)
+        for candidate in (year - 1, year, year + 1)
+        if week <= weeks_in_year(candidate)
+    ]
+    return min(
+        candidates,
+        key=lambda candidate: abs((monday(candidate) - today).days),
+    )
+
+
+def weeks_in_year(year: int) -> int:
+    """
+    Get the number of ISO weeks of a year.
+
+    :param year: The ISO year.
+    :type year: int
+    :return: 52 or 53.
+    :rtype: int
+    """
+    return date(year, 12, 28).isocalendar()[1]
+
+
+def monday(week: IsoWeek) -> date:
+    """
+    Get the first day of an ISO week.
+
+    :param week: The ISO year and week.
+    :type week: IsoWeek
+    :return: The Monday of the week.
+    :rtype: date
+    """
+    return date.fromisocalendar(week[0], week[1], 1)
+
+
+def week_range(start: IsoWeek, count: int) -> List[IsoWeek]:
+    """
+    Get consecutive ISO weeks.
+
+    :param start: The first week.
+    :type start: IsoWeek
+    :param count: The number of weeks.
+    :type count: int
+    :return: The weeks, crossing into the next years as needed.
+    :rtype: List[IsoWeek]
+    """
+    first = monday(start)
+    return [iso_week(first + timedelta(weeks=offset)) for offset in range(count)]
+
+
+def week_filter(week: WeekRef) -> Dict[str, int]:
+    """
+    Create the filter of the program planning of a week.
+
+    :param week: The ISO (year, week) pair, or a bare week number.
+    :type week: WeekRef
+    :return: The filter on the ISO year and week.
+    :rtype: Dict[str, int]
+    """
+    year, number = resolve_week(week)
+    return {"iso_year": year, "iso_week": number}
+
+
+def week_fields(week: WeekRef) -> Dict[str, int]:
+    """
+    Get the week fields of a new program planning.
+
+    :param week: The ISO (year, week) pair, or a bare week number.
+    :type week: WeekRef
+    :return: The ISO year and week.
+    :rtype: Dict[str, int]
+    """
+    return week_filter(week)
+
+
+def week_of(document: Any) -> Optional[WeekRef]:
+    """
+    Get the week of a purchase or of a program planning.
+
+    :param document: The purchase or program planning, as a document or a dictionary.
+    :type document: Any
+    :return: The ISO (year, week) pair, the bare week number if the document has
+        no ISO year yet, or None if it has no week.
+    :rtype: Optional[WeekRef]
+    """
+
+    def field(name: str) -> Any:
+        if isinstance(document, Mapping):
+            return document.get(name)
+        return getattr(document, name, None)
+
+    # Program plannings hold an ISO week, purchases a week of the year
+    week = field("iso_week") or field("week_of_year")
+    year = field("iso_year")
+    if not week:
+        return None
+    return (year, week) if year else week
@@ -0,0 +1,248 @@
+"""
+Incremental parser of the JSON plans streamed by the AI model.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from models.program_planning import ProductionRun
+
+# Key of the arrays whose items are validated as they arrive
+RUNS_KEY = "production_runs"
+
+# Key of the object left in the buffer in place of a decoded run
+_RUN_MARKER = "\u0000run"
+
+
+class MalformedOutputError(ValueError):
+    """Raised when the streamed output cannot be a valid plan."""
+
+
+def run_errors(run: Any) -> List[str]:
+    """
+    Check a production run returned by the AI model.
+
+    A compact removal marker ({"index": i, "removed": true}) is accepted as is,
+    any other run must match the ProductionRun model, ignoring its "index".
+
+    Args:
+        run: The decoded production run.
+
+    Returns:
+        List[str]: The validation errors, empty if the run is valid.
+    """
+    if not isinstance(run, dict):
+        return ["production run must be an object"]
+    if run.get("removed") and isinstance(run.get("index"), int):
+        return []
+    try:
+        ProductionRun.model_validate(
+            {key: value for key, value in run.items() if key != "index"}
+        )
+    except ValidationError as e:
+        return [
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            for error in e.errors()
+        ]
+    return []
+
+
+def validate_run(run: Any) -> None:
+    """
+    Check a production run returned by the AI model.
+
+    Args:
+        run: The decoded production run.
+
+    Raises:
+        MalformedOutputError: If the run is not valid.
+    """
+    errors = run_errors(run)
+    if errors:
+        raise MalformedOutputError(f"Invalid production run: {'; '.join(errors)}")
+
+
+class _Frame:
+    """An object or array being parsed."""
+
+    __slots__ = ("kind", "key", "expect_key", "last_key", "start")
+
+    def __init__(self, kind: str, key: Optional[str], start: int):
+        self.kind = kind  # "{" or "["
+        self.key = key  # Key of the container in its parent object
+        self.expect_key = kind == "{"  # Whether the next string is a key
+        self.last_key: Optional[str] = None  # Key of the value being parsed
+        self.start = start  # Offset of the opening bracket
+
+
+class PlanStreamParser:
+    """
+    Incremental JSON parser of a streamed plan.
+
+    Text before the root object, such as a code fence, is skipped. Every item of
+    a "production_runs" array is decoded and validated as soon as its closing
+    brace arrives, so malformed output is detected without waiting for the rest
+    of the response. Decoded runs are replaced by a short marker and the text
+    before them is set aside, so the buffer only holds the run being received,
+    and the root object is assembled from the runs already decoded.
+
+    In strict mode a run that does not match the model aborts the parse. Otherwise
+    only invalid JSON aborts it, and invalid runs are skipped so they can be
+    repaired once the response is complete.
+    """
+
+    def __init__(self, strict: bool = True):
+        """
+        Initialize the PlanStreamParser.
+
+        Args:
+            strict: Whether a run that does not match the model aborts the parse.
+        """
+        self.strict = strict
+        self.invalid_runs = 0
+        self.result: Optional[Dict[str, Any]] = None
+        self.runs: List[Tuple[Optional[str], Dict[str, Any]]] = []
+        self._buffer = ""
+        self._skeleton: List[str] = []  # Text set aside before the buffer
+        self._base = 0  # Offset of the buffer, past the skeleton
+        self._decoded: List[Any] = []
+        self._position = 0  # Offsets count the skeleton and the buffer
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    @property
+    def done(self) -> bool:
+        """Whether the root object has been closed."""
+        return self.result is not None
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Parse a chunk of the response.
+
+        Args:
+            chunk: The text received from the AI model.
+
+        Returns:
+            List[Tuple[Optional[str], Dict[str, Any]]]: The key of the program
+            planning holding the runs (None at the root) and each valid run
+            completed by the chunk.
+
+        Raises:
+            MalformedOutputError: If the output cannot be a valid plan.
+        """
+        self._buffer += chunk
+        text = self._buffer
+        completed = []
+        while self._position < self._base + len(text) and not self.done:
+            index = self._position
+            char = text[index - self._base]
+            self._position += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame.kind == "{" and frame.expect_key:
+                        frame.last_key = json.loads(
+                            text[
+                                self._string_start - self._base : index + 1 - self._base
+                            ]
+                        )
+                        frame.expect_key = False
+                continue
+
+            if not self._stack:
+                # Drop anything before the root object
+                if char == "{":
+                    # Nothing was set aside yet, so the offsets match the buffer
+                    self._buffer = text = text[index:]
+                    self._position = 1
+                    self._stack.append(_Frame("{", None, 0))
+                continue
+
+            frame = self._stack[-1]
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char in "{[":
+                key = frame.last_key if frame.kind == "{" else frame.key
+                self._stack.append(_Frame(char, key, index))
+            elif char in "}]":
+                if (char == "}") != (frame.kind == "{"):
+                    raise MalformedOutputError(f"Unexpected {char!r} at offset {index}")
+                self._stack.pop()
+                run = self._close(frame, index)
+                # The text up to a decoded run was set aside
+                text = self._buffer
+                if run is not None:
+                    completed.append(run)
+            elif char == "," and frame.kind == "{":
+                frame.expect_key = True
+        return completed
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Get the decoded plan once the response is complete.
+
+        Returns:
+            Dict[str, Any]: The decoded root object.
+
+        Raises:
+            MalformedOutputError: If the response ended before the root object.
+        """
+        if self.result is None:
+            raise MalformedOutputError("Response ended before the plan was complete")
+        return self.result
+
+    def _close(
+        self, frame: _Frame, index: int
+    ) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+        """Handle a closed container, returning it if it is a valid production run."""
+        if not self._stack:
+            raw = "".join(self._skeleton) + self._buffer[: index + 1 - self._base]
+            try:
+                self.result = json.loads(raw, object_hook=self._restore_run)
+            except json.JSONDecodeError as e:
+                raise MalformedOutputError(f"Invalid JSON: {e}") from e
+            return None
+
+        parent = self._stack[-1]
+        if frame.kind != "{" or parent.kind != "[" or parent.key != RUNS_KEY:
+            return None
+
+        try:
+            run = json.loads(
+                self._buffer[frame.start - self._base : index + 1 - self._base]
+            )
+        except json.JSONDecodeError as e:
+            raise MalformedOutputError(f"Invalid production run JSON: {e}") from e
+        if self.strict:
+            validate_run(run)
+
+        # Invalid runs stay in the plan so they can be repaired
+        marker = json.dumps({_RUN_MARKER: len(self._decoded)})
+        self._decoded.append(run)
+        self._skeleton += [self._buffer[: frame.start - self._base], marker]
+        self._buffer = self._buffer[index + 1 - self._base :]
+        self._base = self._position = frame.start + len(marker)
+
+        if not self.strict and run_errors(run):
+            self.invalid_runs += 1
+            return None
+        section = self._stack[-2].key if len(self._stack) > 1 else None
+        self.runs.append((section, run))
+        return section, run
+
+    def _restore_run(self, value: Dict[str, Any]) -> Any:
+        """Replace the marker of a run by the run decoded when it was closed."""
+        if len(value) == 1 and _RUN_MARKER in value:
+            return self._decoded[value[_RUN_MARKER]]
+        return value
@@ -0,0 +1,240 @@
+"""
+Pagination of search results: aggregation pipelines returning a page with its
+counts, and keyset pages addressed by opaque cursors.
+"""
+
+import base64
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from bson import json_util
+
+# Sort specification as (field, direction) pairs
+SortSpec = Sequence[Tuple[str, int]]
+
+
+def page_count(total: int, items_per_page: int) -> int:
+    """
+    Get the number of pages holding some items.
+
+    :param total: The number of items.
+    :type total: int
+    :param items_per_page: The number of items per page.
+    :type items_per_page: int
+    :return: The number of pages, rounded up.
+    :rtype: int
+    """
+    return (total + items_per_page - 1) // items_per_page
+
+
+def facet_search_pipeline(
+    filters: Mapping[str, Any],
+    sort: SortSpec,
+    offset: int,
+    limit: int,
+    facet_fields: Sequence[str] = (),
+    array_fields: Sequence[str] = (),
+    projection: Optional[Mapping[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Create a pipeline matching a filter once and returning, in a single document,
+    a page of the matches, their total and their counts by field value.
+
+    :param filters: The filter of the documents.
+    :type filters: Mapping[str, Any]
+    :param sort: The sort of the page, as (field, direction) pairs.
+    :type sort: SortSpec
+    :param offset: The number of documents to skip.
+    :type offset: int
+    :param limit: The maximum number of documents of the page.
+    :type limit: int
+    :param facet_fields: The fields counted by value.
+    :type facet_fields: Sequence[str]
+    :param array_fields: The facet fields holding arrays, counted by element.
+    :type array_fields: Sequence[str]
+    :param projection: The projection of the documents of the page, if any.
+    :type projection: Optional[Mapping[str, Any]]
+    :return: The aggregation pipeline.
+    :rtype: List[Dict[str, Any]]
+    """
+    items: List[Dict[str, Any]] = [
+        {"$sort": dict(sort)},
+        {"$skip": offset},
+        {"$limit": limit},
+    ]
+    if projection:
+        items.append({"$project": dict(projection)})
+
+    facets: Dict[str, List[Dict[str, Any]]] = {
+        "items": items,
+        "total": [{"$count": "count"}],
+    }
+    for field in facet_fields:
+        stages: List[Dict[str, Any]] = []
+        if field in array_fields:
+            stages.append({"$unwind": f"${field}"})
+        stages += [
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+        ]
+        facets[f"facet_{field}"] = stages
+
+    return [{"$match": dict(filters)}, {"$facet": facets}]
+
+
+def facet_search_result(
+    result: List[Dict[str, Any]], items_per_page: int
+) -> Dict[str, Any]:
+    """
+    Shape the output of a facet search pipeline.
+
+    :param result: The documents returned by the pipeline.
+    :type result: List[Dict[str, Any]]
+    :param items_per_page: The number of items per page.
+    :type items_per_page: int
+    :return: The items of the page, the total of matches, the number of pages and
+        the counts of each facet field as a list of {value, count}.
+    :rtype: Dict[str, Any]
+    """
+    document = result[0] if result else {}
+    total = document["total"][0]["count"] if document.get("total") else 0
+    facets = {
+        key[len("facet_") :]: [
+            {"value": bucket["_id"], "count": bucket["count"]} for bucket in buckets
+        ]
+        for key, buckets in document.items()
+        if key.startswith("facet_")
+    }
+    return {
+        "items": document.get("items", []),
+        "total": total,
+        "pages": page_count(total, items_per_page),
+        "facets": facets,
+    }
+
+
+def encode_cursor(values: Sequence[Any], direction: str) -> str:
+    """
+    Encode the sort key of a document as an opaque cursor.
+
+    :param values: The values of the sort fields of the document.
+    :type values: Sequence[Any]
+    :param direction: "next" for the documents after it, "prev" for those before.
+    :type direction: str
+    :return: The URL safe cursor.
+    :rtype: str
+    """
+    raw = json_util.dumps({"d": direction, "k": list(values)})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[List[Any], str]:
+    """
+    Decode a cursor created by encode_cursor.
+
+    :param cursor: The cursor.
+    :type cursor: str
+    :return: The values of the sort fields and the direction.
+    :rtype: Tuple[List[Any], str]
+    :raises ValueError: If the cursor is not valid.
+    """
+    try:
+        decoded = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        values, direction = decoded["k"], decoded["d"]
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list) or direction not in ("next", "prev"):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values, direction
+
+
+def keyset_filter(sort: SortSpec, values: Sequence[Any]) -> Dict[str, Any]:
+    """
+    Create a filter matching the documents that come after a sort key.
+
+    :param sort: The sort, as (field, direction) pairs ending in a unique field.
+    :type sort: SortSpec
+    :param values: The values of the sort fields of the last document seen.
+    :type values: Sequence[Any]
+    :return: The MongoDB filter.
+    :rtype: Dict[str, Any]
+    """
+    if len(values) != len(sort):
+        raise ValueError("The cursor does not match the sort of the page")
+    clauses = []
+    for position, (field, direction) in enumerate(sort):
+        clause = {sort[index][0]: values[index] for index in range(position)}
+        clause[field] = {"$gt" if direction > 0 else "$lt": values[position]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+async def keyset_page(
+    collection: Any,
+    filters: Mapping[str, Any],
+    sort: SortSpec,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Mapping[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Get a page of documents after or before a cursor, seeking through the index
+    of the sort instead of skipping the previous documents.
+
+    :param collection: The Motor collection.
+    :type collection: Any
+    :param filters: The filter of the documents.
+    :type filters: Mapping[str, Any]
+    :param sort: The sort, as (field, direction) pairs ending in a unique field.
+    :type sort: SortSpec
+    :param limit: The maximum number of documents of the page.
+    :type limit: int
+    :param cursor: A cursor returned with a previous page, None for the first page.
+    :type cursor: Optional[str]
+    :param projection: The projection of the documents, if any.
+    :type projection: Optional[Mapping[str, Any]]
+    :return: The documents as items, and the next and previous cursors, None
+        at the ends of the results.
+    :rtype: Dict[str, Any]
+    :raises ValueError: If the cursor is not valid.
+    """
+    direction = "next"
+    query = dict(filters)
+    if cursor:
+        values, direction = decode_cursor(cursor)
+        seek_sort = sort
+        if direction == "prev":
+            seek_sort = [(field, -order) for field, order in sort]
+        seek = keyset_filter(seek_sort, values)
+        query = {"$and": [query, seek]} if query else seek
+
+    # Fetch one more document to know if there is another page
+    fetch_sort = sort
+    if direction == "prev":
+        fetch_sort = [(field, -order) for field, order in sort]
+    documents = (
+        await collection.find(query, projection)
+        .sort(list(fetch_sort))
+        .limit(limit + 1)
+        .to_list(length=None)
+    )
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    if direction == "prev":
+        documents.reverse()
+
+    def key(document: Mapping[str, Any]) -> List[Any]:
+        return [document.get(field) for field, _ in sort]
+
+    has_next = has_more if direction == "next" else bool(cursor)
+    has_prev = has_more if direction == "prev" else bool(cursor)
+    return {
+        "items": documents,
+        "next_cursor": (
+            encode_cursor(key(documents[-1]), "next")
+            if documents and has_next
+            else None
+        ),
+        "prev_cursor": (
+            encode_cursor(key(documents[0]), "prev") if documents and has_prev else None
+        ),
+    }
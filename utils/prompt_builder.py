@@ -1,11 +1,52 @@
 import json
 import os
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Set, Tuple
 
+from dotenv import load_dotenv
 
+from config.logging import logger
+
+# Load environment variables
+load_dotenv()
+
+# When enabled, prompts use the compact encoding and plans are exchanged as deltas
+PROMPT_COMPACT = os.getenv("PROMPT_COMPACT", "true").lower() == "true"
+
+# Fields the planner uses from each entity, everything else is stripped
+PURCHASE_FIELDS = [
+    "arapack_lot",
+    "order_number",
+    "symbol",
+    "ect",
+    "quantity",
+    "missing_quantity",
+    "estimated_delivery_date",
+    "week_of_year",
+]
+BOX_FIELDS = ["symbol", "ect", "width", "length", "treatment"]
+SHEET_COLUMNS = ["id", "roll_width", "p1", "p2", "p3", "ect", "speed", "boxes"]
+
+# Keys of the domain data holding program plannings
+PLANNING_KEYS = [
+    "program_planning",
+    "original_program_planning",
+    "new_program_planning",
+]
+
+# Rough number of characters per token, used to estimate prompt sizes
+CHARS_PER_TOKEN = 4
+
+# Text around the domain data, after the static prefix of each prompt
+DATA_HEADER = "Here is the data to process:\n"
+PLAN_SUFFIX = "Please provide your response as a valid JSON object with the updated production plan."
+REPAIR_SUFFIX = "Please provide the corrected production runs as a valid JSON object."
+
+
+@lru_cache(maxsize=None)
 def _load_instructions() -> Dict[str, Any]:
     """
-    Load the instructions from the JSON template file.
+    Load the instructions from the JSON template file, once per process.
 
     Returns:
         Dict[str, Any]: The instructions loaded from the JSON file.
@@ -20,26 +61,213 @@ def _load_instructions() -> Dict[str, Any]:
         raise RuntimeError("Failed to load instructions from the template file.")
 
 
+def prompt_size(prompt: str) -> Dict[str, int]:
+    """
+    Measure a prompt.
+
+    Args:
+        prompt: The prompt to measure.
+
+    Returns:
+        Dict[str, int]: The size of the prompt in bytes and estimated tokens.
+    """
+    return {
+        "bytes": len(prompt.encode("utf-8")),
+        "tokens": (len(prompt) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN,
+    }
+
+
+def merge_plan_delta(
+    existing_runs: List[Dict[str, Any]], delta_runs: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Apply the production runs returned for a compact prompt to the existing runs.
+
+    Runs with an "index" replace the existing run at that position, or remove it
+    when they are marked as "removed". Runs without an index are appended.
+
+    Args:
+        existing_runs: The production runs of the week before the update.
+        delta_runs: The production runs returned by the AI model.
+
+    Returns:
+        List[Dict[str, Any]]: The production runs of the week after the update.
+    """
+    # Dates and times are stored as ISO strings, like the AI model returns them
+    runs = json.loads(json.dumps(existing_runs, default=str))
+    appended = []
+    for run in delta_runs:
+        index = run.pop("index", None)
+        if not isinstance(index, int) or not 0 <= index < len(runs):
+            if not run.get("removed"):
+                appended.append(run)
+            continue
+        runs[index] = None if run.get("removed") else run
+    return [run for run in runs if run is not None] + appended
+
+
+class PromptTemplate:
+    """
+    Static parts of the prompt of an action, serialized once.
+
+    The instructions and output formats form a prefix shared by every prompt of
+    the action, so it can be cached by the model provider. Only the domain data
+    is rendered for each prompt.
+    """
+
+    def __init__(self, prefix: str, suffix: str, indent: Optional[int]):
+        """
+        Initialize the PromptTemplate.
+
+        Args:
+            prefix: The instructions and output formats.
+            suffix: The closing request after the data.
+            indent: The indentation of the serialized data, None for compact JSON.
+        """
+        self.prefix = prefix
+        self.suffix = suffix
+        self.indent = indent
+
+    def render(self, data: Any) -> Tuple[str, str]:
+        """
+        Render a prompt.
+
+        Args:
+            data: The domain data, already encoded.
+
+        Returns:
+            Tuple[str, str]: The static prefix and the variable part of the prompt.
+        """
+        separators = (",", ":") if self.indent is None else None
+        encoded = json.dumps(
+            data, default=str, indent=self.indent, separators=separators
+        )
+        return self.prefix, f"{DATA_HEADER}{encoded}\n\n{self.suffix}"
+
+
 class PromptBuilder:
     """
     Builds prompts for AI by combining base instructions, specific instructions, and domain data.
+
+    The static part of each action is compiled once into a PromptTemplate. In
+    compact mode the sheets are sent as a CSV table, purchases and boxes only
+    keep the fields used by the planner and program plannings are sent as a delta
+    holding only the runs of the purchases being processed.
     """
 
-    def __init__(self):
-        """Initialize the PromptBuilder."""
+    def __init__(self, compact: bool = PROMPT_COMPACT):
+        """
+        Initialize the PromptBuilder.
+
+        Args:
+            compact: Whether to use the compact encoding.
+        """
         self.instructions = _load_instructions()
+        self.compact = compact
+        self._templates: Dict[Tuple[str, bool], PromptTemplate] = {}
 
     def build(self, action_type: str, data: Dict[str, Any]) -> str:
         """
         Build a prompt by combining base instructions, specific instructions, and domain data.
 
         Args:
-            action_type: The type of action ("register", "update_quantity", or "update_delivery_date").
+            action_type: The type of action ("register", "delete" or "update_info").
             data: The domain data to include in the prompt.
 
         Returns:
             str: The complete prompt.
         """
+        return "".join(self.build_parts(action_type, data))
+
+    def build_parts(self, action_type: str, data: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Build a prompt split into its static prefix and its variable part.
+
+        Args:
+            action_type: The type of action.
+            data: The domain data to include in the prompt.
+
+        Returns:
+            Tuple[str, str]: The prefix shared by every prompt of the action and
+            the part holding the data.
+        """
+        parts = self._build(action_type, data, self.compact)
+        if self.compact:
+            logger.debug(
+                f"Compact {action_type} prompt size: {prompt_size(''.join(parts))}"
+            )
+        return parts
+
+    def build_repair(self, data: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Build a short prompt asking the AI model to fix the invalid runs of a response.
+
+        Args:
+            data: The invalid runs with their validation errors.
+
+        Returns:
+            Tuple[str, str]: The static prefix and the variable part of the prompt.
+        """
+        return self.template("repair", compact=True).render(data)
+
+    def size_report(
+        self,
+        action_type: str,
+        data: Dict[str, Any],
+        parts: Optional[Tuple[str, str]] = None,
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Compare the size of a prompt with and without the compact encoding.
+
+        Args:
+            action_type: The type of action.
+            data: The domain data to include in the prompt.
+            parts: The prompt already built by build_parts, not built again.
+
+        Returns:
+            Dict[str, Dict[str, int]]: The bytes and tokens of both encodings, and
+            of the static prefix of the compact prompt.
+        """
+        built = {self.compact: parts} if parts else {}
+        full = built.get(False) or self._build(action_type, data, compact=False)
+        prefix, variable = built.get(True) or self._build(
+            action_type, data, compact=True
+        )
+        return {
+            "full": prompt_size("".join(full)),
+            "compact": prompt_size(prefix + variable),
+            "static_prefix": prompt_size(prefix),
+        }
+
+    def template(self, action_type: str, compact: bool) -> PromptTemplate:
+        """
+        Get the compiled template of an action.
+
+        Args:
+            action_type: The type of action.
+            compact: Whether the template uses the compact encoding.
+
+        Returns:
+            PromptTemplate: The template, compiled on first use.
+        """
+        key = (action_type, compact)
+        if key not in self._templates:
+            self._templates[key] = self._compile(action_type, compact)
+        return self._templates[key]
+
+    def _compile(self, action_type: str, compact: bool) -> PromptTemplate:
+        """Serialize the instructions and output formats of an action."""
+        indent = None if compact else 2
+        if action_type == "repair":
+            run_format = self.instructions.get("output_format", {}).get(
+                "production_runs", [{}]
+            )[0]
+            prefix = (
+                f"{self.instructions.get('repair_instructions', '')}\n\n"
+                f"Format of a production run:\n{json.dumps(run_format)}\n\n"
+            )
+            return PromptTemplate(prefix, REPAIR_SUFFIX, None)
+
         # Get the base instructions and specific instructions for the action type
         base_instructions = self.instructions.get("instructions", "")
         specific_instruction = self.instructions.get(f"{action_type}_instructions", "")
@@ -47,19 +275,115 @@ class PromptBuilder:
         # Get the output format
         output_format = self.instructions.get("output_format", {})
 
-        # Combine instructions, data, and output format
-        prompt = f"{base_instructions}\n\n{specific_instruction}\n\n"
-        prompt += f"Here is the data to process:\n{json.dumps(data, default=str, indent=2)}\n\n"
-        prompt += "Please provide your response as a valid JSON object with the updated production plan.\n\n"
-        prompt += (
+        # Combine instructions and output formats, the data goes after them
+        prefix = f"{base_instructions}\n\n{specific_instruction}\n\n"
+        if compact:
+            prefix += f"{self.instructions.get('compact_instructions', '')}\n\n"
+        prefix += (
             f"Output format for production runs (if there is not provided an output format for programs I "
-            f"expect this format as final output):\n{json.dumps(output_format, indent=2)}"
+            f"expect this format as final output):\n{json.dumps(output_format, indent=indent)}\n\n"
         )
         if action_type == "update_info":
             # Handle the specific case for update_info_instructions
             update_info_output_format = self.instructions.get(
                 "update_info_output_format", {}
             )
-            prompt += f"\n\nOutput format for programs:\n{json.dumps(update_info_output_format, indent=2)}"
+            prefix += f"Output format for programs:\n{json.dumps(update_info_output_format, indent=indent)}\n\n"
+
+        return PromptTemplate(prefix, PLAN_SUFFIX, indent)
+
+    def _build(
+        self, action_type: str, data: Dict[str, Any], compact: bool
+    ) -> Tuple[str, str]:
+        """Build a prompt with the full or the compact encoding."""
+        template = self.template(action_type, compact)
+        return template.render(self._encode(data) if compact else data)
+
+    def _encode(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Encode the domain data with the compact format."""
+        purchases = data.get("purchases") or [data.get("purchase") or {}]
+        lots = {purchase.get("arapack_lot") for purchase in purchases}
+        symbols = {purchase.get("symbol") for purchase in purchases}
+
+        encoded = {}
+        for key, value in data.items():
+            if key in ("purchase", "box"):
+                fields = PURCHASE_FIELDS if key == "purchase" else BOX_FIELDS
+                encoded[key] = _pick(value, fields)
+            elif key in ("purchases", "boxes"):
+                fields = PURCHASE_FIELDS if key == "purchases" else BOX_FIELDS
+                encoded[key] = [_pick(item, fields) for item in value]
+            elif key == "sheets":
+                encoded[key] = _sheet_table(value, symbols)
+            elif key in PLANNING_KEYS:
+                encoded[key] = _plan_delta(value, lots)
+            else:
+                encoded[key] = value
+        return encoded
+
+
+def _pick(item: Optional[Dict[str, Any]], fields: List[str]) -> Dict[str, Any]:
+    """Keep only some fields of an entity."""
+    item = item or {}
+    return {field: item[field] for field in fields if field in item}
+
+
+def _sheet_table(sheets: List[Dict[str, Any]], symbols: Set[str]) -> str:
+    """
+    Encode the sheets as a CSV table. ECT values are separated by "|" and the
+    boxes column only lists the associated boxes of the purchases being processed.
+    """
+    rows = [",".join(SHEET_COLUMNS)]
+    for sheet in sheets:
+        rows.append(
+            ",".join(
+                [
+                    str(sheet.get("id") or sheet.get("_id") or ""),
+                    str(sheet.get("roll_width", "")),
+                    str(sheet.get("p1", "")),
+                    str(sheet.get("p2", "")),
+                    str(sheet.get("p3", "")),
+                    "|".join(str(ect) for ect in sheet.get("ect") or []),
+                    str(sheet.get("speed", "")),
+                    "|".join(box for box in sheet.get("boxes") or [] if box in symbols),
+                ]
+            )
+        )
+    return "\n".join(rows)
+
+
+def _plan_delta(program_planning: Dict[str, Any], lots: Set[str]) -> Dict[str, Any]:
+    """
+    Encode a program planning as the runs of the given purchases, keeping their
+    position in the week, and the last slot used in the week.
+    """
+    runs = (program_planning or {}).get("production_runs") or []
+    affected = []
+    for index, run in enumerate(runs):
+        if any(
+            box.get("arapack_lot") in lots for box in run.get("processed_boxes", [])
+        ):
+            affected.append(dict(run, index=index))
 
-        return prompt
+    last_run = max(
+        runs,
+        key=lambda run: (
+            str(run.get("end_date") or run.get("scheduled_date")),
+            str(run.get("end_time")),
+        ),
+        default=None,
+    )
+    return {
+        "week_of_year": (program_planning or {}).get("iso_week"),
+        "run_count": len(runs),
+        "last_slot": (
+            {
+                "scheduled_date": last_run.get("scheduled_date"),
+                "end_time": last_run.get("end_time"),
+                "end_date": last_run.get("end_date"),
+            }
+            if last_run
+            else None
+        ),
+        "affected_runs": affected,
+    }
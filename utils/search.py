@@ -0,0 +1,72 @@
+"""
+Prefix tokens used to search documents through a multikey index.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List
+
+# Characters splitting the words of a searched value
+WORD_SEPARATORS = re.compile(r"[^0-9a-z]+")
+
+# Longest prefix stored for each word, longer query words are truncated to it
+MAX_PREFIX_LENGTH = 24
+
+
+def tokenize(text: Any) -> List[str]:
+    """
+    Split a value into lowercase words.
+
+    :param text: The value to split.
+    :type text: Any
+    :return: The non-empty words, in order.
+    :rtype: List[str]
+    """
+    return [word for word in WORD_SEPARATORS.split(str(text).lower()) if word]
+
+
+def search_terms(values: Iterable[Any]) -> List[str]:
+    """
+    Get the search terms of a document: every prefix of every word of its values.
+
+    :param values: The searchable values of the document.
+    :type values: Iterable[Any]
+    :return: The sorted unique prefixes.
+    :rtype: List[str]
+    """
+    terms = set()
+    for value in values:
+        if value is None:
+            continue
+        for word in tokenize(value):
+            word = word[:MAX_PREFIX_LENGTH]
+            terms.update(word[:length] for length in range(1, len(word) + 1))
+    return sorted(terms)
+
+
+def search_filter(
+    query: str, terms_field: str = "search_terms", numeric_field: str = ""
+) -> Dict[str, Any]:
+    """
+    Create a filter matching the documents holding every word of a query as a prefix.
+
+    Numeric words also match the numeric field by equality, so it is compared
+    as a number and not as text.
+
+    :param query: The search query.
+    :type query: str
+    :param terms_field: The field holding the search terms.
+    :type terms_field: str
+    :param numeric_field: The numeric field matched by numeric words, if any.
+    :type numeric_field: str
+    :return: The MongoDB filter, empty if the query has no words.
+    :rtype: Dict[str, Any]
+    """
+    clauses = []
+    for word in dict.fromkeys(tokenize(query)):
+        clause = {terms_field: word[:MAX_PREFIX_LENGTH]}
+        if numeric_field and word.isdigit():
+            clause = {"$or": [clause, {numeric_field: int(word)}]}
+        clauses.append(clause)
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}